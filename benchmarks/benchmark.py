@@ -0,0 +1,91 @@
+"""
+Define Benchmark class and functions to summarize timings and compare them with a baseline.
+"""
+import json
+import time
+from typing import Any, Callable, Optional
+
+from src.image_generator.call_metrics import get_percentile
+
+
+def summarize(sample_list_in_seconds: list[float], number_of_items: int = 1) -> dict:
+    """
+    Summarize the per-call time of each sample. Each sample is the time of one call processing `number_of_items` items.
+    """
+    sorted_sample_list = sorted(sample_list_in_seconds)
+    p50 = get_percentile(sorted_sample_list, 50)
+    return {
+        "count": len(sorted_sample_list),
+        "min": sorted_sample_list[0],
+        "mean": sum(sorted_sample_list) / len(sorted_sample_list),
+        "p50": p50,
+        "p90": get_percentile(sorted_sample_list, 90),
+        "p99": get_percentile(sorted_sample_list, 99),
+        "max": sorted_sample_list[-1],
+        "items_per_second": number_of_items / p50 if p50 > 0 else None
+    }
+
+
+class Benchmark:
+    """
+    A named piece of work to time.
+    `setup` is called once and returns a context, `func` is called with the context for each sample, and `teardown` cleans up the context.
+    `number_of_items` is how many items one call of `func` processes, e.g. files or work items, for the throughput.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], setup: Optional[Callable[[], Any]] = None, teardown: Optional[Callable[[Any], None]] = None, repeat: int = 5, number_of_items: int = 1):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.teardown = teardown
+        self.repeat = repeat
+        self.number_of_items = number_of_items
+
+    def run(self) -> dict:
+        context = self.setup() if self.setup else None
+        try:
+            sample_list_in_seconds = []
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                self.func(context)
+                sample_list_in_seconds.append(time.perf_counter() - start)
+        finally:
+            if self.teardown:
+                self.teardown(context)
+        return summarize(sample_list_in_seconds, self.number_of_items)
+
+
+def compare_with_baseline(result_by_name: dict[str, dict], baseline_by_name: dict[str, dict], threshold: float) -> list[dict]:
+    """
+    Compare the p50 of each result with that of the baseline.
+    Returns a list of {"name", "p50", "baseline_p50", "ratio", "regression"}, where a regression is a p50 more than `threshold` (e.g. 0.2) slower.
+    Benchmarks which are not in the baseline are skipped.
+    """
+    comparison_list = []
+    for (name, result) in result_by_name.items():
+        baseline = baseline_by_name.get(name)
+        if not baseline or not baseline.get("p50"):
+            continue
+        ratio = result["p50"] / baseline["p50"]
+        comparison_list.append({
+            "name": name,
+            "p50": result["p50"],
+            "baseline_p50": baseline["p50"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold
+        })
+    return comparison_list
+
+
+def load_baseline(baseline_file_path: str) -> dict[str, dict]:
+    try:
+        with open(baseline_file_path, encoding="utf-8", mode="r") as f:
+            return json.load(f).get("benchmarks", {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(baseline_file_path: str, result_by_name: dict[str, dict], environment: dict) -> None:
+    with open(baseline_file_path, encoding="utf-8", mode="w") as f:
+        json.dump({"environment": environment, "benchmarks": result_by_name}, f, indent=2, sort_keys=True)
+        f.write("\n")
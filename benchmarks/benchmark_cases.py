@@ -0,0 +1,386 @@
+"""
+Define the benchmarks of the pipeline.
+"""
+from io import BytesIO
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from google.genai import types
+from loguru import logger
+from PIL import Image
+
+from benchmarks.benchmark import Benchmark
+from src.image_generator.hedged_request import HedgePolicy
+from src.image_generator.image_generator_for_gemini import FilePathBuilder, ImageGeneratorForGemini, LoggerSingletonForGeminiAPICall, add_gemini_api_call_log_sink, filter_log_message_for_gemini_api_call
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_file_index import InputFileIndex
+from src.image_generator.input_image_preprocessor import InputImagePreprocessor
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories, InputOutputFilePathSpecBuilderForSingleDirectory
+from src.image_generator.output_image_writer import OutputImageWriter
+from src.image_generator.result_cache import ResultCache
+from src.image_generator.run_planner import RunPlanner
+
+
+const_date_and_time_part = "20250101-000000"
+const_project_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _make_empty_files(dir_path: str, number_of_files: int, prefix: str) -> None:
+    os.makedirs(dir_path, exist_ok=True)
+    for i in range(number_of_files):
+        with open(os.path.join(dir_path, f"{prefix}_{i:06d}.png"), mode="wb"):
+            pass
+
+
+def _make_noise_image(size: int) -> Image.Image:
+    # Noise does not compress, so that encoding is not unrealistically cheap.
+    return Image.frombytes("RGB", (size, size), random.Random(size).randbytes(size * size * 3))
+
+
+def _make_single_directory_benchmark_list(number_of_files: int, repeat: int) -> list[Benchmark]:
+
+    def setup() -> str:
+        temp_dir = tempfile.mkdtemp(prefix="bench_spec_")
+        _make_empty_files(os.path.join(temp_dir, "source"), number_of_files, "source")
+        return temp_dir
+
+    def build(temp_dir: str) -> None:
+        InputOutputFilePathSpecBuilderForSingleDirectory().build(os.path.join(temp_dir, "source"), os.path.join(temp_dir, "output"), const_date_and_time_part)
+
+    def build_lazy_and_iterate(temp_dir: str) -> None:
+        spec = InputOutputFilePathSpecBuilderForSingleDirectory().build_lazy(os.path.join(temp_dir, "source"), os.path.join(temp_dir, "output"), const_date_and_time_part)
+        for _ in spec.iter_items():
+            pass
+
+    return [
+        Benchmark(f"spec_builder.single_directory.build.{number_of_files}", build, setup, shutil.rmtree, repeat, number_of_files),
+        Benchmark(f"spec_builder.single_directory.build_lazy.{number_of_files}", build_lazy_and_iterate, setup, shutil.rmtree, repeat, number_of_files)
+    ]
+
+
+def _make_pair_of_directories_benchmark_list(number_of_files_per_dir: int, repeat: int) -> list[Benchmark]:
+    number_of_items = number_of_files_per_dir * number_of_files_per_dir
+
+    def setup() -> str:
+        temp_dir = tempfile.mkdtemp(prefix="bench_spec_")
+        _make_empty_files(os.path.join(temp_dir, "source"), number_of_files_per_dir, "source")
+        _make_empty_files(os.path.join(temp_dir, "reference"), number_of_files_per_dir, "reference")
+        return temp_dir
+
+    def build(temp_dir: str) -> None:
+        InputOutputFilePathSpecBuilderForPairOfDirectories().build(os.path.join(temp_dir, "source"), os.path.join(temp_dir, "reference"), os.path.join(temp_dir, "output"), const_date_and_time_part)
+
+    def build_lazy_and_iterate(temp_dir: str) -> None:
+        spec = InputOutputFilePathSpecBuilderForPairOfDirectories().build_lazy(os.path.join(temp_dir, "source"), os.path.join(temp_dir, "reference"), os.path.join(temp_dir, "output"), const_date_and_time_part)
+        for _ in spec.iter_items():
+            pass
+
+    return [
+        Benchmark(f"spec_builder.pair_of_directories.build.{number_of_items}", build, setup, shutil.rmtree, repeat, number_of_items),
+        Benchmark(f"spec_builder.pair_of_directories.build_lazy.{number_of_items}", build_lazy_and_iterate, setup, shutil.rmtree, repeat, number_of_items)
+    ]
+
+
+def _make_input_file_index_rescan_benchmark(number_of_files: int, repeat: int) -> Benchmark:
+    """
+    Rescan a directory whose files are all in the index. Only the files are stat'ed. None of them is read.
+    """
+
+    def setup() -> str:
+        temp_dir = tempfile.mkdtemp(prefix="bench_index_")
+        source_dir = os.path.join(temp_dir, "source")
+        os.makedirs(source_dir)
+        buffer = BytesIO()
+        Image.new("RGB", (8, 8)).save(buffer, format="PNG")
+        for i in range(number_of_files):
+            with open(os.path.join(source_dir, f"source_{i:06d}.png"), mode="wb") as f:
+                f.write(buffer.getvalue())
+        input_file_index = InputFileIndex(os.path.join(temp_dir, "input_file_index.sqlite3"))
+        input_file_index.scan(source_dir)
+        input_file_index.save()
+        input_file_index.close()
+        return temp_dir
+
+    def rescan(temp_dir: str) -> None:
+        input_file_index = InputFileIndex(os.path.join(temp_dir, "input_file_index.sqlite3"))
+        input_file_index.scan(os.path.join(temp_dir, "source"))
+        input_file_index.close()
+
+    return Benchmark(f"input_file_index.rescan.{number_of_files}", rescan, setup, shutil.rmtree, repeat, number_of_files)
+
+
+def _make_run_planner_benchmark(number_of_files_per_dir: int, repeat: int) -> Benchmark:
+    """
+    Plan a pair of directories with preprocessing and an empty result cache. Each file is read once, and none is decoded.
+    """
+    number_of_items = number_of_files_per_dir * number_of_files_per_dir
+    generate_content_config = ImageGeneratorGenerateContentConfig()
+    generate_content_config.set_prompt("Make it blue.")
+
+    def setup() -> str:
+        temp_dir = tempfile.mkdtemp(prefix="bench_plan_")
+        for (dir_name, size) in [("source", 2048), ("reference", 512)]:
+            os.makedirs(os.path.join(temp_dir, dir_name))
+            buffer = BytesIO()
+            Image.new("RGB", (size, size)).save(buffer, format="PNG")
+            for i in range(number_of_files_per_dir):
+                with open(os.path.join(temp_dir, dir_name, f"{dir_name}_{i:06d}.png"), mode="wb") as f:
+                    # Distinct contents, as the planner looks results up by the digests of the files.
+                    f.write(buffer.getvalue() + i.to_bytes(4, "big"))
+        return temp_dir
+
+    def plan(temp_dir: str) -> None:
+        spec = InputOutputFilePathSpecBuilderForPairOfDirectories().build(os.path.join(temp_dir, "source"), os.path.join(temp_dir, "reference"), os.path.join(temp_dir, "output"), const_date_and_time_part)
+        result_cache = ResultCache(tempfile.mkdtemp(dir=temp_dir), 1024 * 1024 * 1024)
+        run_planner = RunPlanner("models/simulated-image-model", 10.0, max_in_flight=8, requests_per_minute=600)
+        run_planner.set_input_image_preprocessor(InputImagePreprocessor())
+        run_planner.set_result_cache(result_cache)
+        run_plan = run_planner.plan(spec, generate_content_config)
+        result_cache.close()
+        assert run_plan.number_of_calls == number_of_items
+
+    return Benchmark(f"run_planner.pair_of_directories.{number_of_items}", plan, setup, shutil.rmtree, repeat, number_of_items)
+
+
+def _make_file_path_builder_benchmark(repeat: int) -> Benchmark:
+    const_number_of_calls = 10000
+    file_path_builder = FilePathBuilder()
+    output_file_path_list = ["data/output/a-transferred-to-b-20250101-000000.png", "data/output/b-transferred-from-a-20250101-000000.png"]
+
+    def build(_) -> None:
+        for _ in range(const_number_of_calls):
+            file_path_builder.build_output_file_path_list_of_list(4, output_file_path_list)
+
+    return Benchmark("file_path_builder.build_output_file_path_list_of_list", build, None, None, repeat, const_number_of_calls)
+
+
+def _make_load_input_image_files_benchmark_list(size: int, repeat: int) -> list[Benchmark]:
+
+    def setup() -> str:
+        temp_dir = tempfile.mkdtemp(prefix="bench_load_")
+        _make_noise_image(size).save(os.path.join(temp_dir, "input.jpg"), quality=95)
+        return temp_dir
+
+    image_generator = ImageGeneratorForGemini()
+    image_generator_with_preprocessor = ImageGeneratorForGemini()
+    # Without the memo, so that every sample prepares the file.
+    image_generator_with_preprocessor.set_input_image_preprocessor(InputImagePreprocessor(max_memo_bytes=0))
+
+    def load(temp_dir: str) -> None:
+        (r, _) = image_generator._load_input_image_files([os.path.join(temp_dir, "input.jpg")])  # pylint: disable=protected-access
+        assert r
+
+    def load_and_preprocess(temp_dir: str) -> None:
+        (r, _) = image_generator_with_preprocessor._load_input_image_files([os.path.join(temp_dir, "input.jpg")])  # pylint: disable=protected-access
+        assert r
+
+    return [
+        Benchmark(f"load_input_image_files.{size}", load, setup, shutil.rmtree, repeat),
+        Benchmark(f"load_input_image_files.preprocessed.{size}", load_and_preprocess, setup, shutil.rmtree, repeat)
+    ]
+
+
+def _make_output_image_benchmark_list(size: int, repeat: int) -> list[Benchmark]:
+    output_image_writer = OutputImageWriter(max_workers=0)
+    bytesio = BytesIO()
+    _make_noise_image(size).save(bytesio, format="PNG")
+    png_bytes = bytesio.getvalue()
+
+    def decode(_) -> None:
+        with Image.open(BytesIO(png_bytes)) as image:
+            image.load()
+
+    benchmark_list = [Benchmark(f"output_image.decode.png.{size}", decode, None, None, repeat)]
+    for image_format in ["PNG", "JPEG", "WEBP"]:
+        benchmark_list.append(Benchmark(
+            f"output_image.encode.{image_format.lower()}.{size}",
+            lambda _, image_format=image_format: output_image_writer._encode(png_bytes, image_format),  # pylint: disable=protected-access
+            None, None, repeat
+        ))
+    return benchmark_list
+
+
+def _make_response_logging_benchmark_list(size_in_bytes: int, repeat: int) -> list[Benchmark]:
+    """
+    Log a response of 2 candidates with inline images of `size_in_bytes` as a call does, with a sink which takes DEBUG or INFO.
+    """
+    image_generator = ImageGeneratorForGemini()
+    part = types.Part(inline_data=types.Blob(mime_type="image/png", data=random.Random(size_in_bytes).randbytes(size_in_bytes)))
+    response = types.GenerateContentResponse(candidates=[
+        types.Candidate(index=i, content=types.Content(role="model", parts=[part]), finish_reason=types.FinishReason.STOP) for i in range(2)
+    ])
+    output_file_path_list = ["data/output/a-20250101-000000.png"]
+
+    def setup(level: str) -> int:
+        return logger.add(lambda _: None, level=level)
+
+    def run(_) -> None:
+        image_generator._show_response_info(response)  # pylint: disable=protected-access
+        image_generator._collect_images_to_write(response, output_file_path_list)  # pylint: disable=protected-access
+
+    return [
+        Benchmark(f"logging.response.{level.lower()}.{size_in_bytes}", run, lambda level=level: setup(level), logger.remove, repeat)
+        for level in ["DEBUG", "INFO"]
+    ]
+
+
+def _make_gemini_api_call_logging_benchmark_list(repeat: int) -> list[Benchmark]:
+    """
+    Write [GEMINI_API_CALL] lines to a sink in a temporary directory, enqueued as the application does and synchronously for comparison.
+    The time is what a request thread spends, and the sink is drained in the teardown.
+    """
+    const_number_of_calls = 1000
+    image_generator = ImageGeneratorForGemini()
+    config_for_generation = types.GenerateContentConfig(temperature=0.5, top_p=0.9)
+    input_file_path_list = ["data/input/a.png", "data/input/b.png"]
+    output_image_paths = ["data/output/a-transferred-to-b-20250101-000000.png"]
+
+    def setup(flag_enqueue: bool) -> tuple[str, int]:
+        temp_dir = tempfile.mkdtemp(prefix="bench_log_")
+        log_file_path = os.path.join(temp_dir, "gemini_api_call.log")
+        if flag_enqueue:
+            return (temp_dir, add_gemini_api_call_log_sink(log_file_path))
+        return (temp_dir, logger.add(log_file_path, rotation="10 MB", compression="zip", level="INFO", filter=filter_log_message_for_gemini_api_call))
+
+    def run(_) -> None:
+        for _ in range(const_number_of_calls):
+            image_generator._log_gemini_api_call("Make it blue.", config_for_generation, input_file_path_list, output_image_paths)  # pylint: disable=protected-access
+
+    def teardown(context: tuple[str, int]) -> None:
+        logger.remove(context[1])
+        shutil.rmtree(context[0])
+
+    return [
+        Benchmark(f"logging.gemini_api_call.{name}", run, lambda flag_enqueue=flag_enqueue: setup(flag_enqueue), teardown, repeat, const_number_of_calls)
+        for (name, flag_enqueue) in [("enqueued", True), ("synchronous", False)]
+    ]
+
+
+def _make_startup_benchmark_list(repeat: int) -> list[Benchmark]:
+    """
+    Run the commands which do not call a model in a new interpreter, so that an import of a heavy library at startup shows up.
+    """
+
+    def setup() -> str:
+        config_dir = tempfile.mkdtemp(prefix="bench_startup_")
+        with open(os.path.join(config_dir, "global_config.yaml"), mode="w", encoding="utf-8") as f:
+            f.write("global:\n    input_output_spec:\n        type: single_directory\n    backend: simulation\nsimulation:\n    seed: 0\n")
+        with open(os.path.join(config_dir, "generate_content_config.yaml"), mode="w", encoding="utf-8") as f:
+            f.write("default:\n    prompt: Make it blue.\n")
+        return config_dir
+
+    def run_command(config_dir: str, command: str) -> None:
+        subprocess.run([sys.executable, "-m", "src.image_generator.main", "--config-dir", config_dir, command], cwd=const_project_dir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return [
+        Benchmark(f"startup.{command}", lambda config_dir, command=command: run_command(config_dir, command), setup, shutil.rmtree, repeat)
+        for command in ["validate", "plan"]
+    ]
+
+
+def _make_end_to_end_benchmark(number_of_items: int, max_in_flight: int, repeat: int) -> Benchmark:
+    """
+    A run whose calls take 10 ms each, so that the calls overlap up to `max_in_flight`.
+    """
+    simulation_config = {
+        "seed": 0,
+        "latency": {"distribution": "constant", "median_in_seconds": 0.01},
+        "time_scale": 1.0,
+        "number_of_candidates": 1,
+        "image_size": [256, 256],
+        "rate_limits": {"models/simulated-image-model": {"requests_per_minute": 1000000}}
+    }
+    generate_content_config = ImageGeneratorGenerateContentConfig()
+    generate_content_config.set_prompt("Make it blue.")
+
+    def setup() -> str:
+        temp_dir = tempfile.mkdtemp(prefix="bench_e2e_")
+        os.makedirs(os.path.join(temp_dir, "source"))
+        for i in range(number_of_items):
+            Image.new("RGB", (64, 64), (i % 256, 0, 0)).save(os.path.join(temp_dir, "source", f"source_{i:06d}.png"))
+        return temp_dir
+
+    def run(temp_dir: str) -> None:
+        output_dir = tempfile.mkdtemp(dir=temp_dir)
+        spec: InputOutputFilePathSpec = InputOutputFilePathSpecBuilderForSingleDirectory().build(os.path.join(temp_dir, "source"), output_dir, const_date_and_time_part)
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_max_in_flight(max_in_flight)
+        image_generator.set_output_image_writer(OutputImageWriter(max_workers=2))
+        assert image_generator.do_generation(simulation_config, generate_content_config, spec)
+        image_generator.output_image_writer.close()
+        assert (image_generator.client.models.max_count_in_flight > 1) == (max_in_flight > 1), image_generator.client.models.max_count_in_flight
+
+    return Benchmark(f"end_to_end.simulation.{number_of_items}.max_in_flight_{max_in_flight}", run, setup, shutil.rmtree, repeat, number_of_items)
+
+
+def _make_hedging_benchmark_list(number_of_items: int, repeat: int) -> list[Benchmark]:
+    """
+    A run whose latencies have a long tail, i.e. lognormal with a median of 20 ms and sigma of 1, without and with hedging at p95.
+    """
+    simulation_config = {
+        "seed": 0,
+        "latency": {"distribution": "lognormal", "median_in_seconds": 0.02, "sigma": 1.0},
+        "time_scale": 1.0,
+        "number_of_candidates": 1,
+        "image_size": [64, 64],
+        "rate_limits": {"models/simulated-image-model": {"requests_per_minute": 1000000}}
+    }
+    generate_content_config = ImageGeneratorGenerateContentConfig()
+    generate_content_config.set_prompt("Make it blue.")
+
+    def setup() -> str:
+        temp_dir = tempfile.mkdtemp(prefix="bench_hedging_")
+        os.makedirs(os.path.join(temp_dir, "source"))
+        for i in range(number_of_items):
+            Image.new("RGB", (64, 64), (i % 256, 0, 0)).save(os.path.join(temp_dir, "source", f"source_{i:06d}.png"))
+        return temp_dir
+
+    def run(temp_dir: str, flag_hedging: bool) -> None:
+        output_dir = tempfile.mkdtemp(dir=temp_dir)
+        spec: InputOutputFilePathSpec = InputOutputFilePathSpecBuilderForSingleDirectory().build(os.path.join(temp_dir, "source"), output_dir, const_date_and_time_part)
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_max_in_flight(8)
+        if flag_hedging:
+            image_generator.set_hedge_policy(HedgePolicy(percentile=95, max_hedge_ratio=0.05, min_samples=20))
+        assert image_generator.do_generation(simulation_config, generate_content_config, spec)
+        image_generator.output_image_writer.close()
+
+    return [
+        Benchmark(f"hedging.simulation.{number_of_items}.{'on' if flag_hedging else 'off'}", lambda temp_dir, flag_hedging=flag_hedging: run(temp_dir, flag_hedging), setup, shutil.rmtree, repeat, number_of_items)
+        for flag_hedging in [False, True]
+    ]
+
+
+def get_benchmark_list(flag_quick: bool = False) -> list[Benchmark]:
+    """
+    Return all benchmarks. `flag_quick` uses the smaller sizes and fewer samples only.
+    """
+    repeat = 3 if flag_quick else 7
+    # The benchmarks build image generators. Keep them from adding the sink of ./logs/gemini_api_call.log.
+    LoggerSingletonForGeminiAPICall().init_logger(None)
+    benchmark_list = []
+    for number_of_files in [10000] if flag_quick else [10000, 100000]:
+        benchmark_list.extend(_make_single_directory_benchmark_list(number_of_files, repeat))
+        benchmark_list.append(_make_input_file_index_rescan_benchmark(number_of_files, repeat))
+    # 100 x 100 and 316 x 316, that is, 10k and about 100k work items.
+    for number_of_files_per_dir in [100] if flag_quick else [100, 316]:
+        benchmark_list.extend(_make_pair_of_directories_benchmark_list(number_of_files_per_dir, repeat))
+        benchmark_list.append(_make_run_planner_benchmark(number_of_files_per_dir, repeat))
+    benchmark_list.append(_make_file_path_builder_benchmark(repeat))
+    for size in [512, 1024] if flag_quick else [512, 1024, 2048]:
+        benchmark_list.extend(_make_load_input_image_files_benchmark_list(size, repeat))
+        benchmark_list.extend(_make_output_image_benchmark_list(size, repeat))
+    for size_in_bytes in [1024 * 1024] if flag_quick else [1024 * 1024, 8 * 1024 * 1024]:
+        benchmark_list.extend(_make_response_logging_benchmark_list(size_in_bytes, repeat))
+    benchmark_list.extend(_make_gemini_api_call_logging_benchmark_list(repeat))
+    benchmark_list.extend(_make_startup_benchmark_list(repeat))
+    for max_in_flight in [1, 8]:
+        benchmark_list.append(_make_end_to_end_benchmark(100 if flag_quick else 500, max_in_flight, repeat))
+    benchmark_list.extend(_make_hedging_benchmark_list(200, repeat))
+    return benchmark_list
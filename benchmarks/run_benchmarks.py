@@ -0,0 +1,80 @@
+"""
+Run the benchmarks, report their percentiles and compare them with the stored baseline.
+
+Usage:
+    python -m benchmarks.run_benchmarks [--quick] [--filter SUBSTRING] [--update-baseline]
+
+Exits with 1 if a benchmark regresses beyond the threshold.
+"""
+import argparse
+import os
+import platform
+import sys
+from typing import Optional
+
+from loguru import logger
+
+from benchmarks.benchmark import compare_with_baseline, load_baseline, save_baseline
+from benchmarks.benchmark_cases import get_benchmark_list
+
+
+const_default_baseline_file_path = os.path.join(os.path.dirname(__file__), "baselines", "baseline.json")
+
+
+def _format_seconds(value: float) -> str:
+    if value < 1e-3:
+        return f"{value * 1e6:.1f} us"
+    if value < 1:
+        return f"{value * 1e3:.2f} ms"
+    return f"{value:.3f} s"
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the benchmarks of image-generator.")
+    parser.add_argument('--quick', action='store_true', help="Run the smaller sizes with fewer samples.")
+    parser.add_argument('--filter', metavar='SUBSTRING', help="Run only the benchmarks whose name contains SUBSTRING.")
+    parser.add_argument('--baseline', metavar='FILE', default=const_default_baseline_file_path, help="The JSON baseline to compare with.")
+    parser.add_argument('--update-baseline', action='store_true', help="Write the results to the baseline file.")
+    parser.add_argument('--threshold', type=float, default=0.2, help="The relative p50 slowdown which counts as a regression. Default: 0.2")
+    parser.add_argument('--log-level', default="WARNING", help="The log level of the code under test. Default: WARNING")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    options = parse_args(argv)
+    logger.remove()
+    logger.add(sys.stderr, level=options.log_level)
+
+    result_by_name = {}
+    for benchmark in get_benchmark_list(options.quick):
+        if options.filter and options.filter not in benchmark.name:
+            continue
+        result = benchmark.run()
+        result_by_name[benchmark.name] = result
+        throughput = f", {result['items_per_second']:.0f} items/s" if benchmark.number_of_items > 1 else ""
+        print(f"{benchmark.name}: p50 {_format_seconds(result['p50'])}, p90 {_format_seconds(result['p90'])}, p99 {_format_seconds(result['p99'])}, min {_format_seconds(result['min'])}{throughput}", flush=True)
+
+    if options.update_baseline:
+        baseline_by_name = load_baseline(options.baseline)
+        baseline_by_name.update(result_by_name)
+        os.makedirs(os.path.dirname(os.path.abspath(options.baseline)), exist_ok=True)
+        save_baseline(options.baseline, baseline_by_name, {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system()})
+        print(f"Updated {options.baseline}.")
+        return 0
+
+    comparison_list = compare_with_baseline(result_by_name, load_baseline(options.baseline), options.threshold)
+    if not comparison_list:
+        print(f"No baseline to compare with in {options.baseline}.")
+        return 0
+    count_regressions = 0
+    for comparison in comparison_list:
+        flag = "REGRESSION" if comparison["regression"] else "ok"
+        print(f"{flag:>10} {comparison['name']}: {comparison['ratio']:.2f}x of baseline ({_format_seconds(comparison['p50'])} vs {_format_seconds(comparison['baseline_p50'])})")
+        if comparison["regression"]:
+            count_regressions += 1
+    print(f"{count_regressions} regression(s) among {len(comparison_list)} benchmark(s).")
+    return 1 if count_regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Define BatchDispatcher class.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import heapq
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from loguru import logger
+
+from src.image_generator.circuit_breaker import CircuitBreaker
+from src.image_generator.generation_result import GenerationResult
+from src.image_generator.retry_policy import RetryPolicy
+
+
+class GenerationProgress:
+    """
+    Keep the success/failure accounting of one batch.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.count = 0
+        self.count_success = 0
+        self.count_failure = 0
+        self.count_cancelled = 0
+        self.count_retries = 0
+        self.lock = threading.Lock()
+
+    def record(self, result: "bool | GenerationResult") -> None:
+        with self.lock:
+            self.count += 1
+            if result:
+                self.count_success += 1
+            else:
+                self.count_failure += 1
+
+    def record_retry(self) -> None:
+        with self.lock:
+            self.count_retries += 1
+
+    def record_cancelled(self, number_of_items: int) -> None:
+        with self.lock:
+            self.count_cancelled += number_of_items
+
+    def show_progress(self) -> None:
+        logger.info(f"Among: {self.total} So far... total requests: {self.count}, Success: {self.count_success}, Failure: {self.count_failure}, Retries: {self.count_retries}")
+
+
+class BatchDispatcher:
+    """
+    Run a function over items with at most `max_in_flight` calls at a time.
+    `max_in_flight` of 1 keeps the original serial behavior.
+    """
+
+    def __init__(self, max_in_flight: int = 1):
+        self.max_in_flight = max(1, max_in_flight)
+        self.cancel_event = threading.Event()
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+
+    def set_circuit_breaker(self, circuit_breaker: Optional[CircuitBreaker]) -> None:
+        """
+        Hold back new and retried items while `circuit_breaker` is open.
+        """
+        self.circuit_breaker = circuit_breaker
+
+    def cancel(self) -> None:
+        """
+        Stop dispatching new items. Calls already in flight run to completion.
+        """
+        self.cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def wait_unless_cancelled(self, seconds: float) -> bool:
+        """
+        Sleep for `seconds` unless the run is cancelled in the meantime.
+        Returns True if the run has been cancelled.
+        """
+        return self.cancel_event.wait(seconds)
+
+    def run(self, item_list: Iterable[Any], func: Callable[[Any], "bool | GenerationResult"], total: int, retry_policy: Optional[RetryPolicy] = None, on_result: Optional[Callable[[Any, GenerationResult], None]] = None) -> GenerationProgress:
+        """
+        Call `func` for each item of `item_list` and return the progress.
+        Items are pulled lazily so that at most `max_in_flight` of them are pending.
+        If `retry_policy` allows it, a failed item is re-queued with a delay instead of blocking a worker.
+        `on_result` is called with the item and its result record after every attempt.
+        """
+        progress = GenerationProgress(total)
+        item_iterator = iter(item_list)
+        in_flight: dict[Future, tuple[Any, int]] = {}
+        # A heap of (time to be ready, sequence number, item, attempt count).
+        retry_heap: list[tuple[float, int, Any, int]] = []
+        sequence_number = 0
+        flag_exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="generation") as executor:
+            try:
+                while True:
+                    while not self.is_cancelled() and len(in_flight) < self.max_in_flight and self._get_time_until_allowed() <= 0:
+                        if retry_heap and retry_heap[0][0] <= time.monotonic():
+                            (ready_time, _, item, attempt_count) = heapq.heappop(retry_heap)
+                        elif not flag_exhausted:
+                            try:
+                                item = next(item_iterator)
+                            except StopIteration:
+                                flag_exhausted = True
+                                continue
+                            attempt_count = 1
+                            ready_time = time.monotonic()
+                        else:
+                            break
+                        if self.circuit_breaker is not None:
+                            self.circuit_breaker.on_dispatch()
+                        in_flight[executor.submit(self._call, func, item, ready_time)] = (item, attempt_count)
+                    if self.is_cancelled():
+                        retry_heap.clear()
+                    if not in_flight and not retry_heap and (flag_exhausted or self.is_cancelled()):
+                        break
+                    timeout = None
+                    if retry_heap:
+                        timeout = max(0.0, retry_heap[0][0] - time.monotonic())
+                    time_until_allowed = self._get_time_until_allowed()
+                    if time_until_allowed > 0 and (retry_heap or not flag_exhausted):
+                        # Nothing is dispatched before the circuit allows it. A new item can go then, a retried one when it is also ready.
+                        timeout = time_until_allowed if timeout is None or not flag_exhausted else max(timeout, time_until_allowed)
+                    if not in_flight:
+                        self.wait_unless_cancelled(timeout)
+                        continue
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        (item, attempt_count) = in_flight.pop(future)
+                        result = self._get_result(future, attempt_count)
+                        if self.circuit_breaker is not None:
+                            # A failure which is not retryable, e.g. a bad request, is an answer of a working backend.
+                            self.circuit_breaker.record(not result.success and result.retryable)
+                        if on_result is not None:
+                            on_result(item, result)
+                        if retry_policy is not None and not self.is_cancelled() and retry_policy.should_retry(result):
+                            delay = retry_policy.get_delay_in_seconds(result)
+                            logger.info(f"Re-queueing a failed item (attempt {attempt_count}) to retry in {delay:.2f} seconds: {result.error}")
+                            sequence_number += 1
+                            heapq.heappush(retry_heap, (time.monotonic() + delay, sequence_number, item, attempt_count + 1))
+                            progress.record_retry()
+                            continue
+                        logger.info(f"Image generation result: {result}")
+                        progress.record(result)
+                        progress.show_progress()
+            except KeyboardInterrupt:
+                logger.warning("Interrupted. Cancelling the remaining requests...")
+                self.cancel()
+                retry_heap.clear()
+                for future in in_flight:
+                    future.cancel()
+                done, _ = wait(in_flight)
+                for future in done:
+                    if not future.cancelled():
+                        (item, attempt_count) = in_flight[future]
+                        result = self._get_result(future, attempt_count)
+                        if on_result is not None:
+                            on_result(item, result)
+                        progress.record(result)
+        if self.is_cancelled():
+            progress.record_cancelled(progress.total - progress.count)
+            logger.warning(f"Cancelled. {progress.count_cancelled} request(s) were not completed.")
+        return progress
+
+    def _get_time_until_allowed(self) -> float:
+        return self.circuit_breaker.get_time_until_allowed() if self.circuit_breaker is not None else 0.0
+
+    def _call(self, func: Callable[[Any], "bool | GenerationResult"], item: Any, ready_time: float) -> tuple["bool | GenerationResult", float]:
+        queue_wait_in_seconds = time.monotonic() - ready_time
+        return (func(item), queue_wait_in_seconds)
+
+    def _get_result(self, future: Future, attempt_count: int) -> GenerationResult:
+        queue_wait_in_seconds = None
+        try:
+            (result, queue_wait_in_seconds) = future.result()
+            result = GenerationResult.from_bool(result)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Unexpected error during generation: {e}")
+            result = GenerationResult(False, error=str(e))
+        result.attempt_count = attempt_count
+        result.queue_wait_in_seconds = queue_wait_in_seconds
+        return result
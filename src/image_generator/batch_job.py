@@ -0,0 +1,161 @@
+"""
+Define classes to export an InputOutputFilePathSpec to a JSONL batch request file and to import a JSONL batch result file.
+"""
+import base64
+import json
+import mimetypes
+from typing import Callable, Optional
+
+from google.genai import types
+from loguru import logger
+from pydantic import ValidationError
+
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+
+
+def get_manifest_file_path(request_file_path: str) -> str:
+    return f"{request_file_path}.manifest.jsonl"
+
+
+def get_batch_item_key(index: int) -> str:
+    return f"item-{index:08d}"
+
+
+class BatchRequestFileBuilder:
+    """
+    Write one GenerateContentRequest per work item to a JSONL batch request file.
+    Each line is {"key": ..., "request": {...}}. A manifest next to it maps each key to the output file paths.
+    Input images are inlined as base64, or referenced by `fileData` if `inline` is False.
+    A reference needs an input referencer which makes the file readable by the batch service, e.g. an upload with the Files API.
+    """
+
+    def __init__(self, model_name: str, config_for_generation: types.GenerateContentConfig, prompt: str, inline: bool = True):
+        self.model_name = model_name
+        self.config_for_generation = config_for_generation
+        self.prompt = prompt
+        self.inline = inline
+        # (input file path) -> (data, mime type). The default reads the file as is.
+        self.input_loader: Callable[[str], tuple[bytes, str]] = self._read_input_file
+        # (input file path) -> (file URI, mime type). Required if `inline` is False.
+        self.input_referencer: Optional[Callable[[str], tuple[str, str]]] = None
+
+    def set_input_loader(self, input_loader: Callable[[str], tuple[bytes, str]]) -> None:
+        self.input_loader = input_loader
+
+    def set_input_referencer(self, input_referencer: Callable[[str], tuple[str, str]]) -> None:
+        self.input_referencer = input_referencer
+
+    def _read_input_file(self, input_file_path: str) -> tuple[bytes, str]:
+        with open(input_file_path, mode="rb") as f:
+            data = f.read()
+        return (data, mimetypes.guess_type(input_file_path)[0] or "application/octet-stream")
+
+    def _build_request(self, input_file_path_list: list[str]) -> dict:
+        parts: list[dict] = [{"text": self.prompt}]
+        for input_file_path in input_file_path_list:
+            if self.inline:
+                (data, mime_type) = self.input_loader(input_file_path)
+                parts.append({"inlineData": {"mimeType": mime_type, "data": base64.b64encode(data).decode("ascii")}})
+            else:
+                if self.input_referencer is None:
+                    raise ValueError("Referencing input images needs an input referencer, e.g. an upload with the Files API.")
+                (file_uri, mime_type) = self.input_referencer(input_file_path)
+                parts.append({"fileData": {"mimeType": mime_type, "fileUri": file_uri}})
+        generation_config = self.config_for_generation.model_dump(mode="json", exclude_none=True, by_alias=True)
+        # In a request, safety settings are next to the generation config, not in it.
+        safety_settings = generation_config.pop("safetySettings", None)
+        request = {"model": self.model_name, "contents": [{"role": "user", "parts": parts}], "generationConfig": generation_config}
+        if safety_settings:
+            request["safetySettings"] = safety_settings
+        return request
+
+    def build(self, input_output_file_path_spec: InputOutputFilePathSpec, request_file_path: str) -> int:
+        """
+        Write the request file and its manifest. Returns the number of requests.
+        """
+        count = 0
+        with open(request_file_path, encoding="utf-8", mode="w") as request_file, open(get_manifest_file_path(request_file_path), encoding="utf-8", mode="w") as manifest_file:
+            for (index, item) in enumerate(input_output_file_path_spec.iter_items()):
+                key = get_batch_item_key(index)
+                request = self._build_request(list(item.input_file_path_list))
+                request_file.write(json.dumps({"key": key, "request": request}) + "\n")
+                manifest_file.write(json.dumps({
+                    "key": key,
+                    "input_file_path_list": list(item.input_file_path_list),
+                    "output_file_path_list": list(item.output_file_path_list)
+                }, ensure_ascii=False) + "\n")
+                count += 1
+        logger.info(f"Wrote {count} request(s) to {request_file_path}.")
+        return count
+
+
+class BatchResultFileIngester:
+    """
+    Read a JSONL batch result file and hand the images of each response to `write_images`.
+    Each line is {"key": ..., "response": {...}} or {"key": ..., "error": {...}}.
+    `write_images` gets the response and the output file paths of the key, and returns the number of images written.
+    """
+
+    def __init__(self, write_images: Callable[[types.GenerateContentResponse, list[str]], int]):
+        self.write_images = write_images
+        self.count_success = 0
+        self.count_failure = 0
+
+    def _load_manifest(self, manifest_file_path: str) -> dict[str, list[str]]:
+        output_file_path_list_by_key = {}
+        with open(manifest_file_path, encoding="utf-8", mode="r") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    output_file_path_list_by_key[record["key"]] = record["output_file_path_list"]
+        return output_file_path_list_by_key
+
+    def ingest(self, result_file_path: str, manifest_file_path: str) -> bool:
+        """
+        Returns False if the files cannot be read. Failed items are counted and logged.
+        """
+        try:
+            output_file_path_list_by_key = self._load_manifest(manifest_file_path)
+        except (OSError, json.JSONDecodeError, KeyError) as e:
+            logger.error(f"Failed to read the manifest {manifest_file_path}: {e}")
+            return False
+        try:
+            with open(result_file_path, encoding="utf-8", mode="r") as f:
+                for line in f:
+                    if line.strip():
+                        self._ingest_line(line, output_file_path_list_by_key)
+        except OSError as e:
+            logger.error(f"Failed to read the result file {result_file_path}: {e}")
+            return False
+        logger.info(f"Ingested {result_file_path}. Success: {self.count_success}, Failure: {self.count_failure}")
+        return True
+
+    def _ingest_line(self, line: str, output_file_path_list_by_key: dict[str, list[str]]) -> None:
+        try:
+            record = json.loads(line)
+            key = record.get("key")
+            flag_known_key = key in output_file_path_list_by_key
+        except (json.JSONDecodeError, AttributeError, TypeError) as e:
+            # AttributeError if the line is not an object, and TypeError if its key is not a string.
+            logger.error(f"Broken line in the result file: {e}")
+            self.count_failure += 1
+            return
+        if not flag_known_key:
+            logger.error(f"Unknown key in the result file: {key}")
+            self.count_failure += 1
+            return
+        if "error" in record or "response" not in record:
+            logger.error(f"Batch request {key} failed: {record.get('error')}")
+            self.count_failure += 1
+            return
+        try:
+            response = types.GenerateContentResponse.model_validate(record["response"])
+        except ValidationError as e:
+            logger.error(f"Invalid response of {key} in the result file: {e}")
+            self.count_failure += 1
+            return
+        if self.write_images(response, output_file_path_list_by_key[key]) > 0:
+            self.count_success += 1
+        else:
+            logger.error(f"No image in the response of {key}.")
+            self.count_failure += 1
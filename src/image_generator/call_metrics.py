@@ -0,0 +1,223 @@
+"""
+Define CallMetrics and CallMetricsRecorder classes.
+"""
+import json
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+
+class CallMetricsEnum:
+    const_outcome_success = "success"
+    const_outcome_cache_hit = "cache_hit"
+    const_outcome_throttled = "throttled"
+    const_outcome_failure = "failure"
+
+
+def get_percentile(sorted_value_list: list[float], percentile: float) -> float:
+    """
+    Return the nearest-rank percentile of a sorted, non-empty list. `percentile` is in [0, 100].
+    """
+    if not sorted_value_list:
+        raise ValueError("No values.")
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_value_list)))
+    return sorted_value_list[min(rank, len(sorted_value_list)) - 1]
+
+
+def load_latency_percentile(metrics_dir: str, percentile: float, max_number_of_files: int = 5) -> Optional[float]:
+    """
+    Return the percentile of the latencies of the successful calls in the latest `max_number_of_files` metrics files of `metrics_dir`,
+    or None if there is no such call.
+    """
+    try:
+        file_path_list = [os.path.join(metrics_dir, x) for x in os.listdir(metrics_dir) if x.endswith(".jsonl")]
+    except OSError:
+        return None
+    file_path_list.sort(key=os.path.getmtime, reverse=True)
+    latency_list = []
+    for file_path in file_path_list[:max_number_of_files]:
+        try:
+            with open(file_path, encoding="utf-8", mode="r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record.get("outcome") == CallMetricsEnum.const_outcome_success and record.get("latency_in_seconds") is not None:
+                        latency_list.append(record["latency_in_seconds"])
+        except OSError as e:
+            logger.warning(f"Failed to read {file_path}: {e}")
+    if not latency_list:
+        return None
+    return get_percentile(sorted(latency_list), percentile)
+
+
+class CallMetrics:
+    """
+    The metrics of one attempt of one work item. A field is None if the attempt did not get that far.
+    """
+
+    def __init__(self, item_key: str):
+        self.item_key = item_key
+        self.started_at = time.time()
+        self.attempt_count = 1
+        self.outcome: Optional[str] = None
+        self.error: Optional[str] = None
+        # Between the item being ready to run and a worker picking it up.
+        self.queue_wait_in_seconds: Optional[float] = None
+        # Loading, decoding and preprocessing the input images.
+        self.decode_time_in_seconds: Optional[float] = None
+        self.rate_limit_wait_in_seconds: Optional[float] = None
+        self.latency_in_seconds: Optional[float] = None
+        # Between sending the request and the first output image being ready to write. Less than the latency when streaming.
+        self.time_to_first_image_in_seconds: Optional[float] = None
+        self.input_bytes: Optional[int] = None
+        self.response_bytes: Optional[int] = None
+        self.number_of_candidates: Optional[int] = None
+        self.prompt_token_count: Optional[int] = None
+        self.candidates_token_count: Optional[int] = None
+        self.total_token_count: Optional[int] = None
+        # Encoding and writing the output images, filled in by OutputImageWriter.
+        self.encode_time_in_seconds: Optional[float] = None
+        self.write_time_in_seconds: Optional[float] = None
+        # Bytes written to the output paths, not counting hardlinks and reflinks.
+        self.output_bytes: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def add_output_times(self, encode_time_in_seconds: float, write_time_in_seconds: float, output_bytes: int = 0) -> None:
+        with self.lock:
+            self.encode_time_in_seconds = (self.encode_time_in_seconds or 0.0) + encode_time_in_seconds
+            self.write_time_in_seconds = (self.write_time_in_seconds or 0.0) + write_time_in_seconds
+            self.output_bytes = (self.output_bytes or 0) + output_bytes
+
+    def to_dict(self) -> dict:
+        return {
+            "item": self.item_key,
+            "started_at": self.started_at,
+            "attempt_count": self.attempt_count,
+            "outcome": self.outcome,
+            "error": self.error,
+            "queue_wait_in_seconds": self.queue_wait_in_seconds,
+            "decode_time_in_seconds": self.decode_time_in_seconds,
+            "rate_limit_wait_in_seconds": self.rate_limit_wait_in_seconds,
+            "latency_in_seconds": self.latency_in_seconds,
+            "time_to_first_image_in_seconds": self.time_to_first_image_in_seconds,
+            "input_bytes": self.input_bytes,
+            "response_bytes": self.response_bytes,
+            "number_of_candidates": self.number_of_candidates,
+            "prompt_token_count": self.prompt_token_count,
+            "candidates_token_count": self.candidates_token_count,
+            "total_token_count": self.total_token_count,
+            "encode_time_in_seconds": self.encode_time_in_seconds,
+            "write_time_in_seconds": self.write_time_in_seconds,
+            "output_bytes": self.output_bytes
+        }
+
+
+class CallMetricsRecorder:
+    """
+    Append the metrics of each call to a JSONL file, and summarize them at the end of a run.
+    The summary is logged with p50/p95/p99 and exported in the Prometheus textfile format, e.g. for the node_exporter textfile collector.
+    """
+
+    # (field, Prometheus metric name, help text)
+    const_summary_field_list = [
+        ("queue_wait_in_seconds", "image_generator_queue_wait_seconds", "Time between an item being ready and a worker picking it up."),
+        ("decode_time_in_seconds", "image_generator_input_decode_seconds", "Time to load, decode and preprocess the input images of a call."),
+        ("rate_limit_wait_in_seconds", "image_generator_rate_limit_wait_seconds", "Time spent waiting for the rate limiter."),
+        ("latency_in_seconds", "image_generator_request_latency_seconds", "Latency of a generate_content call."),
+        ("time_to_first_image_in_seconds", "image_generator_time_to_first_image_seconds", "Time between sending a request and its first output image."),
+        ("encode_time_in_seconds", "image_generator_output_encode_seconds", "Time to encode the output images of a call."),
+        ("write_time_in_seconds", "image_generator_output_write_seconds", "Time to write the output images of a call."),
+        ("input_bytes", "image_generator_input_bytes", "Bytes of input images uploaded in a call."),
+        ("response_bytes", "image_generator_response_bytes", "Bytes of inline data in a response."),
+        ("output_bytes", "image_generator_output_bytes", "Bytes of output files written for a call."),
+        ("total_token_count", "image_generator_tokens", "Total tokens of a call by usage_metadata.")
+    ]
+    const_token_field_list = ["prompt_token_count", "candidates_token_count", "total_token_count"]
+
+    def __init__(self, metrics_file_path: Optional[str] = None, prometheus_file_path: Optional[str] = None):
+        self.metrics_file_path = metrics_file_path
+        self.prometheus_file_path = prometheus_file_path
+        self.value_list_by_field: dict[str, list[float]] = {field: [] for (field, _, _) in self.const_summary_field_list}
+        self.count_by_outcome: dict[str, int] = {}
+        self.token_total_by_field: dict[str, int] = {field: 0 for field in self.const_token_field_list}
+        self.lock = threading.Lock()
+        self.file = None
+        if metrics_file_path:
+            os.makedirs(os.path.dirname(os.path.abspath(metrics_file_path)), exist_ok=True)
+            self.file = open(metrics_file_path, encoding="utf-8", mode="a")
+
+    def record(self, call_metrics: CallMetrics) -> None:
+        record = call_metrics.to_dict()
+        with self.lock:
+            self.count_by_outcome[call_metrics.outcome] = self.count_by_outcome.get(call_metrics.outcome, 0) + 1
+            for field in self.value_list_by_field:
+                if record[field] is not None:
+                    self.value_list_by_field[field].append(record[field])
+            for field in self.const_token_field_list:
+                self.token_total_by_field[field] += record[field] or 0
+            if self.file:
+                self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.file.flush()
+
+    def get_summary(self) -> dict[str, dict[str, float]]:
+        """
+        Return {field: {"count", "sum", "p50", "p95", "p99"}} of each field which has values.
+        """
+        summary = {}
+        with self.lock:
+            for (field, value_list) in self.value_list_by_field.items():
+                if not value_list:
+                    continue
+                sorted_value_list = sorted(value_list)
+                summary[field] = {
+                    "count": len(sorted_value_list),
+                    "sum": sum(sorted_value_list),
+                    "p50": get_percentile(sorted_value_list, 50),
+                    "p95": get_percentile(sorted_value_list, 95),
+                    "p99": get_percentile(sorted_value_list, 99)
+                }
+        return summary
+
+    def show_summary(self) -> None:
+        logger.info(f"[CallMetrics] Calls by outcome: {self.count_by_outcome}, Tokens: {self.token_total_by_field}")
+        for (field, values) in self.get_summary().items():
+            logger.info(f"[CallMetrics] {field}: p50 {values['p50']:.3f}, p95 {values['p95']:.3f}, p99 {values['p99']:.3f} (n={values['count']})")
+
+    def write_prometheus_textfile(self) -> None:
+        if not self.prometheus_file_path:
+            return
+        summary = self.get_summary()
+        line_list = []
+        for (field, metric_name, help_text) in self.const_summary_field_list:
+            if field not in summary:
+                continue
+            line_list.append(f"# HELP {metric_name} {help_text}")
+            line_list.append(f"# TYPE {metric_name} summary")
+            for quantile in ["p50", "p95", "p99"]:
+                line_list.append(f"{metric_name}{{quantile=\"0.{quantile[1:]}\"}} {summary[field][quantile]}")
+            line_list.append(f"{metric_name}_sum {summary[field]['sum']}")
+            line_list.append(f"{metric_name}_count {summary[field]['count']}")
+        line_list.append("# HELP image_generator_calls_total Calls by outcome.")
+        line_list.append("# TYPE image_generator_calls_total counter")
+        for (outcome, count) in sorted(self.count_by_outcome.items(), key=lambda x: str(x[0])):
+            line_list.append(f"image_generator_calls_total{{outcome=\"{outcome}\"}} {count}")
+        line_list.append("# HELP image_generator_tokens_total Tokens by usage_metadata.")
+        line_list.append("# TYPE image_generator_tokens_total counter")
+        for (field, total) in self.token_total_by_field.items():
+            line_list.append(f"image_generator_tokens_total{{kind=\"{field.removesuffix('_token_count')}\"}} {total}")
+        os.makedirs(os.path.dirname(os.path.abspath(self.prometheus_file_path)), exist_ok=True)
+        # Imported here, since the output image writer imports PIL, which `validate` does not need.
+        from src.image_generator.output_image_writer import write_file_atomically  # pylint: disable=import-outside-toplevel
+        write_file_atomically(self.prometheus_file_path, ("\n".join(line_list) + "\n").encode("utf-8"))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
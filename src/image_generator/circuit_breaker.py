@@ -0,0 +1,85 @@
+"""
+Define CircuitBreaker class.
+"""
+from collections import deque
+import threading
+import time
+from typing import Callable
+
+from loguru import logger
+
+
+class CircuitBreakerEnum:
+    const_state_closed = "closed"
+    const_state_open = "open"
+    const_state_half_open = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Pause dispatch while the backend fails.
+    The circuit opens when at least `failure_rate_threshold` of the last `window_size` requests have failed with a backend error,
+    e.g. a server error, throttling or a timeout, once there are `min_requests` of them. Other failures, e.g. a bad request, count as successes,
+    since the backend has answered.
+    While the circuit is open, no request is sent. After `open_in_seconds`, one request is sent as a probe.
+    Its success closes the circuit, and its failure opens it again.
+    """
+
+    def __init__(self, window_size: int = 20, min_requests: int = 10, failure_rate_threshold: float = 0.5, open_in_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.min_requests = max(1, min_requests)
+        self.failure_rate_threshold = failure_rate_threshold
+        self.open_in_seconds = open_in_seconds
+        self.clock = clock
+        self.outcome_list: deque[bool] = deque(maxlen=max(self.min_requests, window_size))
+        self.state = CircuitBreakerEnum.const_state_closed
+        self.opened_at = 0.0
+        self.flag_probe_in_flight = False
+        self.count_openings = 0
+        self.lock = threading.Lock()
+
+    def get_time_until_allowed(self) -> float:
+        """
+        Return 0 if a request may be sent now, or how long to wait before asking again.
+        """
+        with self.lock:
+            if self.state == CircuitBreakerEnum.const_state_closed:
+                return 0.0
+            if self.state == CircuitBreakerEnum.const_state_open:
+                time_until_half_open = self.opened_at + self.open_in_seconds - self.clock()
+                if time_until_half_open > 0:
+                    return time_until_half_open
+                self.state = CircuitBreakerEnum.const_state_half_open
+                logger.info("[CircuitBreaker] Half-open. Sending a probe.")
+            return self.open_in_seconds if self.flag_probe_in_flight else 0.0
+
+    def on_dispatch(self) -> None:
+        with self.lock:
+            if self.state == CircuitBreakerEnum.const_state_half_open:
+                self.flag_probe_in_flight = True
+
+    def record(self, flag_failure: bool) -> None:
+        with self.lock:
+            if self.state == CircuitBreakerEnum.const_state_half_open:
+                # The first result decides, be it that of the probe or of a request sent before the circuit opened.
+                self.flag_probe_in_flight = False
+                if flag_failure:
+                    self._open()
+                else:
+                    self.state = CircuitBreakerEnum.const_state_closed
+                    self.outcome_list.clear()
+                    logger.info("[CircuitBreaker] Closed. Resuming dispatch.")
+                return
+            self.outcome_list.append(flag_failure)
+            if self.state == CircuitBreakerEnum.const_state_closed and len(self.outcome_list) >= self.min_requests:
+                failure_rate = sum(self.outcome_list) / len(self.outcome_list)
+                if failure_rate >= self.failure_rate_threshold:
+                    self._open()
+
+    def _open(self) -> None:
+        self.state = CircuitBreakerEnum.const_state_open
+        self.opened_at = self.clock()
+        self.count_openings += 1
+        logger.warning(f"[CircuitBreaker] Open. Pausing dispatch for {self.open_in_seconds} seconds.")
+
+    def show_stats(self) -> None:
+        logger.info(f"[CircuitBreaker] State: {self.state}, Openings: {self.count_openings}")
@@ -0,0 +1,129 @@
+"""
+Define ClientPool class.
+"""
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from src.image_generator.rate_limiter import AdaptiveRateLimiter
+
+
+class PooledClient:
+    """
+    A client of one API key or project with its own rate budget.
+    """
+
+    def __init__(self, name: str, client: Any, rate_limiter: AdaptiveRateLimiter):
+        self.name = name
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.count_requests = 0
+        self.count_success = 0
+        self.count_throttled = 0
+        self.count_auth_errors = 0
+        self.count_ejections = 0
+        self.count_consecutive_errors = 0
+        self.ejected_until = 0.0
+
+
+class ClientPool:
+    """
+    Route each request to the client with the most headroom in its rate budget.
+    A client is ejected for `ejection_in_seconds` after `eject_after_consecutive_errors` throttling or authentication errors in a row,
+    unless it is the only one.
+    If every client is ejected or out of budget, `acquire` waits for the first one to become available.
+    """
+
+    def __init__(self, eject_after_consecutive_errors: int = 3, ejection_in_seconds: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.eject_after_consecutive_errors = max(1, eject_after_consecutive_errors)
+        self.ejection_in_seconds = ejection_in_seconds
+        self.clock = clock
+        self.pooled_client_list: list[PooledClient] = []
+        self.started_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def add(self, name: str, client: Any, rate_limiter: AdaptiveRateLimiter) -> None:
+        self.pooled_client_list.append(PooledClient(name, client, rate_limiter))
+
+    def __len__(self) -> int:
+        return len(self.pooled_client_list)
+
+    def acquire(self, estimated_tokens: int = 0, cancel_event: Optional[threading.Event] = None) -> Optional[PooledClient]:
+        """
+        Block until a client may send a request with `estimated_tokens`, and take the budget from it.
+        Returns None if `cancel_event` is set while waiting.
+        """
+        while True:
+            (pooled_client, time_to_wait) = self._try_acquire(estimated_tokens)
+            if pooled_client is not None:
+                return pooled_client
+            logger.debug(f"Client pool: waiting for {time_to_wait:.2f} seconds...")
+            if cancel_event is not None:
+                if cancel_event.wait(time_to_wait):
+                    return None
+            else:
+                time.sleep(time_to_wait)
+
+    def try_acquire(self, estimated_tokens: int = 0) -> Optional[PooledClient]:
+        """
+        Take the budget from a client which may send a request with `estimated_tokens` now, or return None without waiting.
+        """
+        return self._try_acquire(estimated_tokens)[0]
+
+    def _try_acquire(self, estimated_tokens: int) -> tuple[Optional[PooledClient], float]:
+        with self.lock:
+            now = self.clock()
+            if self.started_at is None:
+                self.started_at = now
+            available_list = [x for x in self.pooled_client_list if x.ejected_until <= now]
+            if not available_list:
+                return (None, min(x.ejected_until for x in self.pooled_client_list) - now)
+            # The one with the most headroom first. Among equals, the least used one first.
+            available_list.sort(key=lambda x: (-x.rate_limiter.get_headroom(), x.count_requests))
+            min_time_to_wait = None
+            for pooled_client in available_list:
+                time_to_wait = pooled_client.rate_limiter.try_acquire(estimated_tokens)
+                if time_to_wait <= 0:
+                    pooled_client.count_requests += 1
+                    return (pooled_client, 0.0)
+                min_time_to_wait = time_to_wait if min_time_to_wait is None else min(min_time_to_wait, time_to_wait)
+            return (None, min_time_to_wait)
+
+    def on_success(self, pooled_client: PooledClient, estimated_tokens: int = 0, actual_tokens: Optional[int] = None) -> None:
+        pooled_client.rate_limiter.on_success(estimated_tokens, actual_tokens)
+        with self.lock:
+            pooled_client.count_success += 1
+            pooled_client.count_consecutive_errors = 0
+
+    def on_throttled(self, pooled_client: PooledClient, retry_after_in_seconds: Optional[float] = None) -> None:
+        pooled_client.rate_limiter.on_throttled(retry_after_in_seconds)
+        with self.lock:
+            pooled_client.count_throttled += 1
+            self._on_error(pooled_client)
+
+    def on_auth_error(self, pooled_client: PooledClient) -> None:
+        with self.lock:
+            pooled_client.count_auth_errors += 1
+            self._on_error(pooled_client)
+
+    def _on_error(self, pooled_client: PooledClient) -> None:
+        pooled_client.count_consecutive_errors += 1
+        # A single client is never ejected. Its rate limiter backs off instead.
+        if len(self.pooled_client_list) > 1 and pooled_client.count_consecutive_errors >= self.eject_after_consecutive_errors:
+            pooled_client.ejected_until = self.clock() + self.ejection_in_seconds
+            pooled_client.count_ejections += 1
+            pooled_client.count_consecutive_errors = 0
+            logger.warning(f"Client pool: ejected {pooled_client.name} for {self.ejection_in_seconds} seconds after {self.eject_after_consecutive_errors} error(s) in a row.")
+
+    def show_stats(self) -> None:
+        elapsed_in_minutes = max(1e-9, (self.clock() - self.started_at) / 60.0) if self.started_at is not None else None
+        count_success = 0
+        for pooled_client in self.pooled_client_list:
+            count_success += pooled_client.count_success
+            throughput = f"{pooled_client.count_success / elapsed_in_minutes:.1f}/min" if elapsed_in_minutes else "n/a"
+            logger.info(f"[ClientPool] {pooled_client.name}: Requests: {pooled_client.count_requests}, Success: {pooled_client.count_success}, Throttled: {pooled_client.count_throttled}, Auth errors: {pooled_client.count_auth_errors}, Ejections: {pooled_client.count_ejections}, Throughput: {throughput}")
+        if len(self.pooled_client_list) > 1:
+            throughput = f"{count_success / elapsed_in_minutes:.1f}/min" if elapsed_in_minutes else "n/a"
+            logger.info(f"[ClientPool] All {len(self.pooled_client_list)} clients: Success: {count_success}, Throughput: {throughput}")
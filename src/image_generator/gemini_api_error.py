@@ -0,0 +1,85 @@
+"""
+Define helper functions to inspect errors raised by the Gemini API.
+"""
+import re
+from typing import Optional
+
+from google.genai.errors import APIError, ServerError
+import httpx
+
+
+def is_throttling_error(e: Exception) -> bool:
+    """
+    Return True if `e` means that we have hit a quota, i.e. HTTP 429 or RESOURCE_EXHAUSTED.
+    """
+    if not isinstance(e, APIError):
+        return False
+    return e.code == 429 or e.status == "RESOURCE_EXHAUSTED"
+
+
+def is_auth_error(e: Exception) -> bool:
+    """
+    Return True if `e` means that the API key or project is not allowed, e.g. an invalid, expired or revoked key.
+    """
+    if not isinstance(e, APIError):
+        return False
+    return e.code in (401, 403) or e.status in ("UNAUTHENTICATED", "PERMISSION_DENIED") or "API_KEY_INVALID" in str(e.details)
+
+
+def is_file_reference_error(e: Exception) -> bool:
+    """
+    Return True if `e` means that a file referenced by URI in the request does not exist any more, e.g. it has expired or been deleted.
+    The API answers 403 or 404 for such a file, so check this before `is_auth_error`.
+    """
+    if not isinstance(e, APIError):
+        return False
+    message = str(e.message or "").lower()
+    return e.code in (400, 403, 404) and "file" in message and any(x in message for x in ["not exist", "not found", "expired"])
+
+
+def _parse_duration_in_seconds(duration: str) -> Optional[float]:
+    # e.g. "23s" or "0.5s" as in google.rpc.RetryInfo.retryDelay
+    result = re.fullmatch(r"\s*([0-9]+(?:\.[0-9]+)?)s?\s*", str(duration))
+    if not result:
+        return None
+    return float(result.group(1))
+
+
+def get_retry_after_in_seconds(e: Exception) -> Optional[float]:
+    """
+    Return the retry-after hint of `e` in seconds, or None if there is no hint.
+    Look at the Retry-After header first, and then at google.rpc.RetryInfo in the error details.
+    """
+    if not isinstance(e, APIError):
+        return None
+    headers = getattr(e.response, "headers", None)
+    if headers:
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            seconds = _parse_duration_in_seconds(retry_after)
+            if seconds is not None:
+                return seconds
+    details = e.details
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details", [])
+    if not isinstance(details, list):
+        return None
+    for detail in details:
+        if isinstance(detail, dict) and detail.get("@type", "").endswith("google.rpc.RetryInfo"):
+            seconds = _parse_duration_in_seconds(detail.get("retryDelay", ""))
+            if seconds is not None:
+                return seconds
+    return None
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """
+    Classify `e` into retryable or fatal.
+    Server errors (5xx), throttling (429), request timeouts (408) and transport errors including timeouts are retryable.
+    Other client errors (4xx), e.g. bad requests and authentication errors, are fatal.
+    """
+    if isinstance(e, ServerError):
+        return True
+    if isinstance(e, APIError):
+        return is_throttling_error(e) or e.code == 408
+    return isinstance(e, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError))
@@ -0,0 +1,44 @@
+"""
+Define GenerationResult class.
+"""
+from concurrent.futures import Future
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.image_generator.call_metrics import CallMetrics
+
+
+class GenerationResult:
+    """
+    The result record of one work item.
+    It is truthy if and only if the generation succeeded so that it can be used where a bool result is expected.
+    """
+
+    def __init__(self, success: bool, retryable: bool = False, error: Optional[str] = None, retry_after_in_seconds: Optional[float] = None):
+        self.success = success
+        self.retryable = retryable
+        self.error = error
+        self.retry_after_in_seconds = retry_after_in_seconds
+        self.attempt_count = 1
+        self.output_file_path_list: list[str] = []
+        # If the outputs are written in the background, this completes when they are on disk.
+        self.write_future: Optional[Future] = None
+        # Set by BatchDispatcher. The time between the item being ready to run and a worker picking it up.
+        self.queue_wait_in_seconds: Optional[float] = None
+        self.call_metrics: Optional["CallMetrics"] = None
+
+    def __bool__(self) -> bool:
+        return self.success
+
+    def set_output_file_path_list(self, output_file_path_list: list[str]) -> "GenerationResult":
+        self.output_file_path_list = output_file_path_list
+        return self
+
+    def __repr__(self) -> str:
+        return f"GenerationResult(success={self.success}, retryable={self.retryable}, error={self.error!r}, attempt_count={self.attempt_count})"
+
+    @staticmethod
+    def from_bool(result: "bool | GenerationResult") -> "GenerationResult":
+        if isinstance(result, GenerationResult):
+            return result
+        return GenerationResult(bool(result))
@@ -0,0 +1,121 @@
+"""
+Define HedgePolicy class and call_with_deadline_and_hedge function, which bound and cut the tail latency of requests.
+"""
+from collections import deque
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from src.image_generator.call_metrics import get_percentile
+
+
+class HedgePolicy:
+    """
+    Decide when a duplicate of a slow request is sent.
+    A request which has not completed after the `percentile` of the latencies observed in this run is hedged,
+    once `min_samples` latencies are known. The latest `window_size` latencies are kept.
+    Hedges are limited to `max_hedge_ratio` of the requests, so that the extra spend is bounded.
+    """
+
+    def __init__(self, percentile: float = 95.0, max_hedge_ratio: float = 0.05, min_samples: int = 20, window_size: int = 500):
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = max(1, min_samples)
+        self.latency_list: deque[float] = deque(maxlen=max(self.min_samples, window_size))
+        self.count_requests = 0
+        self.count_hedges = 0
+        self.count_hedge_wins = 0
+        self.lock = threading.Lock()
+
+    def record_latency(self, latency_in_seconds: float) -> None:
+        with self.lock:
+            self.latency_list.append(latency_in_seconds)
+
+    def record_request(self) -> None:
+        with self.lock:
+            self.count_requests += 1
+
+    def record_hedge_win(self) -> None:
+        with self.lock:
+            self.count_hedge_wins += 1
+
+    def get_hedge_delay_in_seconds(self) -> Optional[float]:
+        """
+        Return how long a request runs before it is hedged, or None if too few latencies are known yet.
+        """
+        with self.lock:
+            if len(self.latency_list) < self.min_samples:
+                return None
+            return get_percentile(sorted(self.latency_list), self.percentile)
+
+    def try_spend(self) -> bool:
+        """
+        Return True and count a hedge if the budget allows one more.
+        """
+        with self.lock:
+            if self.count_hedges + 1 > self.max_hedge_ratio * self.count_requests:
+                return False
+            self.count_hedges += 1
+            return True
+
+    def refund(self) -> None:
+        """
+        Give back a hedge which has not been sent after all.
+        """
+        with self.lock:
+            self.count_hedges -= 1
+
+    def show_stats(self) -> None:
+        hedge_delay_in_seconds = self.get_hedge_delay_in_seconds()
+        hedge_delay = f"{hedge_delay_in_seconds:.2f} seconds" if hedge_delay_in_seconds is not None else "n/a"
+        logger.info(f"[HedgePolicy] Requests: {self.count_requests}, Hedges: {self.count_hedges}, Won by hedges: {self.count_hedge_wins}, Hedge after: {hedge_delay}")
+
+
+def call_with_deadline_and_hedge(func: Callable[[], Any], total_timeout_in_seconds: Optional[float] = None, hedge_delay_in_seconds: Optional[float] = None, start_hedge: Optional[Callable[[], Optional[Callable[[], Any]]]] = None) -> tuple[Any, bool]:
+    """
+    Call `func` on a thread of its own and return (its result, whether a hedge won).
+    If `func` has not completed after `hedge_delay_in_seconds`, `start_hedge` is called.
+    It returns the function of a duplicate request, or None if a hedge is not allowed, and the first of the two to succeed wins.
+    If a request fails while the other runs, the other is waited for. If every request fails, the first error is raised.
+    TimeoutError is raised if no request has succeeded within `total_timeout_in_seconds`.
+    A request which is still running is not interrupted. Its thread ends with the request, e.g. by the timeout of the HTTP client, and its result is dropped.
+    """
+    result_queue: queue.Queue = queue.Queue()
+
+    def run(index: int, func_to_run: Callable[[], Any]) -> None:
+        try:
+            result_queue.put((index, func_to_run(), None))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            result_queue.put((index, None, e))
+
+    threading.Thread(target=run, args=(0, func), name="request", daemon=True).start()
+    number_of_running = 1
+    now = time.monotonic()
+    deadline = now + total_timeout_in_seconds if total_timeout_in_seconds is not None else None
+    hedge_at = now + hedge_delay_in_seconds if hedge_delay_in_seconds is not None and start_hedge is not None else None
+    first_error: Optional[Exception] = None
+    while number_of_running > 0:
+        wake_at_list = [x for x in [deadline, hedge_at] if x is not None]
+        timeout = max(0.0, min(wake_at_list) - time.monotonic()) if wake_at_list else None
+        try:
+            (index, result, error) = result_queue.get(timeout=timeout)
+        except queue.Empty:
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                hedge_at = None
+                hedge_func = start_hedge()
+                if hedge_func is not None:
+                    threading.Thread(target=run, args=(1, hedge_func), name="hedge", daemon=True).start()
+                    number_of_running += 1
+                continue
+            raise TimeoutError(f"No response within {total_timeout_in_seconds} seconds.")
+        number_of_running -= 1
+        if error is None:
+            return (result, index == 1)
+        if first_error is None:
+            first_error = error
+        # A request which has failed is retried as usual. It is not hedged.
+        hedge_at = None
+    raise first_error
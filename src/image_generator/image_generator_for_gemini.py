@@ -1,21 +1,46 @@
 """
 Define ImageGeneratorForGemini class.
 """
+from concurrent.futures import Future
+import functools
+import hashlib
+from io import BytesIO
+import mimetypes
 import os
 import pprint
+import sqlite3
+import threading
 import time
-from typing import Optional
+from typing import Callable, Optional
 
 from google import genai
 from google.genai import types
-from google.genai.errors import ClientError, ServerError
+from google.genai.errors import APIError, ClientError, ServerError
+import httpx
 from loguru import logger
 from PIL import Image
-from io import BytesIO
 
+from src.image_generator.batch_dispatcher import BatchDispatcher
+from src.image_generator.batch_job import BatchRequestFileBuilder, BatchResultFileIngester, get_manifest_file_path
+from src.image_generator.call_metrics import CallMetrics, CallMetricsEnum, CallMetricsRecorder
+from src.image_generator.circuit_breaker import CircuitBreaker
+from src.image_generator.client_pool import ClientPool, PooledClient
+from src.image_generator.gemini_api_error import get_retry_after_in_seconds, is_auth_error, is_file_reference_error, is_retryable_error, is_throttling_error
+from src.image_generator.generation_result import GenerationResult
+from src.image_generator.hedged_request import HedgePolicy, call_with_deadline_and_hedge
 from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
 from src.image_generator.image_generator_base import ImageGeneratorBase
-from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.input_image_cache import InputImageCache
+from src.image_generator.input_image_preprocessor import InputImagePreprocessor, PreparedInputImage
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec, InputOutputFilePathSpecItem, get_indexed_file_path
+from src.image_generator.input_upload_cache import InputUploadCache
+from src.image_generator.log_payload import log_payload
+from src.image_generator.output_image_writer import OutputImageWriter, gather_write_futures
+from src.image_generator.parameter_sweep import SweepItem
+from src.image_generator.rate_limiter import AdaptiveRateLimiter, estimate_number_of_tokens
+from src.image_generator.result_cache import ResultCache, compute_file_digest, compute_result_cache_key, compute_result_source_key
+from src.image_generator.retry_policy import RetryPolicy
+from src.image_generator.run_journal import RunJournal, get_item_key
 
 
 def filter_log_message_for_gemini_api_call(record):
@@ -33,13 +58,29 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+def add_gemini_api_call_log_sink(log_file_path: str) -> int:
+    """
+    Add the sink of the [GEMINI_API_CALL] lines and return its handler ID.
+    The sink is enqueued, so that writing, rotation and compression run on the thread of loguru instead of the request threads.
+    """
+    return logger.add(log_file_path, rotation="10 MB", compression="zip", level="INFO", filter=filter_log_message_for_gemini_api_call, enqueue=True)
+
+
 class LoggerSingletonForGeminiAPICall(metaclass=Singleton):
 
     def __init__(self):
-        pass
+        self.handler_id: Optional[int] = None
+
+        self.flag_initialized = False
 
-    def init_logger(self):
-        logger.add("./logs/gemini_api_call.log", rotation="10 MB", compression="zip", level="INFO", filter=filter_log_message_for_gemini_api_call)
+    def init_logger(self, log_file_path: Optional[str] = "./logs/gemini_api_call.log"):
+        # Every ImageGeneratorForGemini calls this. Add the sink once, so that a line is not written once per instance.
+        # The first call decides the sink. `log_file_path` of None adds none, e.g. for the benchmarks which add their own.
+        if self.flag_initialized:
+            return
+        self.flag_initialized = True
+        if log_file_path is not None:
+            self.handler_id = add_gemini_api_call_log_sink(log_file_path)
 
 
 class FilePathBuilder():
@@ -57,49 +98,204 @@ class FilePathBuilder():
             if i == 0:
                 output_image_path_list_of_list.append(output_file_path_list_as_arg)
             else:
-                output_file_path_list_modified = []
-                for o in output_file_path_list_as_arg:
-                    output_image_name_modified = f"{os.path.splitext(os.path.basename(o))[0]}.candidate.{i}{os.path.splitext(o)[1]}"
-                    output_image_path_modified = os.path.join(os.path.dirname(o), output_image_name_modified)
-                    output_file_path_list_modified.append(output_image_path_modified)
-                output_image_path_list_of_list.append(output_file_path_list_modified)
+                output_image_path_list_of_list.append([get_indexed_file_path(o, "candidate", i) for o in output_file_path_list_as_arg])
         return output_image_path_list_of_list
 
 
+class StreamedOutput:
+    """
+    What is left of a streamed response once its images are handed to the output writer.
+    """
+
+    def __init__(self):
+        self.usage_metadata: Optional[types.GenerateContentResponseUsageMetadata] = None
+        # (candidate index, output paths) of each image
+        self.output_image_paths_list: list[tuple[int, list[str]]] = []
+        self.write_future_list: list[Future] = []
+        # (candidate index, image bytes, output paths) of each image, kept for the result cache
+        self.image_list_to_cache: list[tuple[int, bytes, list[str]]] = []
+
+
 class ImageGeneratorForGemini(ImageGeneratorBase):
 
     def __init__(self):
         self.client: Optional[genai.Client] = None
+        # (API key config, client) of each API key. `client` is the first one.
+        self.api_key_client_list: list[tuple[dict, genai.Client]] = []
+        self.client_pool = ClientPool()
         self.extra_gemini_api_logger = LoggerSingletonForGeminiAPICall()
         self.extra_gemini_api_logger.init_logger()
         self.file_path_builder = FilePathBuilder()
+        self.max_in_flight = 1
+        self.flag_stream = False
+        self.request_timeout_in_seconds: Optional[float] = None
+        self.total_timeout_in_seconds: Optional[float] = None
+        self.hedge_policy: Optional[HedgePolicy] = None
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        self.dispatcher: Optional[BatchDispatcher] = None
+        # A cancel which arrives between two batches cancels the next one, e.g. when the watch folder daemon stops.
+        self.flag_batch_running = False
+        self.flag_cancel_pending = False
+        self.cancel_lock = threading.Lock()
+        self.model_name = "models/gemini-2.5-flash-image-preview"
+        self.retry_policy: Optional[RetryPolicy] = None
+        self.input_image_cache: Optional[InputImageCache] = None
+        self.input_image_preprocessor: Optional[InputImagePreprocessor] = None
+        self.result_cache: Optional[ResultCache] = None
+        self.input_upload_cache: Optional[InputUploadCache] = None
+        self.run_journal: Optional[RunJournal] = None
+        self.output_image_writer = OutputImageWriter(max_workers=0)
+        self.call_metrics_recorder: Optional[CallMetricsRecorder] = None
+        # SHA-256 of each input file by (absolute path, mtime_ns, size), so that a file used by many requests is read once per run.
+        self.file_digest_by_stat: dict[tuple[str, int, int], str] = {}
+        self.file_digest_lock = threading.Lock()
+
+    def set_max_in_flight(self, max_in_flight: int) -> None:
+        self.max_in_flight = max_in_flight
+
+    def set_stream(self, flag_stream: bool) -> None:
+        self.flag_stream = flag_stream
+
+    def set_timeouts(self, request_timeout_in_seconds: Optional[float], total_timeout_in_seconds: Optional[float]) -> None:
+        """
+        Set the timeout of each request, which is that of the HTTP client, and that of a call including its hedge and, with streaming, all of its chunks.
+        The timeout of each request applies to the clients created afterwards.
+        """
+        self.request_timeout_in_seconds = request_timeout_in_seconds
+        self.total_timeout_in_seconds = total_timeout_in_seconds
+
+    def set_hedge_policy(self, hedge_policy: Optional[HedgePolicy]) -> None:
+        self.hedge_policy = hedge_policy
+
+    def set_circuit_breaker(self, circuit_breaker: Optional[CircuitBreaker]) -> None:
+        self.circuit_breaker = circuit_breaker
+
+    def set_input_image_cache(self, input_image_cache: Optional[InputImageCache]) -> None:
+        self.input_image_cache = input_image_cache
+
+    def set_input_image_preprocessor(self, input_image_preprocessor: Optional[InputImagePreprocessor]) -> None:
+        self.input_image_preprocessor = input_image_preprocessor
+
+    def set_result_cache(self, result_cache: Optional[ResultCache]) -> None:
+        self.result_cache = result_cache
+
+    def set_input_upload_cache(self, input_upload_cache: Optional[InputUploadCache]) -> None:
+        self.input_upload_cache = input_upload_cache
+
+    def set_run_journal(self, run_journal: Optional[RunJournal]) -> None:
+        self.run_journal = run_journal
+
+    def set_output_image_writer(self, output_image_writer: OutputImageWriter) -> None:
+        self.output_image_writer = output_image_writer
+
+    def set_retry_policy(self, retry_policy: Optional[RetryPolicy]) -> None:
+        self.retry_policy = retry_policy
+
+    def set_call_metrics_recorder(self, call_metrics_recorder: Optional[CallMetricsRecorder]) -> None:
+        self.call_metrics_recorder = call_metrics_recorder
+
+    def cancel(self) -> None:
+        """
+        Cancel the running batch, or the next one if none is running. Requests already sent run to completion.
+        """
+        with self.cancel_lock:
+            if self.flag_batch_running:
+                self.dispatcher.cancel()
+            else:
+                self.flag_cancel_pending = True
 
     def generate_one_batch_of_images(self, input_output_file_path_spec: InputOutputFilePathSpec, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig) -> bool:
-        len_of_generation_request = len(input_output_file_path_spec.get_item_list())
-        count = 0
-        count_success = 0
-        count_failure = 0
         if not self.client:
             logger.error("Gemini client is not initialized.")
             return False
-        for item in input_output_file_path_spec.get_item_list():
-            r = self._generate_images_using_api_call(
-                item['input_file_path_list'],
-                item['output_file_path_list'],
-                image_generator_generate_content_config
+        item_iterator = input_output_file_path_spec.iter_items()
+        len_of_generation_request = input_output_file_path_spec.get_number_of_items()
+        if self.run_journal:
+            run_journal = self.run_journal
+            count_done = sum(1 for item in input_output_file_path_spec.iter_items() if run_journal.is_done(get_item_key(item.output_file_path_list)))
+            if count_done > 0:
+                logger.info(f"Skipping {count_done} item(s) which are already done in run {run_journal.run_id}.")
+                len_of_generation_request -= count_done
+                item_iterator = (item for item in item_iterator if not run_journal.is_done(get_item_key(item.output_file_path_list)))
+        logger.info(f"Dispatching {len_of_generation_request} request(s) with at most {self.max_in_flight} in flight.")
+        with self.cancel_lock:
+            self.dispatcher = BatchDispatcher(self.max_in_flight)
+            self.flag_batch_running = True
+            if self.flag_cancel_pending:
+                self.flag_cancel_pending = False
+                self.dispatcher.cancel()
+        self.dispatcher.set_circuit_breaker(self.circuit_breaker)
+
+        def generate_one_item(item: InputOutputFilePathSpecItem) -> GenerationResult:
+            if self.run_journal:
+                self.run_journal.record_in_flight(get_item_key(item.output_file_path_list))
+            return self._generate_images_using_api_call(
+                list(item.input_file_path_list),
+                list(item.output_file_path_list),
+                item.variant.image_generator_generate_content_config if isinstance(item, SweepItem) else image_generator_generate_content_config
             )
-            logger.info(f"Image generation result: {r}")
-            count += 1
-            if r:
-                count_success += 1
+
+        def record_result_in_journal(item: InputOutputFilePathSpecItem, result: GenerationResult) -> None:
+            key = get_item_key(item.output_file_path_list)
+            if not result:
+                self.run_journal.record_failed(key, result.error, result.attempt_count)
+                return
+
+            def on_written(write_future: Future) -> None:
+                if write_future.exception() is not None:
+                    self.run_journal.record_failed(key, f"Failed to write outputs: {write_future.exception()}", result.attempt_count)
+                else:
+                    self.run_journal.record_done(key, result.output_file_path_list, result.attempt_count)
+
+            if result.write_future is not None:
+                # Record it as done only when the outputs are on disk.
+                result.write_future.add_done_callback(on_written)
             else:
-                count_failure += 1
-            if item != input_output_file_path_spec.get_item_list()[-1]:
-                const_time_to_sleep_in_seconds = 10
-                logger.info(f"Waiting for {const_time_to_sleep_in_seconds} seconds to avoid hitting rate limits...")
-                time.sleep(const_time_to_sleep_in_seconds)
-            logger.info(f"Among: {len_of_generation_request} So far... total requests: {count}, Success: {count_success}, Failure: {count_failure}")
-        return True
+                self.run_journal.record_done(key, result.output_file_path_list, result.attempt_count)
+
+        def record_call_metrics(result: GenerationResult) -> None:
+            call_metrics = result.call_metrics
+            call_metrics.attempt_count = result.attempt_count
+            call_metrics.queue_wait_in_seconds = result.queue_wait_in_seconds
+            if result.write_future is not None:
+                # Record it when the encode and write times are known.
+                result.write_future.add_done_callback(lambda _: self.call_metrics_recorder.record(call_metrics))
+            else:
+                self.call_metrics_recorder.record(call_metrics)
+
+        def on_result(item: InputOutputFilePathSpecItem, result: GenerationResult) -> None:
+            if self.run_journal:
+                record_result_in_journal(item, result)
+            if self.call_metrics_recorder and result.call_metrics:
+                record_call_metrics(result)
+
+        try:
+            progress = self.dispatcher.run(item_iterator, generate_one_item, len_of_generation_request, self.retry_policy, on_result)
+        finally:
+            with self.cancel_lock:
+                self.flag_batch_running = False
+        logger.info(f"Done. Success: {progress.count_success}, Failure: {progress.count_failure}, Retries: {progress.count_retries}, Cancelled: {progress.count_cancelled}")
+        self.output_image_writer.flush()
+        self.output_image_writer.show_stats()
+        self.client_pool.show_stats()
+        if self.hedge_policy:
+            self.hedge_policy.show_stats()
+        if self.circuit_breaker:
+            self.circuit_breaker.show_stats()
+        if self.call_metrics_recorder:
+            self.call_metrics_recorder.show_summary()
+            self.call_metrics_recorder.write_prometheus_textfile()
+        if self.input_image_cache:
+            self.input_image_cache.show_stats()
+        if self.input_image_preprocessor:
+            self.input_image_preprocessor.show_stats()
+        if self.result_cache:
+            self.result_cache.show_stats()
+        if self.input_upload_cache:
+            self.input_upload_cache.show_stats()
+        # Wait for the enqueued sinks, so that the log of the API calls of the batch is on disk when it returns.
+        logger.complete()
+        return not self.dispatcher.is_cancelled()
 
     def _get_generate_content_config(self, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig):
         # As of 2025-09-03, a substring "IMAGE" in category is not supported yet.
@@ -131,32 +327,171 @@ class ImageGeneratorForGemini(ImageGeneratorBase):
             generate_content_config.temperature = image_generator_generate_content_config.get_temperature()
         if image_generator_generate_content_config.get_top_p() is not None:
             generate_content_config.top_p = image_generator_generate_content_config.get_top_p()
+        if image_generator_generate_content_config.get_candidate_count() is not None:
+            generate_content_config.candidate_count = image_generator_generate_content_config.get_candidate_count()
         return generate_content_config
 
-    def _load_input_image_files(self, input_file_path_list_as_arg: list[str]) -> tuple[bool, list[Image.Image] | None]:
+    def _load_input_image_files(self, input_file_path_list_as_arg: list[str]) -> tuple[bool, list[Image.Image | PreparedInputImage] | None]:
         """
         Load input image files from the specified file paths.
         Returns a tuple (success: bool, list of Image objects or None).
+        If a preprocessor is set, the list has PreparedInputImage objects instead.
         """
         input_image_file_list = []
         for input_file_path in input_file_path_list_as_arg:
             try:
-                image_file = Image.open(input_file_path)
-                image_file_copied = image_file.copy()
-                image_file.close()
-            except (FileNotFoundError, OSError) as e:
+                if self.input_image_cache:
+                    image_file_copied = self.input_image_cache.get_or_load(input_file_path, self._load_input_image_file)
+                else:
+                    image_file_copied = self._load_input_image_file(input_file_path)
+            except (FileNotFoundError, OSError, ValueError) as e:
                 logger.error(f"Failed to open image at {input_file_path}: {e}")
                 return (False, None)
             input_image_file_list.append(image_file_copied)
         return (True, input_image_file_list)
 
-    def _generate_images_using_api_call(self, input_file_path_list_as_arg: list[str], output_file_path_list_as_arg: list[str], image_generator_generate_content_config: ImageGeneratorGenerateContentConfig) -> bool:
+    def _load_input_image_file(self, input_file_path: str) -> Image.Image | PreparedInputImage:
+        if self.input_image_preprocessor:
+            return self.input_image_preprocessor.prepare(input_file_path)
+        image_file = Image.open(input_file_path)
+        image_file_copied = image_file.copy()
+        image_file.close()
+        return image_file_copied
+
+    def _estimate_number_of_tokens(self, prompt: str, input_image_file_list: list[Image.Image | PreparedInputImage], number_of_candidates: int = 1) -> int:
+        """
+        Estimate the number of tokens of one request before sending it.
+        The rate limiter corrects the estimation with `usage_metadata` afterwards.
+        """
+        return estimate_number_of_tokens(prompt, [image.size for image in input_image_file_list], number_of_candidates)
+
+    def _generate_images_using_api_call(self, input_file_path_list_as_arg: list[str], output_file_path_list_as_arg: list[str], image_generator_generate_content_config: ImageGeneratorGenerateContentConfig) -> GenerationResult:
+        call_metrics = CallMetrics(get_item_key(output_file_path_list_as_arg))
+        start = time.perf_counter()
         (result, input_image_file_list) = self._load_input_image_files(input_file_path_list_as_arg)
+        call_metrics.decode_time_in_seconds = time.perf_counter() - start
         if not result:
-            return False
-        result = self._generate_and_write_output_images(image_generator_generate_content_config, input_image_file_list, input_file_path_list_as_arg, output_file_path_list_as_arg)
+            result = GenerationResult(False, error="Failed to load input images.")
+        else:
+            result = self._generate_and_write_output_images(image_generator_generate_content_config, input_image_file_list, input_file_path_list_as_arg, output_file_path_list_as_arg, call_metrics)
+        if call_metrics.outcome is None:
+            call_metrics.outcome = CallMetricsEnum.const_outcome_success if result else CallMetricsEnum.const_outcome_failure
+        call_metrics.error = result.error
+        result.call_metrics = call_metrics
         return result
 
+    def _get_input_size_in_bytes(self, image_file: Image.Image | PreparedInputImage | None, input_file_path: str) -> int:
+        # An image object is encoded by the SDK. Its file size is used as an approximation.
+        if isinstance(image_file, PreparedInputImage):
+            return len(image_file.data)
+        try:
+            return os.path.getsize(input_file_path)
+        except OSError:
+            return 0
+
+    def _get_input_bytes_digest(self, image_file: Image.Image | PreparedInputImage | None, input_file_path: str) -> str:
+        if isinstance(image_file, PreparedInputImage):
+            return hashlib.sha256(image_file.data).hexdigest()
+        return self._get_input_file_digest(input_file_path)
+
+    def _get_input_file_digest(self, input_file_path: str) -> str:
+        stat_result = os.stat(input_file_path)
+        memo_key = (os.path.abspath(input_file_path), stat_result.st_mtime_ns, stat_result.st_size)
+        with self.file_digest_lock:
+            digest = self.file_digest_by_stat.get(memo_key)
+        if digest is None:
+            digest = compute_file_digest(input_file_path)
+            with self.file_digest_lock:
+                self.file_digest_by_stat[memo_key] = digest
+        return digest
+
+    def _get_result_cache_key(self, prompt: str, config_for_generation: types.GenerateContentConfig, input_image_file_list: list[Image.Image | PreparedInputImage], input_file_path_list: list[str]) -> str:
+        input_bytes_digest_list = [self._get_input_bytes_digest(image_file, input_file_path) for (image_file, input_file_path) in zip(input_image_file_list, input_file_path_list)]
+        return compute_result_cache_key(self.model_name, prompt, config_for_generation.model_dump_json(exclude_none=True), input_bytes_digest_list)
+
+    def _get_result_source_key(self, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, input_file_path_list: list[str]) -> Optional[str]:
+        """
+        Return the source key of a request, by which the run planner finds its result without loading the inputs, or None if an input cannot be read.
+        """
+        input_preparation = self.input_image_preprocessor.get_signature() if self.input_image_preprocessor else "original"
+        try:
+            input_file_digest_list = [self._get_input_file_digest(input_file_path) for input_file_path in input_file_path_list]
+        except OSError:
+            return None
+        return compute_result_source_key(self.model_name, image_generator_generate_content_config.get_prompt() or "", image_generator_generate_content_config.get_optional_config_json(), input_preparation, input_file_digest_list)
+
+    def _upload_input_image(self, client: genai.Client, image_file: Image.Image | PreparedInputImage | None, input_file_path: str) -> tuple[str, str, Optional[float]]:
+        """
+        Upload one input image with the Files API. Returns (file URI, MIME type, expires at).
+        Unless `image_file` is prepared, the file at `input_file_path` is uploaded as is.
+        """
+        if isinstance(image_file, PreparedInputImage):
+            (file, mime_type) = (BytesIO(image_file.data), image_file.mime_type)
+        else:
+            (file, mime_type) = (input_file_path, mimetypes.guess_type(input_file_path)[0] or "image/png")
+        uploaded_file = client.files.upload(file=file, config=types.UploadFileConfig(mime_type=mime_type))
+        expires_at = uploaded_file.expiration_time.timestamp() if uploaded_file.expiration_time else None
+        return (uploaded_file.uri, uploaded_file.mime_type or mime_type, expires_at)
+
+    def _build_contents(self, prompt: str, input_image_file_list: list[Image.Image | PreparedInputImage], input_file_path_list: list[str], pooled_client: PooledClient) -> tuple[list, list[tuple[str, str]], int]:
+        """
+        Return (contents, keys of the input images referenced by file URI, input bytes sent by this request) of one request.
+        With an input upload cache, an input image is uploaded once per client and referenced by its URI.
+        Otherwise, or if the upload fails, it is sent inline.
+        The prepared input images which are sent, inline or by an upload, are reported to the preprocessor.
+        """
+        contents = [prompt]
+        file_reference_key_list = []
+        input_bytes = 0
+        sent_prepared_input_image_list = []
+        for (image_file, input_file_path) in zip(input_image_file_list, input_file_path_list):
+            size_in_bytes = self._get_input_size_in_bytes(image_file, input_file_path)
+            if self.input_upload_cache and size_in_bytes >= self.input_upload_cache.min_bytes:
+                content_hash = self._get_input_bytes_digest(image_file, input_file_path)
+                upload = functools.partial(self._upload_input_image, pooled_client.client, image_file, input_file_path)
+                try:
+                    (file_uri, mime_type, flag_uploaded) = self.input_upload_cache.get_or_upload(pooled_client.name, content_hash, size_in_bytes, upload)
+                    contents.append(types.Part.from_uri(file_uri=file_uri, mime_type=mime_type))
+                    file_reference_key_list.append((pooled_client.name, content_hash))
+                    if flag_uploaded:
+                        input_bytes += size_in_bytes
+                        if isinstance(image_file, PreparedInputImage):
+                            sent_prepared_input_image_list.append(image_file)
+                    continue
+                except (APIError, httpx.TimeoutException, httpx.TransportError, OSError) as e:
+                    logger.warning(f"Failed to upload {input_file_path}. Sending it inline instead: {e}")
+            if isinstance(image_file, PreparedInputImage):
+                contents.append(types.Part.from_bytes(data=image_file.data, mime_type=image_file.mime_type))
+                sent_prepared_input_image_list.append(image_file)
+            else:
+                contents.append(image_file)
+            input_bytes += size_in_bytes
+        if self.input_image_preprocessor:
+            self.input_image_preprocessor.record_request(sent_prepared_input_image_list)
+        return (contents, file_reference_key_list, input_bytes)
+
+    def _materialize_cached_result(self, result_cache_key: str, output_file_path_list_as_arg: list[str]) -> Optional[list[str]]:
+        """
+        Write the cached result of `result_cache_key` to the output paths without calling the API.
+        The cached images go through the output writer as those of a response do, so that they are converted to the output format if needed.
+        Returns the written output paths, or None on a cache miss.
+        """
+        blob_path_list = self.result_cache.get(result_cache_key)
+        if blob_path_list is None:
+            return None
+        output_image_path_list_of_list = self.file_path_builder.build_output_file_path_list_of_list(len(blob_path_list), output_file_path_list_as_arg)
+        try:
+            image_list_to_write = []
+            for (blob_path, output_image_paths) in zip(blob_path_list, output_image_path_list_of_list):
+                with open(blob_path, mode="rb") as f:
+                    image_list_to_write.append((f.read(), output_image_paths))
+            self.output_image_writer.submit(image_list_to_write).result()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to materialize the cached result. Calling the API instead: {e}")
+            return None
+        logger.info(f"Result cache hit. Materialized {len(blob_path_list)} candidate(s) without calling Gemini API.")
+        return [x for output_image_paths in output_image_path_list_of_list for x in output_image_paths]
+
     def _log_gemini_api_call(self, prompt: str, config_for_generation: types.GenerateContentConfig, input_file_path_list: list[str], output_image_paths: list[str]) -> None:
         prompt_to_log = prompt.strip()
         string_to_log = f"\"[GEMINI_API_CALL]\","
@@ -169,72 +504,300 @@ class ImageGeneratorForGemini(ImageGeneratorBase):
         string_to_log += f"\"{config_for_generation.top_p}\""
         logger.info(string_to_log, extra={"gemini_api_call": True})
 
-    def _generate_and_write_output_images(self, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, input_image_file_list: list[Image.Image], input_file_path_list_as_arg: list[str], output_file_path_list_as_arg: list[str]) -> bool:
+    def _generate_and_write_output_images(self, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, input_image_file_list: list[Image.Image | PreparedInputImage], input_file_path_list_as_arg: list[str], output_file_path_list_as_arg: list[str], call_metrics: Optional[CallMetrics] = None) -> GenerationResult:
 
+        if call_metrics is None:
+            call_metrics = CallMetrics(get_item_key(output_file_path_list_as_arg))
         count_saved = 0
+        file_reference_key_list = []
         try:
             config_for_generation = self._get_generate_content_config(image_generator_generate_content_config)
-            const_model_name = "models/gemini-2.5-flash-image-preview"
-            contents = []
             prompt = image_generator_generate_content_config.get_prompt()
-            contents.append(prompt)
-            for image_file in input_image_file_list:
-                contents.append(image_file)
-            logger.info("Calling Gemini API...")
-            response = self.client.models.generate_content(
-                model=const_model_name,
-                contents=contents,
-                config=config_for_generation,
-            )
+            result_cache_key = None
+            result_source_key = None
+            if self.result_cache:
+                result_cache_key = self._get_result_cache_key(prompt, config_for_generation, input_image_file_list, input_file_path_list_as_arg)
+                materialized_file_path_list = self._materialize_cached_result(result_cache_key, output_file_path_list_as_arg)
+                if materialized_file_path_list is not None:
+                    call_metrics.outcome = CallMetricsEnum.const_outcome_cache_hit
+                    return GenerationResult(True).set_output_file_path_list(materialized_file_path_list)
+                result_source_key = self._get_result_source_key(image_generator_generate_content_config, input_file_path_list_as_arg)
+            estimated_tokens = self._estimate_number_of_tokens(prompt, input_image_file_list, config_for_generation.candidate_count or 1)
+            start = time.perf_counter()
+            pooled_client = self.client_pool.acquire(estimated_tokens, self.dispatcher.cancel_event if self.dispatcher else None)
+            call_metrics.rate_limit_wait_in_seconds = time.perf_counter() - start
+            if pooled_client is None:
+                logger.warning("Cancelled before calling Gemini API.")
+                return GenerationResult(False, error="Cancelled.")
+            # Built for the acquired client, because uploaded files belong to the project of its key.
+            (contents, file_reference_key_list, call_metrics.input_bytes) = self._build_contents(prompt, input_image_file_list, input_file_path_list_as_arg, pooled_client)
+            logger.info(f"Calling Gemini API with {pooled_client.name}...")
+            start = time.perf_counter()
+            try:
+                if self.flag_stream:
+                    # Not hedged, because its images are written as they arrive.
+                    streamed_output = self._stream_and_submit_output_images(pooled_client, contents, config_for_generation, prompt, input_file_path_list_as_arg, output_file_path_list_as_arg, call_metrics)
+                    usage_metadata = streamed_output.usage_metadata
+                    self.client_pool.on_success(pooled_client, estimated_tokens, usage_metadata.total_token_count if usage_metadata else None)
+                else:
+                    send = functools.partial(self._send_request, pooled_client, contents, file_reference_key_list, config_for_generation, estimated_tokens, call_metrics)
+                    if self.total_timeout_in_seconds is None and self.hedge_policy is None:
+                        response = send()
+                    else:
+                        response = self._send_request_with_deadline_and_hedge(send, prompt, input_image_file_list, input_file_path_list_as_arg, config_for_generation, estimated_tokens, call_metrics)
+            except ClientError as e:
+                if self.flag_stream:
+                    self._on_client_error(e, pooled_client, file_reference_key_list, call_metrics)
+                raise
+            finally:
+                call_metrics.latency_in_seconds = time.perf_counter() - start
             logger.info("Done.")
-            self._show_response_info(response)
+            if self.flag_stream:
+                return self._get_streamed_generation_result(streamed_output, result_cache_key, result_source_key, call_metrics)
+            self._record_response_in_call_metrics(response, call_metrics)
+            call_metrics.time_to_first_image_in_seconds = call_metrics.latency_in_seconds
             if not response.candidates:
                 logger.error("No candidates in the response.")
-                return False
-            number_of_candidates = len(response.candidates)
-            logger.info(f"Number of candidates: {number_of_candidates}")
-            if number_of_candidates == 0:
-                logger.error("No candidates returned from the API.")
-                return False
-
-            output_image_path_list_of_list = self.file_path_builder.build_output_file_path_list_of_list(number_of_candidates, output_file_path_list_as_arg)
-
-            index = 0
-            for c in response.candidates:
-                logger.info(f"Candidate: {c}")
-                if not c.content:
-                    logger.error("The candidate has no content.")
-                    continue
-                if not c.content.parts:
-                    logger.error("The candidate has no content parts.")
-                    continue
-                for part in c.content.parts:
-                    if part.text is not None:
-                        logger.info(part.text)
-                    elif part.inline_data is not None:
-                        logger.info("Saving image...")
-                        image = Image.open(BytesIO(part.inline_data.data))
-                        output_image_paths = output_image_path_list_of_list[index]
-                        for output_image_path in output_image_paths:
-                            image.save(output_image_path)
-                        image.close()
-                        logger.info("Saved.")
-                        self._log_gemini_api_call(prompt, config_for_generation, input_file_path_list_as_arg, output_image_paths)
-                        count_saved += 1
-                index += 1
+                return GenerationResult(False, retryable=True, error="No candidates in the response.")
+            self._show_response_info(response)
+            image_list_to_write = self._collect_images_to_write(response, output_file_path_list_as_arg)
+            for (_, output_image_paths) in image_list_to_write:
+                self._log_gemini_api_call(prompt, config_for_generation, input_file_path_list_as_arg, output_image_paths)
+                count_saved += 1
         except ServerError as e:
             logger.error(f"Gemini server error: {e}")
-            return False
+            return GenerationResult(False, retryable=True, error=f"Gemini server error: {e}")
         except ClientError as e:
             logger.error(f"Gemini API error: {e}")
-            return False
+            if self.input_upload_cache and is_file_reference_error(e):
+                return GenerationResult(False, retryable=True, error=f"Gemini API error: {e}")
+            if len(self.client_pool) > 1:
+                # The key which failed is paced or ejected by the pool, and the retry can go to another key right away.
+                return GenerationResult(False, retryable=is_retryable_error(e) or is_auth_error(e), error=f"Gemini API error: {e}")
+            return GenerationResult(False, retryable=is_retryable_error(e), error=f"Gemini API error: {e}", retry_after_in_seconds=get_retry_after_in_seconds(e))
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            logger.error(f"Gemini transport error: {e}")
+            return GenerationResult(False, retryable=True, error=f"Gemini transport error: {e}")
+        except TimeoutError as e:
+            logger.error(f"Gemini API call timed out: {e}")
+            return GenerationResult(False, retryable=True, error=f"Gemini API call timed out: {e}")
         if count_saved > 0:
-            return True
+            written_file_path_list = []
+            for (_, output_image_paths) in image_list_to_write:
+                for output_image_path in output_image_paths:
+                    if output_image_path not in written_file_path_list:
+                        written_file_path_list.append(output_image_path)
+
+            def on_written(_: list[str], error: Optional[Exception]) -> None:
+                if error is None and result_cache_key is not None:
+                    self._put_result_in_cache(result_cache_key, image_list_to_write, result_source_key)
+
+            result = GenerationResult(True).set_output_file_path_list(written_file_path_list)
+            result.write_future = self.output_image_writer.submit(image_list_to_write, on_written, call_metrics)
+            return result
         else:
-            return False
+            return GenerationResult(False, error="No image in the response.")
+
+    def _send_request(self, pooled_client: PooledClient, contents: list, file_reference_key_list: list[tuple[str, str]], config_for_generation: types.GenerateContentConfig, estimated_tokens: int, call_metrics: CallMetrics) -> types.GenerateContentResponse:
+        """
+        Send one request with `pooled_client` and report how it went to the client pool and the hedge policy.
+        """
+        start = time.perf_counter()
+        try:
+            response = pooled_client.client.models.generate_content(
+                model=self.model_name,
+                contents=contents,
+                config=config_for_generation,
+            )
+        except ClientError as e:
+            self._on_client_error(e, pooled_client, file_reference_key_list, call_metrics)
+            raise
+        usage_metadata = response.usage_metadata
+        self.client_pool.on_success(pooled_client, estimated_tokens, usage_metadata.total_token_count if usage_metadata else None)
+        if self.hedge_policy:
+            self.hedge_policy.record_latency(time.perf_counter() - start)
+        return response
+
+    def _send_request_with_deadline_and_hedge(self, send: Callable[[], types.GenerateContentResponse], prompt: str, input_image_file_list: list[Image.Image | PreparedInputImage], input_file_path_list: list[str], config_for_generation: types.GenerateContentConfig, estimated_tokens: int, call_metrics: CallMetrics) -> types.GenerateContentResponse:
+        """
+        Call `send` within the total timeout, and send a hedge with another budget of the pool if it is slower than the hedge policy allows.
+        """
+        hedge_delay_in_seconds = None
+        if self.hedge_policy:
+            self.hedge_policy.record_request()
+            hedge_delay_in_seconds = self.hedge_policy.get_hedge_delay_in_seconds()
+
+        def start_hedge() -> Optional[Callable[[], types.GenerateContentResponse]]:
+            if not self.hedge_policy.try_spend():
+                logger.debug("The hedge budget is spent.")
+                return None
+            pooled_client = self.client_pool.try_acquire(estimated_tokens)
+            if pooled_client is None:
+                logger.debug("No client is free to send a hedge.")
+                self.hedge_policy.refund()
+                return None
+            logger.info(f"No response after {hedge_delay_in_seconds:.2f} seconds. Sending a hedge with {pooled_client.name}...")
+
+            def send_hedge() -> types.GenerateContentResponse:
+                (contents, file_reference_key_list, _) = self._build_contents(prompt, input_image_file_list, input_file_path_list, pooled_client)
+                return self._send_request(pooled_client, contents, file_reference_key_list, config_for_generation, estimated_tokens, call_metrics)
+
+            return send_hedge
+
+        (response, flag_hedge_won) = call_with_deadline_and_hedge(send, self.total_timeout_in_seconds, hedge_delay_in_seconds, start_hedge if self.hedge_policy else None)
+        if flag_hedge_won:
+            logger.info("The hedge has won.")
+            self.hedge_policy.record_hedge_win()
+        return response
+
+    def _on_client_error(self, e: ClientError, pooled_client: PooledClient, file_reference_key_list: list[tuple[str, str]], call_metrics: CallMetrics) -> None:
+        if file_reference_key_list and is_file_reference_error(e):
+            # The uploaded files have expired or been deleted. The retry uploads them again.
+            for (client_name, content_hash) in file_reference_key_list:
+                self.input_upload_cache.invalidate(client_name, content_hash)
+        elif is_throttling_error(e):
+            call_metrics.outcome = CallMetricsEnum.const_outcome_throttled
+            self.client_pool.on_throttled(pooled_client, get_retry_after_in_seconds(e))
+        elif is_auth_error(e):
+            self.client_pool.on_auth_error(pooled_client)
+
+    def _stream_and_submit_output_images(self, pooled_client: PooledClient, contents: list, config_for_generation: types.GenerateContentConfig, prompt: str, input_file_path_list: list[str], output_file_path_list_as_arg: list[str], call_metrics: CallMetrics) -> StreamedOutput:
+        """
+        Call the streaming API and hand each inline image to the output writer as soon as its chunk arrives,
+        so that no more than one image of a response is held in memory, besides those kept for the result cache.
+        A chunk has the parts of one or more candidates, which are told apart by `index`.
+        TimeoutError is raised if the chunks have not all arrived within the total timeout, even if the stream stalls,
+        since the stream is consumed on a thread of its own. The images already submitted are overwritten by the retry.
+        """
+        consume = functools.partial(self._consume_stream, pooled_client, contents, config_for_generation, prompt, input_file_path_list, output_file_path_list_as_arg, call_metrics)
+        if self.total_timeout_in_seconds is None:
+            return consume(None)
+        cancel_event = threading.Event()
+        try:
+            (streamed_output, _) = call_with_deadline_and_hedge(functools.partial(consume, cancel_event), self.total_timeout_in_seconds)
+        except TimeoutError:
+            # The stream is left to the timeout of the HTTP client. Its later chunks are dropped, so that they do not overwrite the images of the retry.
+            cancel_event.set()
+            raise
+        return streamed_output
+
+    def _consume_stream(self, pooled_client: PooledClient, contents: list, config_for_generation: types.GenerateContentConfig, prompt: str, input_file_path_list: list[str], output_file_path_list_as_arg: list[str], call_metrics: CallMetrics, cancel_event: Optional[threading.Event]) -> StreamedOutput:
+        start = time.perf_counter()
+        streamed_output = StreamedOutput()
+        candidate_index_set = set()
+        response_bytes = 0
+        for chunk in pooled_client.client.models.generate_content_stream(model=self.model_name, contents=contents, config=config_for_generation):
+            if cancel_event is not None and cancel_event.is_set():
+                raise TimeoutError(f"The response has not been completed within {self.total_timeout_in_seconds} seconds.")
+            if chunk.usage_metadata:
+                streamed_output.usage_metadata = chunk.usage_metadata
+            for candidate in chunk.candidates or []:
+                candidate_index = candidate.index or 0
+                candidate_index_set.add(candidate_index)
+                for part in (candidate.content.parts or []) if candidate.content else []:
+                    if part.text is not None:
+                        logger.info(part.text)
+                        response_bytes += len(part.text.encode("utf-8"))
+                    elif part.inline_data is not None and part.inline_data.data is not None:
+                        if call_metrics.time_to_first_image_in_seconds is None:
+                            call_metrics.time_to_first_image_in_seconds = time.perf_counter() - start
+                        response_bytes += len(part.inline_data.data)
+                        output_image_paths = self.file_path_builder.build_output_file_path_list_of_list(candidate_index + 1, output_file_path_list_as_arg)[candidate_index]
+                        logger.info(f"Saving image of candidate {candidate_index}...")
+                        self._log_gemini_api_call(prompt, config_for_generation, input_file_path_list, output_image_paths)
+                        streamed_output.write_future_list.append(self.output_image_writer.submit([(part.inline_data.data, output_image_paths)], call_metrics=call_metrics))
+                        streamed_output.output_image_paths_list.append((candidate_index, output_image_paths))
+                        if self.result_cache:
+                            streamed_output.image_list_to_cache.append((candidate_index, part.inline_data.data, output_image_paths))
+        call_metrics.number_of_candidates = len(candidate_index_set)
+        call_metrics.response_bytes = response_bytes
+        if streamed_output.usage_metadata:
+            call_metrics.prompt_token_count = streamed_output.usage_metadata.prompt_token_count
+            call_metrics.candidates_token_count = streamed_output.usage_metadata.candidates_token_count
+            call_metrics.total_token_count = streamed_output.usage_metadata.total_token_count
+        logger.info(f"Number of candidates: {len(candidate_index_set)}")
+        return streamed_output
+
+    def _get_streamed_generation_result(self, streamed_output: StreamedOutput, result_cache_key: Optional[str], result_source_key: Optional[str], call_metrics: CallMetrics) -> GenerationResult:
+        if not call_metrics.number_of_candidates:
+            logger.error("No candidates in the response.")
+            return GenerationResult(False, retryable=True, error="No candidates in the response.")
+        if not streamed_output.write_future_list:
+            return GenerationResult(False, error="No image in the response.")
+        # In the order of the candidates, as with a response which is not streamed.
+        output_image_paths_list = [output_image_paths for (_, output_image_paths) in sorted(streamed_output.output_image_paths_list, key=lambda x: x[0])]
+        written_file_path_list = []
+        for output_image_paths in output_image_paths_list:
+            for output_image_path in output_image_paths:
+                if output_image_path not in written_file_path_list:
+                    written_file_path_list.append(output_image_path)
+
+        def on_written(_: list[str], error: Optional[Exception]) -> None:
+            if error is None and result_cache_key is not None:
+                image_list_to_cache = [(image_bytes, output_image_paths) for (_, image_bytes, output_image_paths) in sorted(streamed_output.image_list_to_cache, key=lambda x: x[0])]
+                self._put_result_in_cache(result_cache_key, image_list_to_cache, result_source_key)
+
+        result = GenerationResult(True).set_output_file_path_list(written_file_path_list)
+        result.write_future = gather_write_futures(streamed_output.write_future_list, on_written)
+        return result
+
+    def _record_response_in_call_metrics(self, response: types.GenerateContentResponse, call_metrics: CallMetrics) -> None:
+        call_metrics.number_of_candidates = len(response.candidates or [])
+        response_bytes = 0
+        for candidate in response.candidates or []:
+            for part in (candidate.content.parts or []) if candidate.content else []:
+                if part.inline_data is not None and part.inline_data.data is not None:
+                    response_bytes += len(part.inline_data.data)
+                elif part.text is not None:
+                    response_bytes += len(part.text.encode("utf-8"))
+        call_metrics.response_bytes = response_bytes
+        if response.usage_metadata:
+            call_metrics.prompt_token_count = response.usage_metadata.prompt_token_count
+            call_metrics.candidates_token_count = response.usage_metadata.candidates_token_count
+            call_metrics.total_token_count = response.usage_metadata.total_token_count
+
+    def _collect_images_to_write(self, response: types.GenerateContentResponse, output_file_path_list_as_arg: list[str]) -> list[tuple[bytes, list[str]]]:
+        """
+        Return (image bytes, output paths) of each inline image of `response`, with the candidate naming of FilePathBuilder.
+        """
+        number_of_candidates = len(response.candidates)
+        logger.info(f"Number of candidates: {number_of_candidates}")
+
+        output_image_path_list_of_list = self.file_path_builder.build_output_file_path_list_of_list(number_of_candidates, output_file_path_list_as_arg)
+
+        image_list_to_write = []
+        index = 0
+        for c in response.candidates:
+            log_payload("DEBUG", f"Candidate {index}:", c)
+            if not c.content:
+                logger.error("The candidate has no content.")
+                index += 1
+                continue
+            if not c.content.parts:
+                logger.error("The candidate has no content parts.")
+                index += 1
+                continue
+            for part in c.content.parts:
+                if part.text is not None:
+                    logger.info(part.text)
+                elif part.inline_data is not None:
+                    logger.info("Saving image...")
+                    image_list_to_write.append((part.inline_data.data, output_image_path_list_of_list[index]))
+            index += 1
+        return image_list_to_write
+
+    def _put_result_in_cache(self, result_cache_key: str, image_list: list[tuple[bytes, list[str]]], result_source_key: Optional[str] = None) -> None:
+        # One image per candidate. If a candidate has more than one image, the last one is on disk, and it is the one cached.
+        image_bytes_by_output_file_path: dict[str, bytes] = {}
+        for (image_bytes, output_image_paths) in image_list:
+            image_bytes_by_output_file_path[output_image_paths[0]] = image_bytes
+        try:
+            self.result_cache.put(result_cache_key, list(image_bytes_by_output_file_path.values()), result_source_key)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Failed to store the result in the result cache: {e}")
 
     def _show_response_info(self, response):
-        logger.debug(f"Response: {response}")
+        log_payload("DEBUG", "Response:", response)
         logger.info(f"Response type: {type(response)}")
         logger.info(f"Response candidates count: {len(response.candidates)}")
         for i, candidate in enumerate(response.candidates):
@@ -247,20 +810,56 @@ class ImageGeneratorForGemini(ImageGeneratorBase):
                     logger.info(f"Candidate {i} Part {j} is text with length {len(part.text)}")
                 elif part.inline_data is not None:
                     logger.info(f"Candidate {i} Part {j} is inline data with mime_type {part.inline_data.mime_type} and data length {len(part.inline_data.data)}")
-                elif part.uri is not None:
-                    logger.info(f"Candidate {i} Part {j} is uri: {part.uri}")
+                elif part.file_data is not None:
+                    logger.info(f"Candidate {i} Part {j} is file data with uri {part.file_data.file_uri}")
                 else:
                     logger.info(f"Candidate {i} Part {j} is unknown type")
 
+    def _create_client(self, api_key_config: dict) -> Optional[genai.Client]:
+        """
+        Create the client of one entry of `_get_api_key_config_list`. Returns None if it cannot be created.
+        """
+        api_key = api_key_config.get("api_key")
+        if not api_key:
+            logger.error(f"Gemini API key of {api_key_config['name']} is missing. Set {api_key_config['api_key_source']}.")
+            return None
+        if self.request_timeout_in_seconds is None:
+            return genai.Client(api_key=api_key)
+        # In milliseconds. The SDK applies it to each phase of a request, i.e. connect, write, read and pool, as a single timeout.
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(timeout=int(self.request_timeout_in_seconds * 1000)))
+
+    def _get_api_key_config_list(self, gemini_config: dict) -> list[dict]:
+        """
+        Return the API keys of `api_keys`, or the single `api_key` if there is no list.
+        `api_key_source` of an entry tells where its key is set, for error messages.
+        """
+        if gemini_config.get("api_keys"):
+            return [{"name": f"key-{i}", **api_key_config, "api_key_source": f"'api_key' of entry {i} of 'api_keys'"} for (i, api_key_config) in enumerate(gemini_config["api_keys"])]
+        return [{"name": "default", "api_key": gemini_config.get("api_key") or os.getenv("GEMINI_API_KEY"), "api_key_source": "'api_key' in config or GEMINI_API_KEY"}]
+
     def _initialize_gemini_client(self, gemini_config: dict) -> bool:
         if self.client is None:
-            api_key = gemini_config.get("api_key") or os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                logger.error("Gemini API key is missing. Set it in config or GEMINI_API_KEY.")
-                return False
-            self.client = genai.Client(api_key=api_key)
+            for api_key_config in self._get_api_key_config_list(gemini_config):
+                client = self._create_client(api_key_config)
+                if client is None:
+                    self.api_key_client_list = []
+                    return False
+                self.api_key_client_list.append((api_key_config, client))
+            self.client = self.api_key_client_list[0][1]
         return True
 
+    def _initialize_rate_limiter(self, gemini_config: dict) -> None:
+        self.model_name = gemini_config.get("model_name", self.model_name)
+        rate_limit_config = (gemini_config.get("rate_limits") or {}).get(self.model_name) or {}
+        client_pool_config = gemini_config.get("client_pool") or {}
+        self.client_pool = ClientPool(client_pool_config.get("eject_after_consecutive_errors", 3), client_pool_config.get("ejection_in_seconds", 60.0))
+        for (api_key_config, client) in self.api_key_client_list or [({"name": "default"}, self.client)]:
+            # A key's own budget takes precedence over that of the model.
+            requests_per_minute = api_key_config.get("requests_per_minute", rate_limit_config.get("requests_per_minute"))
+            tokens_per_minute = api_key_config.get("tokens_per_minute", rate_limit_config.get("tokens_per_minute"))
+            logger.info(f"Rate limits of {api_key_config['name']} for {self.model_name}: requests per minute: {requests_per_minute}, tokens per minute: {tokens_per_minute}")
+            self.client_pool.add(api_key_config["name"], client, AdaptiveRateLimiter(requests_per_minute, tokens_per_minute))
+
     def list_all_models(self):
         """
         List all available models from the Gemini API.
@@ -276,11 +875,89 @@ class ImageGeneratorForGemini(ImageGeneratorBase):
             except IndexError:
                 break
 
+    def export_batch_request_file(self, model_specific_config: dict, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, input_output_file_path_spec: InputOutputFilePathSpec, request_file_path: str, inline: bool = True) -> bool:
+        """
+        Write a JSONL batch request file for the spec instead of calling the API one by one.
+        """
+        self.model_name = model_specific_config.get("model_name", self.model_name)
+        builder = BatchRequestFileBuilder(self.model_name, self._get_generate_content_config(image_generator_generate_content_config), image_generator_generate_content_config.get_prompt(), inline)
+        if self.input_image_preprocessor:
+            input_image_preprocessor = self.input_image_preprocessor
+
+            def load_prepared_input(input_file_path: str) -> tuple[bytes, str]:
+                prepared = input_image_preprocessor.prepare(input_file_path)
+                return (prepared.data, prepared.mime_type)
+
+            builder.set_input_loader(load_prepared_input)
+        if not inline:
+            if not self._initialize_gemini_client(model_specific_config):
+                return False
+            builder.set_input_referencer(self._get_batch_input_referencer())
+        try:
+            builder.build(input_output_file_path_spec, request_file_path)
+        except (APIError, httpx.TimeoutException, httpx.TransportError, OSError, ValueError) as e:
+            logger.error(f"Failed to write the batch request file: {e}")
+            return False
+        logger.info(f"Manifest: {get_manifest_file_path(request_file_path)}")
+        return True
+
+    def _get_batch_input_referencer(self) -> Callable[[str], tuple[str, str]]:
+        """
+        Return an input referencer which uploads each distinct input once with the Files API of the first API key, the project which submits the batch.
+        With an input upload cache, an upload of an earlier run or export is reused until it is about to expire.
+        """
+        (api_key_config, client) = self.api_key_client_list[0]
+        # Content hash -> (file URI, MIME type) of the uploads of this export, without an input upload cache.
+        uploaded_by_content_hash: dict[str, tuple[str, str]] = {}
+
+        def reference_input(input_file_path: str) -> tuple[str, str]:
+            image_file = self.input_image_preprocessor.prepare(input_file_path) if self.input_image_preprocessor else None
+            content_hash = self._get_input_bytes_digest(image_file, input_file_path)
+            upload = functools.partial(self._upload_input_image, client, image_file, input_file_path)
+            if self.input_upload_cache:
+                (file_uri, mime_type, _) = self.input_upload_cache.get_or_upload(api_key_config["name"], content_hash, self._get_input_size_in_bytes(image_file, input_file_path), upload)
+                return (file_uri, mime_type)
+            if content_hash not in uploaded_by_content_hash:
+                (file_uri, mime_type, _) = upload()
+                uploaded_by_content_hash[content_hash] = (file_uri, mime_type)
+            return uploaded_by_content_hash[content_hash]
+
+        return reference_input
+
+    def import_batch_result_file(self, result_file_path: str, manifest_file_path: str) -> bool:
+        """
+        Write the images of a JSONL batch result file to the output paths recorded in the manifest.
+        """
+
+        def write_images(response: types.GenerateContentResponse, output_file_path_list: list[str]) -> int:
+            if not response.candidates:
+                return 0
+            image_list_to_write = self._collect_images_to_write(response, output_file_path_list)
+            if image_list_to_write:
+                self.output_image_writer.submit(image_list_to_write)
+            return len(image_list_to_write)
+
+        ingester = BatchResultFileIngester(write_images)
+        result = ingester.ingest(result_file_path, manifest_file_path)
+        self.output_image_writer.flush()
+        self.output_image_writer.show_stats()
+        return result and ingester.count_failure == 0 and self.output_image_writer.count_failures == 0
+
     def do_generation(self, model_specific_config: dict, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, input_output_file_path_spec: InputOutputFilePathSpec) -> bool:
         """
         Perform image generation using the Gemini API.
         """
-        r = self._initialize_gemini_client(model_specific_config)
+        r = self.initialize(model_specific_config)
         if not r:
             return False
         return self.generate_one_batch_of_images(input_output_file_path_spec, image_generator_generate_content_config)
+
+    def initialize(self, model_specific_config: dict) -> bool:
+        """
+        Create the clients and the rate limiters, so that `generate_one_batch_of_images` can be called one or more times.
+        """
+        r = self._initialize_gemini_client(model_specific_config)
+        if not r:
+            return False
+        self._initialize_rate_limiter(model_specific_config)
+        return True
@@ -0,0 +1,269 @@
+"""
+Define ImageGeneratorForSimulation class, a simulated backend for load testing without any API call.
+"""
+from datetime import datetime, timezone
+import hashlib
+from io import BytesIO
+import math
+import random
+import threading
+import time
+from typing import Iterator, Optional
+
+from google.genai import types
+from google.genai.errors import ClientError, ServerError
+import httpx
+from loguru import logger
+from PIL import Image
+
+from src.image_generator.image_generator_for_gemini import ImageGeneratorForGemini
+from src.image_generator.simulation_enum import SimulationEnum
+
+
+class SimulatedFiles:
+    """
+    A stand-in for `genai.Client().files`. Uploaded files are kept in memory and expire after `file_ttl_in_seconds`.
+    """
+
+    def __init__(self, simulation_config: dict):
+        self.file_ttl_in_seconds = simulation_config.get("file_ttl_in_seconds", 48 * 3600)
+        # File URI -> (name, expires at)
+        self.file_by_uri: dict[str, tuple[str, float]] = {}
+        self.count_uploads = 0
+        self.lock = threading.Lock()
+
+    def upload(self, file, config=None) -> types.File:
+        if isinstance(file, str):
+            with open(file, mode="rb") as f:
+                data = f.read()
+        else:
+            data = file.read()
+        mime_type = config.get("mime_type") if isinstance(config, dict) else getattr(config, "mime_type", None)
+        with self.lock:
+            self.count_uploads += 1
+            name = f"files/{hashlib.sha256(data).hexdigest()[:12]}-{self.count_uploads}"
+            uri = f"https://simulated.invalid/v1beta/{name}"
+            expires_at = time.time() + self.file_ttl_in_seconds
+            self.file_by_uri[uri] = (name, expires_at)
+        return types.File(
+            name=name,
+            uri=uri,
+            mime_type=mime_type,
+            size_bytes=len(data),
+            expiration_time=datetime.fromtimestamp(expires_at, tz=timezone.utc),
+            state=types.FileState.ACTIVE
+        )
+
+    def delete(self, name: str, config=None) -> None:  # pylint: disable=unused-argument
+        with self.lock:
+            self.file_by_uri = {uri: x for (uri, x) in self.file_by_uri.items() if x[0] != name}
+
+    def list(self, config=None) -> list[types.File]:  # pylint: disable=unused-argument
+        with self.lock:
+            return [types.File(name=name, uri=uri) for (uri, (name, _)) in self.file_by_uri.items()]
+
+    def is_active(self, uri: str) -> bool:
+        with self.lock:
+            file = self.file_by_uri.get(uri)
+        return file is not None and file[1] > time.time()
+
+
+class SimulatedModels:
+    """
+    A stand-in for `genai.Client().models` which returns synthetic images.
+    Every random draw comes from a generator seeded by the seed, the request content and how many times the same request has been made,
+    so that a run is reproducible regardless of the order in which threads send requests.
+    A wait longer than `request_timeout_in_seconds` for a response or a chunk raises a read timeout after that time, as the HTTP client of the SDK does.
+    """
+
+    def __init__(self, simulation_config: dict, files: SimulatedFiles, request_timeout_in_seconds: Optional[float] = None):
+        self.files = files
+        self.request_timeout_in_seconds = request_timeout_in_seconds
+        self.seed = simulation_config.get("seed", 0)
+        latency_config = simulation_config.get("latency") or {}
+        self.latency_distribution = latency_config.get("distribution", SimulationEnum.const_distribution_lognormal)
+        self.latency_median_in_seconds = latency_config.get("median_in_seconds", 1.0)
+        self.latency_sigma = latency_config.get("sigma", 0.5)
+        self.time_scale = simulation_config.get("time_scale", 1.0)
+        self.error_rate = simulation_config.get("error_rate", 0.0)
+        self.throttle_rate = simulation_config.get("throttle_rate", 0.0)
+        self.retry_delay_in_seconds = simulation_config.get("retry_delay_in_seconds", 1.0)
+        self.number_of_candidates = simulation_config.get("number_of_candidates", 1)
+        self.image_size = tuple(simulation_config.get("image_size", [256, 256]))
+        self.count_calls_by_request_key: dict[str, int] = {}
+        self.count_calls = 0
+        self.count_errors = 0
+        self.count_throttles = 0
+        self.count_timeouts = 0
+        # The requests being served now, and the most at a time so far.
+        self.count_in_flight = 0
+        self.max_count_in_flight = 0
+        self.lock = threading.Lock()
+
+    def _get_request_key(self, model: str, contents: list) -> str:
+        hasher = hashlib.sha256(model.encode("utf-8"))
+        for content in contents:
+            if isinstance(content, str):
+                hasher.update(content.encode("utf-8"))
+            elif isinstance(content, types.Part) and content.inline_data is not None:
+                hasher.update(content.inline_data.data)
+            elif isinstance(content, types.Part) and content.file_data is not None:
+                hasher.update(str(content.file_data.file_uri).encode("utf-8"))
+            elif isinstance(content, Image.Image):
+                hasher.update(content.tobytes())
+            else:
+                hasher.update(repr(content).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def _get_random_generator(self, model: str, contents: list) -> random.Random:
+        request_key = self._get_request_key(model, contents)
+        with self.lock:
+            call_index = self.count_calls_by_request_key.get(request_key, 0)
+            self.count_calls_by_request_key[request_key] = call_index + 1
+            self.count_calls += 1
+        return random.Random(f"{self.seed}:{request_key}:{call_index}")
+
+    def _draw_latency_in_seconds(self, random_generator: random.Random) -> float:
+        if self.latency_distribution == SimulationEnum.const_distribution_constant:
+            return self.latency_median_in_seconds
+        if self.latency_distribution == SimulationEnum.const_distribution_uniform:
+            return random_generator.uniform(0, 2 * self.latency_median_in_seconds)
+        return random_generator.lognormvariate(math.log(max(self.latency_median_in_seconds, 1e-9)), self.latency_sigma)
+
+    def _make_image_bytes(self, random_generator: random.Random) -> bytes:
+        color = (random_generator.randrange(256), random_generator.randrange(256), random_generator.randrange(256))
+        bytesio = BytesIO()
+        Image.new("RGB", self.image_size, color).save(bytesio, format="PNG")
+        return bytesio.getvalue()
+
+    def _start_request(self, model: str, contents: list, config: types.GenerateContentConfig = None) -> tuple[random.Random, float, float, int]:
+        """
+        Return (random generator, latency in seconds, draw of the outcome, number of candidates) of a request.
+        """
+        random_generator = self._get_random_generator(model, contents)
+        latency_in_seconds = self._draw_latency_in_seconds(random_generator) * self.time_scale
+        draw = random_generator.random()
+        for content in contents:
+            if isinstance(content, types.Part) and content.file_data is not None and not self.files.is_active(content.file_data.file_uri):
+                with self.lock:
+                    self.count_errors += 1
+                raise ClientError(403, {"error": {"code": 403, "status": "PERMISSION_DENIED", "message": f"You do not have permission to access the File {content.file_data.file_uri} or it may not exist."}})
+        number_of_candidates = (config.candidate_count if config else None) or self.number_of_candidates
+        return (random_generator, latency_in_seconds, draw, number_of_candidates)
+
+    def _enter(self) -> None:
+        with self.lock:
+            self.count_in_flight += 1
+            self.max_count_in_flight = max(self.max_count_in_flight, self.count_in_flight)
+
+    def _leave(self) -> None:
+        with self.lock:
+            self.count_in_flight -= 1
+
+    def _wait_for_response(self, latency_in_seconds: float) -> None:
+        if self.request_timeout_in_seconds is not None and latency_in_seconds > self.request_timeout_in_seconds:
+            time.sleep(self.request_timeout_in_seconds)
+            with self.lock:
+                self.count_timeouts += 1
+            raise httpx.ReadTimeout("Simulated read timeout.")
+        if latency_in_seconds > 0:
+            time.sleep(latency_in_seconds)
+
+    def _raise_simulated_error(self, draw: float) -> None:
+        if draw < self.throttle_rate:
+            with self.lock:
+                self.count_throttles += 1
+            raise ClientError(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Simulated quota exhaustion.", "details": [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{self.retry_delay_in_seconds * self.time_scale}s"}
+            ]}})
+        if draw < self.throttle_rate + self.error_rate:
+            with self.lock:
+                self.count_errors += 1
+            raise ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE", "message": "Simulated server error."}})
+
+    def _make_candidate(self, random_generator: random.Random, index: int) -> types.Candidate:
+        part = types.Part(inline_data=types.Blob(mime_type="image/png", data=self._make_image_bytes(random_generator)))
+        return types.Candidate(index=index, content=types.Content(role="model", parts=[part]), finish_reason=types.FinishReason.STOP)
+
+    def _make_usage_metadata(self, contents: list, number_of_candidates: int) -> types.GenerateContentResponseUsageMetadata:
+        const_tokens_per_output_image = 1290
+        number_of_output_tokens = const_tokens_per_output_image * number_of_candidates
+        number_of_prompt_tokens = 258 * sum(1 for x in contents if not isinstance(x, str)) + sum(len(x) // 4 for x in contents if isinstance(x, str))
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=number_of_prompt_tokens,
+            candidates_token_count=number_of_output_tokens,
+            total_token_count=number_of_prompt_tokens + number_of_output_tokens
+        )
+
+    def generate_content(self, model: str, contents: list, config: types.GenerateContentConfig = None) -> types.GenerateContentResponse:
+        (random_generator, latency_in_seconds, draw, number_of_candidates) = self._start_request(model, contents, config)
+        self._enter()
+        try:
+            self._wait_for_response(latency_in_seconds)
+        finally:
+            self._leave()
+        self._raise_simulated_error(draw)
+        candidates = [self._make_candidate(random_generator, i) for i in range(number_of_candidates)]
+        return types.GenerateContentResponse(candidates=candidates, usage_metadata=self._make_usage_metadata(contents, number_of_candidates))
+
+    def generate_content_stream(self, model: str, contents: list, config: types.GenerateContentConfig = None) -> Iterator[types.GenerateContentResponse]:
+        """
+        Yield one chunk per candidate. The latency is spread over the chunks, so that the first image arrives after a part of it.
+        The images are the same as those of `generate_content` for the same request.
+        """
+        (random_generator, latency_in_seconds, draw, number_of_candidates) = self._start_request(model, contents, config)
+        for i in range(number_of_candidates):
+            self._enter()
+            try:
+                self._wait_for_response(latency_in_seconds / number_of_candidates)
+            finally:
+                self._leave()
+            if i == 0:
+                self._raise_simulated_error(draw)
+            usage_metadata = self._make_usage_metadata(contents, number_of_candidates) if i == number_of_candidates - 1 else None
+            yield types.GenerateContentResponse(candidates=[self._make_candidate(random_generator, i)], usage_metadata=usage_metadata)
+
+    def list(self, config: dict = None) -> list:  # pylint: disable=unused-argument
+        return [types.Model(name="models/simulated-image-model", display_name="Simulated image model")]
+
+
+class SimulatedClient:
+
+    def __init__(self, simulation_config: dict, request_timeout_in_seconds: Optional[float] = None):
+        self.files = SimulatedFiles(simulation_config)
+        self.models = SimulatedModels(simulation_config, self.files, request_timeout_in_seconds)
+
+
+class ImageGeneratorForSimulation(ImageGeneratorForGemini):
+    """
+    The Gemini pipeline with a simulated client. Scheduling, rate limiting, retries, caches and output writing all run as usual.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.model_name = SimulationEnum.const_model_name
+
+    def _get_api_key_config_list(self, gemini_config: dict) -> list[dict]:
+        """
+        Return the keys with the simulation settings. A key may override them, e.g. to simulate a key which is throttled more often.
+        """
+        return [{**gemini_config, **api_key_config} for api_key_config in super()._get_api_key_config_list(gemini_config)]
+
+    def _create_client(self, api_key_config: dict) -> SimulatedClient:
+        logger.info(f"Using the simulated backend for {api_key_config['name']}. No API call is made.")
+        return SimulatedClient(api_key_config, self.request_timeout_in_seconds)
+
+    def list_all_models(self):
+        for model in self.client.models.list():
+            logger.info(model)
+
+    def show_simulation_stats(self) -> None:
+        for (api_key_config, client) in self.api_key_client_list:
+            models = client.models
+            logger.info(f"[Simulation] {api_key_config['name']}: Calls: {models.count_calls}, Simulated errors: {models.count_errors}, Simulated throttles: {models.count_throttles}, Simulated timeouts: {models.count_timeouts}, Max in flight: {models.max_count_in_flight}, Uploads: {client.files.count_uploads}")
+
+    def generate_one_batch_of_images(self, input_output_file_path_spec, image_generator_generate_content_config) -> bool:
+        result = super().generate_one_batch_of_images(input_output_file_path_spec, image_generator_generate_content_config)
+        if self.client:
+            self.show_simulation_stats()
+        return result
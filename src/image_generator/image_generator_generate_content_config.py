@@ -1,3 +1,6 @@
+import json
+
+
 class ImageGeneratorGenerateContentConfig:
 
     def __init__(self):
@@ -13,6 +16,9 @@ class ImageGeneratorGenerateContentConfig:
     def set_top_p(self, top_p: float) -> None:
         self.optional_config['top_p'] = top_p
 
+    def set_candidate_count(self, candidate_count: int) -> None:
+        self.optional_config['candidate_count'] = candidate_count
+
     def get_prompt(self) -> str:
         return self.prompt
 
@@ -21,3 +27,24 @@ class ImageGeneratorGenerateContentConfig:
 
     def get_top_p(self) -> float | None:
         return self.optional_config.get('top_p')
+
+    def get_candidate_count(self) -> int | None:
+        return self.optional_config.get('candidate_count')
+
+    def get_optional_config_json(self) -> str:
+        return json.dumps(self.optional_config, sort_keys=True)
+
+
+def build_image_generator_generate_content_config(generate_content_config_entry: dict) -> ImageGeneratorGenerateContentConfig:
+    """
+    Return the config of one entry of generate_content_config.yaml.
+    """
+    image_generator_generate_content_config = ImageGeneratorGenerateContentConfig()
+    image_generator_generate_content_config.set_prompt(generate_content_config_entry.get('prompt', None))
+    if 'temperature' in generate_content_config_entry:
+        image_generator_generate_content_config.set_temperature(generate_content_config_entry['temperature'])
+    if 'top_p' in generate_content_config_entry:
+        image_generator_generate_content_config.set_top_p(generate_content_config_entry['top_p'])
+    if 'candidate_count' in generate_content_config_entry:
+        image_generator_generate_content_config.set_candidate_count(generate_content_config_entry['candidate_count'])
+    return image_generator_generate_content_config
@@ -0,0 +1,134 @@
+"""
+Define InputDeduplicator class.
+"""
+import os
+from typing import Optional
+
+from loguru import logger
+from PIL import Image, UnidentifiedImageError
+
+from src.image_generator.input_file_index import InputFileIndex
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.result_cache import compute_file_digest
+
+
+def compute_difference_hash(file_path: str) -> int:
+    """
+    Return the 64-bit difference hash (dHash) of an image: whether each pixel is brighter than its right neighbor in a 9 x 8 grayscale thumbnail.
+    Re-saved, re-compressed or resized copies of an image have the same or a close hash.
+    """
+    with Image.open(file_path) as image:
+        # A JPEG is decoded at a reduced scale. The thumbnail does not need the full resolution.
+        image.draft("L", (64, 64))
+        pixels = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR).tobytes()
+    difference_hash = 0
+    for row in range(8):
+        for column in range(8):
+            difference_hash = (difference_hash << 1) | int(pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return difference_hash
+
+
+class InputDeduplicator:
+    """
+    Collapse work items whose input images have the same content into one item, so that one API call is made for them.
+    The output paths of the collapsed items are appended to the output paths of the first one,
+    and the generated images are fanned out to all of them by OutputImageWriter.
+    Input files are compared by the SHA-256 of their bytes, or by a perceptual hash if `flag_perceptual` is set,
+    in which case images whose hashes differ in at most `max_hamming_distance` bits are near-duplicates.
+    Each input file is hashed once, so a pair of directories costs N + M hashes, not N x M.
+    """
+
+    def __init__(self, input_file_index: Optional[InputFileIndex] = None, flag_perceptual: bool = False, max_hamming_distance: int = 4):
+        self.input_file_index = input_file_index
+        self.flag_perceptual = flag_perceptual
+        self.max_hamming_distance = max_hamming_distance
+        # Input file path -> key of its content
+        self.content_key_by_file_path: dict[str, str] = {}
+        self.content_key_by_content_hash: dict[str, str] = {}
+        self.content_key_set: set[str] = set()
+        # (perceptual hash, content key) of the first image of each group of near-duplicates
+        self.perceptual_hash_list: list[tuple[int, str]] = []
+        self.count_items = 0
+        self.count_calls = 0
+        self.count_duplicate_files = 0
+
+    def deduplicate(self, input_output_file_path_spec: InputOutputFilePathSpec) -> InputOutputFilePathSpec:
+        """
+        Return a spec with one item per distinct combination of input contents, in the order of their first occurrence.
+        Items whose inputs cannot be read are kept as they are, so that they fail as usual.
+        """
+        output_file_path_list_by_key: dict[tuple[str, ...], list[str]] = {}
+        input_file_path_list_by_key: dict[tuple[str, ...], tuple[str, ...]] = {}
+        count_items = 0
+        for item in input_output_file_path_spec.iter_items():
+            count_items += 1
+            key = tuple(self._get_content_key(input_file_path) for input_file_path in item.input_file_path_list)
+            if key not in output_file_path_list_by_key:
+                output_file_path_list_by_key[key] = list(item.output_file_path_list)
+                input_file_path_list_by_key[key] = item.input_file_path_list
+            else:
+                output_file_path_list_by_key[key].extend(item.output_file_path_list)
+        spec = InputOutputFilePathSpec()
+        for (key, output_file_path_list) in output_file_path_list_by_key.items():
+            spec.add_item_with_lists(list(input_file_path_list_by_key[key]), output_file_path_list)
+        self.record_collapsed(count_items, spec.get_number_of_items())
+        return spec
+
+    def group_input_files(self, dir_path: str, file_name_list: list[str]) -> list[list[str]]:
+        """
+        Return the file names of `dir_path` grouped by content, in the order of their first occurrence.
+        A lazy spec is built from the groups, so that it is deduplicated without making its items up front.
+        """
+        file_name_list_by_content_key: dict[str, list[str]] = {}
+        for file_name in file_name_list:
+            file_name_list_by_content_key.setdefault(self._get_content_key(os.path.join(dir_path, file_name)), []).append(file_name)
+        return list(file_name_list_by_content_key.values())
+
+    def record_collapsed(self, count_items: int, count_calls: int) -> None:
+        self.count_items += count_items
+        self.count_calls += count_calls
+        logger.info(f"[InputDeduplicator] {count_items} item(s) -> {count_calls} call(s). Saved {count_items - count_calls} call(s).")
+
+    def get_count_saved_calls(self) -> int:
+        return self.count_items - self.count_calls
+
+    def _get_content_key(self, input_file_path: str) -> str:
+        content_key = self.content_key_by_file_path.get(input_file_path)
+        if content_key is not None:
+            return content_key
+        try:
+            content_hash = self._get_content_hash(input_file_path)
+            content_key = self.content_key_by_content_hash.get(content_hash)
+            if content_key is None:
+                # Byte-identical files have the same perceptual hash. Only a new content is decoded.
+                content_key = self._get_perceptual_content_key(input_file_path, content_hash) if self.flag_perceptual else content_hash
+                self.content_key_by_content_hash[content_hash] = content_key
+        except (OSError, UnidentifiedImageError) as e:
+            logger.warning(f"[InputDeduplicator] Could not hash {input_file_path}: {e}")
+            # Unique, so that the item is not merged with another.
+            content_key = f"path:{os.path.abspath(input_file_path)}"
+        if content_key in self.content_key_set:
+            self.count_duplicate_files += 1
+        self.content_key_set.add(content_key)
+        self.content_key_by_file_path[input_file_path] = content_key
+        return content_key
+
+    def _get_content_hash(self, input_file_path: str) -> str:
+        if self.input_file_index:
+            entry = self.input_file_index.get_entry(input_file_path)
+            if entry is not None:
+                stat_result = os.stat(input_file_path)
+                if (entry.size, entry.mtime_ns) == (stat_result.st_size, stat_result.st_mtime_ns):
+                    return entry.content_hash
+        return compute_file_digest(input_file_path)
+
+    def _get_perceptual_content_key(self, input_file_path: str, content_hash: str) -> str:
+        difference_hash = compute_difference_hash(input_file_path)
+        for (other_difference_hash, other_content_key) in self.perceptual_hash_list:
+            if (difference_hash ^ other_difference_hash).bit_count() <= self.max_hamming_distance:
+                return other_content_key
+        self.perceptual_hash_list.append((difference_hash, content_hash))
+        return content_hash
+
+    def show_stats(self) -> None:
+        logger.info(f"[InputDeduplicator] Items: {self.count_items}, Calls: {self.count_calls}, Saved calls: {self.get_count_saved_calls()}, Duplicate input files: {self.count_duplicate_files}")
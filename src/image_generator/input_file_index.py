@@ -0,0 +1,203 @@
+"""
+Define InputFileIndex class and helper functions to discover input image files.
+"""
+import hashlib
+from io import BytesIO
+import os
+import sqlite3
+import threading
+from typing import Iterator, Optional
+
+from loguru import logger
+from PIL import Image, UnidentifiedImageError
+
+
+class InputFileIndexEnum:
+    const_format_png = "png"
+    const_format_jpeg = "jpeg"
+    const_format_webp = "webp"
+    const_format_avif = "avif"
+
+
+def is_input_image_file_name(file_name: str) -> bool:
+    """
+    Return True if `file_name` has an extension of a supported input image format, in any case, e.g. '.JPG'.
+    Hidden files, e.g. temporary files of a copy in progress, are not input images.
+    """
+    const_file_extension_tuple = (".png", ".jpg", ".jpeg", ".webp", ".avif")
+    return not file_name.startswith(".") and file_name.lower().endswith(const_file_extension_tuple)
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """
+    Return the image format from the magic number at the head of a file, or None if it is not a supported format.
+    """
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return InputFileIndexEnum.const_format_png
+    if header.startswith(b"\xff\xd8\xff"):
+        return InputFileIndexEnum.const_format_jpeg
+    if header[0:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return InputFileIndexEnum.const_format_webp
+    if header[4:8] == b"ftyp" and header[8:12] in (b"avif", b"avis"):
+        return InputFileIndexEnum.const_format_avif
+    return None
+
+
+def iterate_input_image_files(dir_path: str, recursive: bool = False) -> Iterator[tuple[str, os.DirEntry]]:
+    """
+    Yield (path relative to `dir_path`, directory entry) of each input image file with `os.scandir`.
+    Only the directories are read. The files are neither opened nor stat'ed, unless the file system does not report file types.
+    Symbolic links to directories are not followed, so that a link cycle does not make the walk endless.
+    Errors reading `dir_path` itself are propagated to the caller. Errors reading subdirectories are logged and skipped.
+    """
+    dir_path_list = [""]
+    while dir_path_list:
+        relative_dir_path = dir_path_list.pop()
+        try:
+            with os.scandir(os.path.join(dir_path, relative_dir_path) if relative_dir_path else dir_path) as it:
+                for entry in it:
+                    relative_path = os.path.join(relative_dir_path, entry.name) if relative_dir_path else entry.name
+                    if recursive and not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False):
+                        dir_path_list.append(relative_path)
+                    elif is_input_image_file_name(entry.name) and entry.is_file():
+                        yield (relative_path, entry)
+        except OSError as e:
+            if not relative_dir_path:
+                raise
+            logger.error(f"Error reading directory: {e}")
+
+
+def list_input_image_files(dir_path: str, recursive: bool = False) -> list[str]:
+    """
+    Return the sorted paths, relative to `dir_path`, of the input image files.
+    """
+    return sorted(relative_path for (relative_path, _) in iterate_input_image_files(dir_path, recursive))
+
+
+class InputFileIndexEntry:
+    """
+    What is known about one input file: its size and mtime when it was indexed, its SHA-256 and its dimensions.
+    `image_format` is None if the content is not a supported image, whatever its extension is.
+    """
+
+    __slots__ = ('size', 'mtime_ns', 'content_hash', 'width', 'height', 'image_format')
+
+    def __init__(self, size: int, mtime_ns: int, content_hash: str, width: Optional[int], height: Optional[int], image_format: Optional[str]):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.content_hash = content_hash
+        self.width = width
+        self.height = height
+        self.image_format = image_format
+
+
+class InputFileIndex:
+    """
+    A persistent index of input files: path -> (size, mtime, content hash, dimensions).
+    A scan stats every file, but reads, sniffs and hashes only the files which are new or whose size or mtime changed.
+    Files which are new or modified since the index was last saved are reported by `scan`, so that a run can process only them.
+    Changes are kept in memory until `save`, e.g. at the end of a successful run, so that an interrupted run reports them again.
+    The index is a SQLite database.
+    """
+
+    def __init__(self, index_file_path: str):
+        self.index_file_path = index_file_path
+        os.makedirs(os.path.dirname(os.path.abspath(index_file_path)), exist_ok=True)
+        self.connection = sqlite3.connect(index_file_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS input_file (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, content_hash TEXT NOT NULL, width INTEGER, height INTEGER, image_format TEXT)")
+        self.entries: dict[str, InputFileIndexEntry] = {}
+        for row in self.connection.execute("SELECT path, size, mtime_ns, content_hash, width, height, image_format FROM input_file"):
+            self.entries[row[0]] = InputFileIndexEntry(*row[1:])
+        self.changed_entries: dict[str, InputFileIndexEntry] = {}
+        self.removed_path_set: set[str] = set()
+        self.count_files = 0
+        self.count_hashed = 0
+        self.count_not_images = 0
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def get_entry(self, file_path: str) -> Optional[InputFileIndexEntry]:
+        key = os.path.abspath(file_path)
+        with self.lock:
+            return self.changed_entries.get(key) or self.entries.get(key)
+
+    def scan(self, dir_path: str, recursive: bool = False) -> tuple[list[str], set[str]]:
+        """
+        Return the sorted paths, relative to `dir_path`, of the input image files whose content is an image,
+        and the set of those which are new or modified since the index was saved.
+        Errors reading `dir_path` are propagated to the caller.
+        """
+        file_name_list = []
+        changed_file_name_set = set()
+        seen_path_set = set()
+        for (relative_path, dir_entry) in iterate_input_image_files(dir_path, recursive):
+            stat_result = dir_entry.stat()
+            key = os.path.abspath(os.path.join(dir_path, relative_path))
+            seen_path_set.add(key)
+            self.count_files += 1
+            with self.lock:
+                entry = self.changed_entries.get(key) or self.entries.get(key)
+            if entry is None or entry.size != stat_result.st_size or entry.mtime_ns != stat_result.st_mtime_ns:
+                entry = self._index_file(key, stat_result)
+                if entry is None:
+                    continue
+                with self.lock:
+                    self.changed_entries[key] = entry
+            if entry.image_format is None:
+                self.count_not_images += 1
+                logger.warning(f"Skipping {key}: the content is not a supported image.")
+                continue
+            file_name_list.append(relative_path)
+            if key in self.changed_entries:
+                changed_file_name_set.add(relative_path)
+        # Forget the files which were removed, so that they are new if they come back.
+        prefix = os.path.join(os.path.abspath(dir_path), "")
+        with self.lock:
+            for key in self.entries:
+                if key.startswith(prefix) and key not in seen_path_set and (recursive or os.sep not in key[len(prefix):]):
+                    self.removed_path_set.add(key)
+        file_name_list.sort()
+        logger.info(f"[InputFileIndex] {dir_path}: {len(file_name_list)} image file(s), {len(changed_file_name_set)} new or modified.")
+        return (file_name_list, changed_file_name_set)
+
+    def _index_file(self, key: str, stat_result: os.stat_result) -> Optional[InputFileIndexEntry]:
+        try:
+            with open(key, mode="rb") as f:
+                data = f.read()
+        except OSError as e:
+            logger.error(f"Error reading file: {e}")
+            return None
+        self.count_hashed += 1
+        image_format = sniff_image_format(data[:16])
+        (width, height) = (None, None)
+        if image_format is not None:
+            try:
+                # Only the header is parsed. The pixels are not decoded.
+                with Image.open(BytesIO(data)) as image:
+                    (width, height) = image.size
+            except (UnidentifiedImageError, OSError) as e:
+                logger.warning(f"Could not read the dimensions of {key}: {e}")
+        return InputFileIndexEntry(stat_result.st_size, stat_result.st_mtime_ns, hashlib.sha256(data).hexdigest(), width, height, image_format)
+
+    def save(self) -> None:
+        """
+        Write the changes since the last save to the index.
+        """
+        with self.lock:
+            row_list = [(key, x.size, x.mtime_ns, x.content_hash, x.width, x.height, x.image_format) for (key, x) in self.changed_entries.items()]
+            with self.connection:
+                self.connection.executemany("DELETE FROM input_file WHERE path = ?", [(key,) for key in self.removed_path_set])
+                self.connection.executemany("INSERT OR REPLACE INTO input_file (path, size, mtime_ns, content_hash, width, height, image_format) VALUES (?, ?, ?, ?, ?, ?, ?)", row_list)
+            for key in self.removed_path_set:
+                self.entries.pop(key, None)
+            self.entries.update(self.changed_entries)
+            self.changed_entries = {}
+            self.removed_path_set = set()
+        logger.info(f"[InputFileIndex] Saved {len(row_list)} new or modified file(s) to {self.index_file_path}.")
+
+    def show_stats(self) -> None:
+        logger.info(f"[InputFileIndex] Files: {self.count_files}, Hashed: {self.count_hashed}, Not images: {self.count_not_images}, Indexed: {len(self.entries) + len(self.changed_entries)}")
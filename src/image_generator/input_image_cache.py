@@ -0,0 +1,87 @@
+"""
+Define InputImageCache class.
+"""
+from collections import OrderedDict
+import os
+import threading
+from typing import Callable, Optional
+
+from loguru import logger
+from PIL import Image
+
+from src.image_generator.input_image_preprocessor import PreparedInputImage
+
+
+def get_image_size_in_bytes(image: Image.Image) -> int:
+    """
+    Return the approximate size of the decoded pixels of `image` without copying them.
+    """
+    (width, height) = image.size
+    bytes_per_band = 4 if image.mode in ("I", "F") else 1
+    return max(1, width * height * len(image.getbands()) * bytes_per_band)
+
+
+def get_cached_input_image_size_in_bytes(input_image: "Image.Image | PreparedInputImage") -> int:
+    if isinstance(input_image, PreparedInputImage):
+        return len(input_image.data)
+    return get_image_size_in_bytes(input_image)
+
+
+class InputImageCache:
+    """
+    A memory-bounded LRU cache of loaded input images, either decoded or preprocessed.
+    A key is (path, mtime, size) of the file so that a modified file is loaded again.
+    Images in the cache are shared. Do not modify them in place.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries: OrderedDict[tuple[str, int, int], tuple[Image.Image | PreparedInputImage, int]] = OrderedDict()
+        self.count_hits = 0
+        self.count_misses = 0
+        self.count_evictions = 0
+        self.lock = threading.Lock()
+
+    def get_or_load(self, file_path: str, loader: Callable[[str], "Image.Image | PreparedInputImage"]) -> "Image.Image | PreparedInputImage":
+        """
+        Return the cached image of `file_path`, or load it with `loader` and cache it.
+        Errors raised by `os.stat` or `loader` are propagated to the caller.
+        """
+        stat_result = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat_result.st_mtime_ns, stat_result.st_size)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.count_hits += 1
+                return entry[0]
+            self.count_misses += 1
+        image = loader(file_path)
+        self._put(key, image)
+        return image
+
+    def _put(self, key: tuple[str, int, int], image: "Image.Image | PreparedInputImage") -> None:
+        size_in_bytes = get_cached_input_image_size_in_bytes(image)
+        if size_in_bytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (image, size_in_bytes)
+            self.current_bytes += size_in_bytes
+            while self.current_bytes > self.max_bytes:
+                (_, (_, evicted_size_in_bytes)) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size_in_bytes
+                self.count_evictions += 1
+
+    def get_hit_ratio(self) -> Optional[float]:
+        count_lookups = self.count_hits + self.count_misses
+        if count_lookups == 0:
+            return None
+        return self.count_hits / count_lookups
+
+    def show_stats(self) -> None:
+        hit_ratio = self.get_hit_ratio()
+        hit_ratio_string = "N/A" if hit_ratio is None else f"{hit_ratio:.1%}"
+        logger.info(f"[InputImageCache] Hits: {self.count_hits}, Misses: {self.count_misses}, Hit ratio: {hit_ratio_string}, Evictions: {self.count_evictions}, Entries: {len(self.entries)}, Bytes: {self.current_bytes}/{self.max_bytes}")
@@ -0,0 +1,144 @@
+"""
+Define InputImagePreprocessor class.
+"""
+from collections import OrderedDict
+from io import BytesIO
+import os
+import threading
+
+from loguru import logger
+from PIL import Image, ImageOps
+
+from src.image_generator.input_image_preprocessor_enum import InputImagePreprocessorEnum
+
+
+class PreparedInputImage:
+    """
+    An input image which is ready to be uploaded as is.
+    `size` is (width, height) after preprocessing as in PIL.
+    """
+
+    def __init__(self, data: bytes, mime_type: str, size: tuple[int, int], original_size_in_bytes: int):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.original_size_in_bytes = original_size_in_bytes
+
+
+class InputImagePreprocessor:
+    """
+    Downscale, orient and re-encode an input image before it is uploaded.
+    The longest edge is capped to `max_long_edge`, the EXIF orientation is applied,
+    metadata is dropped and the image is encoded to JPEG or WebP with `quality`.
+    The prepared images are kept in an LRU memo of up to `max_memo_bytes`, keyed by (path, mtime, size, signature),
+    so that an input is prepared once per run even without InputImageCache or after its eviction from it.
+    Set `max_memo_bytes` to 0 to disable the memo.
+    """
+
+    def __init__(self, max_long_edge: int = 1536, output_format: str = InputImagePreprocessorEnum.const_format_jpeg, quality: int = 90, max_memo_bytes: int = 64 * 1024 * 1024):
+        self.max_long_edge = max_long_edge
+        self.output_format = output_format
+        self.quality = quality
+        self.max_memo_bytes = max_memo_bytes
+        self.memo_bytes = 0
+        self.memo: OrderedDict[tuple[str, int, int, str], PreparedInputImage] = OrderedDict()
+        self.count_prepared = 0
+        self.count_memo_hits = 0
+        self.count_requests = 0
+        self.count_uploaded_bytes = 0
+        self.count_original_bytes = 0
+        self.lock = threading.Lock()
+
+    def prepare(self, input_file_path: str) -> PreparedInputImage:
+        """
+        Load and preprocess `input_file_path`, or return it from the memo. Errors from PIL or the file system are propagated to the caller.
+        The returned image is shared. Do not modify it.
+        """
+        stat_result = os.stat(input_file_path)
+        key = (os.path.abspath(input_file_path), stat_result.st_mtime_ns, stat_result.st_size, self.get_signature())
+        with self.lock:
+            prepared_input_image = self.memo.get(key)
+            if prepared_input_image is not None:
+                self.memo.move_to_end(key)
+                self.count_memo_hits += 1
+                return prepared_input_image
+        prepared_input_image = self._prepare_file(input_file_path, stat_result.st_size)
+        with self.lock:
+            self.count_prepared += 1
+            if len(prepared_input_image.data) <= self.max_memo_bytes and key not in self.memo:
+                self.memo[key] = prepared_input_image
+                self.memo_bytes += len(prepared_input_image.data)
+                while self.memo_bytes > self.max_memo_bytes:
+                    (_, evicted) = self.memo.popitem(last=False)
+                    self.memo_bytes -= len(evicted.data)
+        return prepared_input_image
+
+    def _prepare_file(self, input_file_path: str, original_size_in_bytes: int) -> PreparedInputImage:
+        with Image.open(input_file_path) as image_file:
+            image = ImageOps.exif_transpose(image_file)
+            image.load()
+        if max(image.size) > self.max_long_edge:
+            image.thumbnail((self.max_long_edge, self.max_long_edge), Image.Resampling.LANCZOS)
+        bytesio = BytesIO()
+        if self.output_format == InputImagePreprocessorEnum.const_format_webp:
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            image.save(bytesio, format="WEBP", quality=self.quality)
+            mime_type = "image/webp"
+        else:
+            if image.mode != "RGB":
+                image = self._flatten_to_rgb(image)
+            image.save(bytesio, format="JPEG", quality=self.quality, optimize=True)
+            mime_type = "image/jpeg"
+        data = bytesio.getvalue()
+        logger.debug(f"Preprocessed {input_file_path}: {original_size_in_bytes} -> {len(data)} bytes, {image.size[0]}x{image.size[1]}")
+        return PreparedInputImage(data, mime_type, image.size, original_size_in_bytes)
+
+    def get_signature(self) -> str:
+        """
+        Return the settings which decide the prepared bytes of an input file, e.g. for a cache key.
+        """
+        return f"{self.output_format}:{self.max_long_edge}:{self.quality}"
+
+    def get_prepared_size(self, size: tuple[int, int]) -> tuple[int, int]:
+        """
+        Return (width, height) of an image of `size` after preprocessing, without decoding it.
+        """
+        (width, height) = size
+        if max(width, height) <= self.max_long_edge:
+            return (width, height)
+        scale = self.max_long_edge / max(width, height)
+        return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    def estimate_prepared_size_in_bytes(self, size: tuple[int, int]) -> int:
+        """
+        Estimate the bytes of an image of `size` after preprocessing, without decoding it.
+        """
+        # Typical of photos at quality 90. Flat images compress better, noisy ones worse.
+        const_bytes_per_pixel_by_format = {InputImagePreprocessorEnum.const_format_jpeg: 0.3, InputImagePreprocessorEnum.const_format_webp: 0.2}
+        (width, height) = self.get_prepared_size(size)
+        return int(width * height * const_bytes_per_pixel_by_format.get(self.output_format, 0.3))
+
+    def _flatten_to_rgb(self, image: Image.Image) -> Image.Image:
+        if "A" in image.getbands() or image.mode == "P":
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            return background
+        return image.convert("RGB")
+
+    def record_request(self, prepared_input_image_list: list[PreparedInputImage]) -> None:
+        """
+        Report and accumulate the bytes sent by one request and those saved by preprocessing.
+        `prepared_input_image_list` has the images which are sent, not those already uploaded, e.g. served by the input upload cache.
+        """
+        uploaded_bytes = sum(len(x.data) for x in prepared_input_image_list)
+        original_bytes = sum(x.original_size_in_bytes for x in prepared_input_image_list)
+        with self.lock:
+            self.count_requests += 1
+            self.count_uploaded_bytes += uploaded_bytes
+            self.count_original_bytes += original_bytes
+        logger.info(f"Upload payload: {uploaded_bytes} bytes. Saved {original_bytes - uploaded_bytes} bytes by preprocessing.")
+
+    def show_stats(self) -> None:
+        logger.info(f"[InputImagePreprocessor] Prepared: {self.count_prepared}, Memo hits: {self.count_memo_hits}, Requests: {self.count_requests}, Uploaded bytes: {self.count_uploaded_bytes}, Original bytes: {self.count_original_bytes}, Saved bytes: {self.count_original_bytes - self.count_uploaded_bytes}")
@@ -0,0 +1,9 @@
+"""
+Define InputImagePreprocessorEnum class.
+It is kept apart from the preprocessor, so that the config can be validated without importing PIL.
+"""
+
+
+class InputImagePreprocessorEnum:
+    const_format_jpeg = "jpeg"
+    const_format_webp = "webp"
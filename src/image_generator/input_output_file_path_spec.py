@@ -2,39 +2,124 @@
 Define InputOutputFilePathSpec class.
 """
 import os
+from typing import Callable, Iterator
 from loguru import logger
 
 
+def get_indexed_file_path(file_path: str, tag: str, index: int) -> str:
+    """
+    Return `file_path` with `.<tag>.<index>` inserted before the extension, e.g. "a.png" -> "a.candidate.1.png".
+    """
+    (stem, extension) = os.path.splitext(os.path.basename(file_path))
+    return os.path.join(os.path.dirname(file_path), f"{stem}.{tag}.{index}{extension}")
+
+
+class InputOutputFilePathSpecItem:
+    """
+    A compact, immutable work item: a tuple of input file paths and a tuple of output file paths.
+    `item['input_file_path_list']` and `item['output_file_path_list']` work as with the dict items of `get_item_list`.
+    """
+
+    __slots__ = ('input_file_path_list', 'output_file_path_list')
+
+    def __init__(self, input_file_path_list: "tuple[str, ...] | list[str]", output_file_path_list: "tuple[str, ...] | list[str]"):
+        self.input_file_path_list = tuple(input_file_path_list)
+        self.output_file_path_list = tuple(output_file_path_list)
+
+    def __getitem__(self, key: str) -> list[str]:
+        if key == 'input_file_path_list':
+            return list(self.input_file_path_list)
+        if key == 'output_file_path_list':
+            return list(self.output_file_path_list)
+        raise KeyError(key)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, InputOutputFilePathSpecItem):
+            return NotImplemented
+        return self.input_file_path_list == other.input_file_path_list and self.output_file_path_list == other.output_file_path_list
+
+    def __hash__(self) -> int:
+        return hash((self.input_file_path_list, self.output_file_path_list))
+
+    def __repr__(self) -> str:
+        return f"InputOutputFilePathSpecItem({self.input_file_path_list!r}, {self.output_file_path_list!r})"
+
+    def to_dict(self) -> dict[str, list[str]]:
+        return {
+            'input_file_path_list': list(self.input_file_path_list),
+            'output_file_path_list': list(self.output_file_path_list)
+        }
+
+
 class InputOutputFilePathSpec:
 
     def __init__(self):
-        self.item_list = []
+        self.item_list: list[InputOutputFilePathSpecItem] = []
 
     def add_item_with_lists(self, input_file_path_list: list[str], output_file_path_list: list[str]) -> None:
         """
         Add two lists: input_file_path_list, output_file_path_list.
         """
-        self.item_list.append({
-            'input_file_path_list': input_file_path_list,
-            'output_file_path_list': output_file_path_list
-        })
+        self.item_list.append(InputOutputFilePathSpecItem(input_file_path_list, output_file_path_list))
 
     def get_item_list(self) -> list[dict[str, list[str]]]:
-        return self.item_list
+        """
+        Return every item as a dict of two lists. This materializes the whole spec. Prefer `iter_items` for large specs.
+        """
+        return [item.to_dict() for item in self.iter_items()]
+
+    def iter_items(self) -> Iterator[InputOutputFilePathSpecItem]:
+        return iter(self.item_list)
+
+    def get_number_of_items(self) -> int:
+        return len(self.item_list)
+
+    def __len__(self) -> int:
+        return self.get_number_of_items()
 
     def show_input_output_file_path_spec(self) -> None:
         """
         Print the input and output file path specification.
         """
+        const_max_number_of_items_to_show = 1000
+        number_of_items = self.get_number_of_items()
         logger.info("---")
         logger.info("[InputOutputFilePathSpec]")
         logger.info("[Input Files]")
-        for item in self.item_list:
-            for x in item['input_file_path_list']:
+        for (index, item) in enumerate(self.iter_items()):
+            if index >= const_max_number_of_items_to_show:
+                logger.info(f"... and {number_of_items - index} more item(s).")
+                break
+            for x in item.input_file_path_list:
                 logger.info(f"({os.path.basename(x)}) ")
         logger.info("---")
         logger.info("[Output Files]")
-        for item in self.item_list:
-            for x in item['output_file_path_list']:
+        for (index, item) in enumerate(self.iter_items()):
+            if index >= const_max_number_of_items_to_show:
+                logger.info(f"... and {number_of_items - index} more item(s).")
+                break
+            for x in item.output_file_path_list:
                 logger.info(f"({os.path.basename(x)}) ")
         logger.info("---")
+
+
+class LazyInputOutputFilePathSpec(InputOutputFilePathSpec):
+    """
+    A generator-backed InputOutputFilePathSpec.
+    Items are made on demand by `item_iterator_factory`, which is called once per iteration,
+    so that the whole spec is never held in memory. `number_of_items` must be the number of items it yields.
+    """
+
+    def __init__(self, item_iterator_factory: Callable[[], Iterator[InputOutputFilePathSpecItem]], number_of_items: int):
+        super().__init__()
+        self.item_iterator_factory = item_iterator_factory
+        self.number_of_items = number_of_items
+
+    def add_item_with_lists(self, input_file_path_list: list[str], output_file_path_list: list[str]) -> None:
+        raise TypeError("LazyInputOutputFilePathSpec does not support adding items.")
+
+    def iter_items(self) -> Iterator[InputOutputFilePathSpecItem]:
+        return self.item_iterator_factory()
+
+    def get_number_of_items(self) -> int:
+        return self.number_of_items
@@ -2,11 +2,15 @@
 Build InputOutputFilePathSpec from input and output directories.
 """
 from datetime import datetime
+import itertools
 import os
+from typing import Iterator, Optional
 
 from loguru import logger
 
-from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.input_deduplicator import InputDeduplicator
+from src.image_generator.input_file_index import InputFileIndex, list_input_image_files
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec, InputOutputFilePathSpecItem, LazyInputOutputFilePathSpec
 
 
 def remove_file_extension(file_path):
@@ -24,64 +28,166 @@ def get_date_and_time_part() -> str:
     return now.strftime("%Y%m%d-%H%M%S")
 
 
-def get_output_image_names(source_image_name: str, reference_image_name: str) -> tuple[str, str]:
+def get_output_image_name(source_image_name: str, date_and_time_part: Optional[str] = None, output_extension: str = '.png') -> str:
+    """Generate output image name of a single directory item based on the input image name."""
+    if date_and_time_part is None:
+        date_and_time_part = get_date_and_time_part()
+    return remove_file_extension(source_image_name) + '-' + date_and_time_part + output_extension
+
+
+def get_output_image_names(source_image_name: str, reference_image_name: str, date_and_time_part: Optional[str] = None, output_extension: str = '.png') -> tuple[str, str]:
     """Generate output image path based on input image names."""
-    date_and_time_part = get_date_and_time_part()
+    if date_and_time_part is None:
+        date_and_time_part = get_date_and_time_part()
     # Order matters.
-    file_name_0000 =  remove_file_extension(reference_image_name) + '-transferred-to-' + remove_file_extension(source_image_name) + '-' + date_and_time_part + '.png'
-    file_name_0001 =  remove_file_extension(source_image_name) + '-transferred-from-' + remove_file_extension(reference_image_name) + '-' + date_and_time_part + '.png'
+    file_name_0000 =  remove_file_extension(reference_image_name) + '-transferred-to-' + remove_file_extension(source_image_name) + '-' + date_and_time_part + output_extension
+    file_name_0001 =  remove_file_extension(source_image_name) + '-transferred-from-' + remove_file_extension(reference_image_name) + '-' + date_and_time_part + output_extension
     return file_name_0000, file_name_0001
 
 
-class InputOutputFilePathSpecBuilderForSingleDirectory:
+class InputOutputFilePathSpecBuilderBase:
     """
-    Build InputOutputFilePathSpec from input and output directories.
+    Discover input files for the builders.
+    By default, every input image file of a directory is listed with `os.scandir`.
+    With an InputFileIndex, files whose content is not an image are skipped,
+    and the builders can ask only for the files which are new or modified since the index was saved.
+    With an InputDeduplicator, items whose inputs have the same content are collapsed into one.
     """
 
     def __init__(self):
-        pass
+        self.recursive = False
+        self.input_file_index: Optional[InputFileIndex] = None
+        self.flag_only_new_or_modified = False
+        self.input_deduplicator: Optional[InputDeduplicator] = None
+        self.output_extension = '.png'
+
+    def set_recursive(self, recursive: bool) -> None:
+        """
+        Look for input files in subdirectories too. Output files mirror the subdirectories.
+        """
+        self.recursive = recursive
+
+    def set_output_extension(self, output_extension: str) -> None:
+        """
+        Name output files with `output_extension`, e.g. '.webp'. OutputImageWriter writes them in the format of the extension.
+        """
+        self.output_extension = output_extension
+
+    def set_input_file_index(self, input_file_index: Optional[InputFileIndex], flag_only_new_or_modified: bool = False) -> None:
+        self.input_file_index = input_file_index
+        self.flag_only_new_or_modified = flag_only_new_or_modified
+
+    def set_input_deduplicator(self, input_deduplicator: Optional[InputDeduplicator]) -> None:
+        """
+        Collapse duplicate items. A lazy spec stays lazy: its input files are grouped by content, and its items are made from the groups.
+        """
+        self.input_deduplicator = input_deduplicator
+
+    def _deduplicate(self, spec: InputOutputFilePathSpec) -> InputOutputFilePathSpec:
+        if self.input_deduplicator is None:
+            return spec
+        return self.input_deduplicator.deduplicate(spec)
 
-    def build(self, source_dir: str, output_dir: str) -> InputOutputFilePathSpec | None:
+    def _list_input_files(self, dir_path: str) -> tuple[list[str], Optional[set[str]]]:
+        """
+        Return the sorted input file names of `dir_path`, and the set of those which are new or modified,
+        or None if every file is to be processed.
+        Errors reading `dir_path` are propagated to the caller.
+        """
+        if self.input_file_index is None:
+            return (list_input_image_files(dir_path, self.recursive), None)
+        (file_name_list, changed_file_name_set) = self.input_file_index.scan(dir_path, self.recursive)
+        return (file_name_list, changed_file_name_set if self.flag_only_new_or_modified else None)
+
+
+class InputOutputFilePathSpecBuilderForSingleDirectory(InputOutputFilePathSpecBuilderBase):
+    """
+    Build InputOutputFilePathSpec from input and output directories.
+    """
+
+    def build(self, source_dir: str, output_dir: str, date_and_time_part: Optional[str] = None) -> InputOutputFilePathSpec | None:
         """
         Build InputOutputFilePathSpec from input and output directories.
         Assumes input_dir contains images named as image_0000.png, image_0001.png, etc.
+        If `date_and_time_part` is given, e.g. a run ID, output file names are deterministic.
         """
-        const_file_extension_tuple = (".png", ".jpg", ".jpeg", ".webp", ".avif")
         try:
-            source_files = sorted([f for f in os.listdir(source_dir) if f.endswith(const_file_extension_tuple)])
+            (source_files, changed_source_file_set) = self._list_input_files(source_dir)
         except (FileNotFoundError, NotADirectoryError, PermissionError, OSError) as e:
             logger.error(f"Error reading directory: {e}")
             return None
+        if changed_source_file_set is not None:
+            source_files = [f for f in source_files if f in changed_source_file_set]
 
         logger.info(source_files)
 
         spec = InputOutputFilePathSpec()
         for source in source_files:
-            output_image_name = remove_file_extension(source) + '-' + get_date_and_time_part() + '.png'
+            output_image_name = get_output_image_name(source, date_and_time_part, self.output_extension)
             input_file_path_list = [os.path.join(source_dir, source)]
             output_file_path_list = [os.path.join(output_dir, output_image_name)]
             spec.add_item_with_lists(input_file_path_list, output_file_path_list)
 
-        return spec
+        return self._deduplicate(spec)
 
+    def build_lazy(self, source_dir: str, output_dir: str, date_and_time_part: Optional[str] = None) -> InputOutputFilePathSpec | None:
+        """
+        Build a LazyInputOutputFilePathSpec which makes the same items as `build` on demand.
+        Only the file names are held in memory.
+        """
+        try:
+            (source_files, changed_source_file_set) = self._list_input_files(source_dir)
+        except (FileNotFoundError, NotADirectoryError, PermissionError, OSError) as e:
+            logger.error(f"Error reading directory: {e}")
+            return None
+        if changed_source_file_set is not None:
+            source_files = [f for f in source_files if f in changed_source_file_set]
+        logger.info(f"{len(source_files)} source file(s).")
+        if date_and_time_part is None:
+            date_and_time_part = get_date_and_time_part()
 
-class InputOutputFilePathSpecBuilderForPairOfDirectories:
+        if self.input_deduplicator is not None:
+            return self._build_lazy_deduplicated(source_dir, source_files, output_dir, date_and_time_part)
+
+        def iterate_items() -> Iterator[InputOutputFilePathSpecItem]:
+            for source in source_files:
+                output_image_name = get_output_image_name(source, date_and_time_part, self.output_extension)
+                yield InputOutputFilePathSpecItem((os.path.join(source_dir, source),), (os.path.join(output_dir, output_image_name),))
+
+        return LazyInputOutputFilePathSpec(iterate_items, len(source_files))
+
+    def _build_lazy_deduplicated(self, source_dir: str, source_files: list[str], output_dir: str, date_and_time_part: str) -> LazyInputOutputFilePathSpec:
+        """
+        Make one item per group of sources with the same content, with the output paths of every source of the group.
+        """
+        source_group_list = self.input_deduplicator.group_input_files(source_dir, source_files)
+        self.input_deduplicator.record_collapsed(len(source_files), len(source_group_list))
+
+        def iterate_items() -> Iterator[InputOutputFilePathSpecItem]:
+            for source_group in source_group_list:
+                yield InputOutputFilePathSpecItem(
+                    (os.path.join(source_dir, source_group[0]),),
+                    tuple(os.path.join(output_dir, get_output_image_name(source, date_and_time_part, self.output_extension)) for source in source_group)
+                )
+
+        return LazyInputOutputFilePathSpec(iterate_items, len(source_group_list))
+
+
+class InputOutputFilePathSpecBuilderForPairOfDirectories(InputOutputFilePathSpecBuilderBase):
     """
     Build InputOutputFilePathSpec from input and output directories.
+    With only new or modified files, a pair is built if either of its files is new or modified.
     """
 
-    def __init__(self):
-        pass
-
-    def build(self, source_dir: str, reference_dir: str, output_dir: str) -> InputOutputFilePathSpec | None:
+    def build(self, source_dir: str, reference_dir: str, output_dir: str, date_and_time_part: Optional[str] = None) -> InputOutputFilePathSpec | None:
         """
         Build InputOutputFilePathSpec from input and output directories.
         Assumes input_dir contains pairs of images named as image_0000.png and image_0001.png.
+        If `date_and_time_part` is given, e.g. a run ID, output file names are deterministic.
         """
-        const_file_extension_tuple = (".png", ".jpg", ".jpeg", ".webp", ".avif")
         try:
-            source_files = sorted([f for f in os.listdir(source_dir) if f.endswith(const_file_extension_tuple)])
-            reference_files = sorted([f for f in os.listdir(reference_dir) if f.endswith(const_file_extension_tuple)])
+            (source_files, changed_source_file_set) = self._list_input_files(source_dir)
+            (reference_files, changed_reference_file_set) = self._list_input_files(reference_dir)
         except (FileNotFoundError, NotADirectoryError, PermissionError, OSError) as e:
             logger.error(f"Error reading directories: {e}")
             return None
@@ -92,7 +198,9 @@ class InputOutputFilePathSpecBuilderForPairOfDirectories:
         spec = InputOutputFilePathSpec()
         for source in source_files:
             for reference in reference_files:
-                output_image_names = get_output_image_names(source, reference)
+                if not self._is_pair_new_or_modified(source, reference, changed_source_file_set, changed_reference_file_set):
+                    continue
+                output_image_names = get_output_image_names(source, reference, date_and_time_part, self.output_extension)
                 logger.info(output_image_names)
                 input_file_path_list = [os.path.join(source_dir, source), os.path.join(reference_dir, reference)]
                 output_file_path_list = []
@@ -100,4 +208,74 @@ class InputOutputFilePathSpecBuilderForPairOfDirectories:
                 output_file_path_list.append(os.path.join(output_dir, output_image_names[1]))
                 spec.add_item_with_lists(input_file_path_list, output_file_path_list)
 
-        return spec
+        return self._deduplicate(spec)
+
+    def build_lazy(self, source_dir: str, reference_dir: str, output_dir: str, date_and_time_part: Optional[str] = None) -> InputOutputFilePathSpec | None:
+        """
+        Build a LazyInputOutputFilePathSpec which makes the same items as `build` on demand.
+        Only the file names are held in memory, not the N x M cross product, even if it is deduplicated.
+        """
+        try:
+            (source_files, changed_source_file_set) = self._list_input_files(source_dir)
+            (reference_files, changed_reference_file_set) = self._list_input_files(reference_dir)
+        except (FileNotFoundError, NotADirectoryError, PermissionError, OSError) as e:
+            logger.error(f"Error reading directories: {e}")
+            return None
+        logger.info(f"{len(source_files)} source file(s) x {len(reference_files)} reference file(s).")
+        if date_and_time_part is None:
+            date_and_time_part = get_date_and_time_part()
+        number_of_items = len(source_files) * len(reference_files)
+        if changed_source_file_set is not None:
+            # Every pair but those of an unchanged source and an unchanged reference.
+            number_of_items -= (len(source_files) - len(changed_source_file_set)) * (len(reference_files) - len(changed_reference_file_set))
+            logger.info(f"{number_of_items} pair(s) with new or modified files.")
+        if self.input_deduplicator is not None:
+            return self._build_lazy_deduplicated(source_dir, source_files, changed_source_file_set, reference_dir, reference_files, changed_reference_file_set, output_dir, date_and_time_part, number_of_items)
+
+        def iterate_items() -> Iterator[InputOutputFilePathSpecItem]:
+            for (source, reference) in itertools.product(source_files, reference_files):
+                if not self._is_pair_new_or_modified(source, reference, changed_source_file_set, changed_reference_file_set):
+                    continue
+                output_image_names = get_output_image_names(source, reference, date_and_time_part, self.output_extension)
+                yield InputOutputFilePathSpecItem(
+                    (os.path.join(source_dir, source), os.path.join(reference_dir, reference)),
+                    (os.path.join(output_dir, output_image_names[0]), os.path.join(output_dir, output_image_names[1]))
+                )
+
+        return LazyInputOutputFilePathSpec(iterate_items, number_of_items)
+
+    def _build_lazy_deduplicated(self, source_dir: str, source_files: list[str], changed_source_file_set: Optional[set[str]], reference_dir: str, reference_files: list[str], changed_reference_file_set: Optional[set[str]], output_dir: str, date_and_time_part: str, number_of_pairs: int) -> LazyInputOutputFilePathSpec:
+        """
+        Make one item per pair of a group of sources and a group of references with the same content,
+        with the output paths of every pair of the two groups. The N sources and M references are hashed, not the N x M pairs.
+        """
+        source_group_list = self.input_deduplicator.group_input_files(source_dir, source_files)
+        reference_group_list = self.input_deduplicator.group_input_files(reference_dir, reference_files)
+        number_of_items = len(source_group_list) * len(reference_group_list)
+        if changed_source_file_set is not None and changed_reference_file_set is not None:
+            # Every pair of groups but those of unchanged sources only and unchanged references only.
+            number_of_unchanged_source_groups = sum(1 for x in source_group_list if changed_source_file_set.isdisjoint(x))
+            number_of_unchanged_reference_groups = sum(1 for x in reference_group_list if changed_reference_file_set.isdisjoint(x))
+            number_of_items -= number_of_unchanged_source_groups * number_of_unchanged_reference_groups
+        self.input_deduplicator.record_collapsed(number_of_pairs, number_of_items)
+
+        def iterate_items() -> Iterator[InputOutputFilePathSpecItem]:
+            for (source_group, reference_group) in itertools.product(source_group_list, reference_group_list):
+                input_file_path_list = None
+                output_file_path_list = []
+                for (source, reference) in itertools.product(source_group, reference_group):
+                    if not self._is_pair_new_or_modified(source, reference, changed_source_file_set, changed_reference_file_set):
+                        continue
+                    if input_file_path_list is None:
+                        input_file_path_list = (os.path.join(source_dir, source), os.path.join(reference_dir, reference))
+                    output_image_names = get_output_image_names(source, reference, date_and_time_part, self.output_extension)
+                    output_file_path_list.extend([os.path.join(output_dir, output_image_names[0]), os.path.join(output_dir, output_image_names[1])])
+                if input_file_path_list is not None:
+                    yield InputOutputFilePathSpecItem(input_file_path_list, output_file_path_list)
+
+        return LazyInputOutputFilePathSpec(iterate_items, number_of_items)
+
+    def _is_pair_new_or_modified(self, source: str, reference: str, changed_source_file_set: Optional[set[str]], changed_reference_file_set: Optional[set[str]]) -> bool:
+        if changed_source_file_set is None or changed_reference_file_set is None:
+            return True
+        return source in changed_source_file_set or reference in changed_reference_file_set
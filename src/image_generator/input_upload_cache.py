@@ -0,0 +1,92 @@
+"""
+Define InputUploadCache class.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+
+
+class InputUploadCache:
+    """
+    A persistent cache of input images uploaded with the Files API: (client name, SHA-256 of the bytes) -> file URI.
+    An input image used by many requests, e.g. a reference image of a pair_of_directories run, is uploaded once per API key
+    and referenced by its URI afterwards, instead of being sent inline with every request.
+    Files are per project, so an upload with one key is not used with another.
+    An entry is used until `expiry_margin_in_seconds` before the file expires on the server.
+    """
+
+    # Files uploaded with the Files API are deleted after 48 hours. Used if the server does not say when.
+    const_default_time_to_live_in_seconds = 48 * 3600
+
+    def __init__(self, cache_file_path: str, min_bytes: int = 0, expiry_margin_in_seconds: float = 600.0, clock: Callable[[], float] = time.time):
+        self.cache_file_path = cache_file_path
+        self.min_bytes = min_bytes
+        self.expiry_margin_in_seconds = expiry_margin_in_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        # One lock per key, so that concurrent requests with the same input upload it once.
+        self.lock_by_key: dict[tuple[str, str], threading.Lock] = {}
+        # (client name, content hash) -> (file URI, MIME type, expires at)
+        self.entry_by_key: dict[tuple[str, str], tuple[str, str, float]] = {}
+        self.count_hits = 0
+        self.count_uploads = 0
+        self.count_invalidations = 0
+        self.uploaded_bytes = 0
+        self.saved_inline_bytes = 0
+        os.makedirs(os.path.dirname(cache_file_path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(cache_file_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS input_upload (client_name TEXT NOT NULL, content_hash TEXT NOT NULL, file_uri TEXT NOT NULL, mime_type TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (client_name, content_hash))")
+            self.connection.execute("DELETE FROM input_upload WHERE expires_at <= ?", (self.clock() + self.expiry_margin_in_seconds,))
+        for (client_name, content_hash, file_uri, mime_type, expires_at) in self.connection.execute("SELECT client_name, content_hash, file_uri, mime_type, expires_at FROM input_upload"):
+            self.entry_by_key[(client_name, content_hash)] = (file_uri, mime_type, expires_at)
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def get_or_upload(self, client_name: str, content_hash: str, size_in_bytes: int, upload: Callable[[], tuple[str, str, Optional[float]]]) -> tuple[str, str, bool]:
+        """
+        Return (file URI, MIME type, whether it has been uploaded now) of the input whose bytes have `content_hash`.
+        On a miss or an entry about to expire, `upload` is called and returns (file URI, MIME type, expires at or None).
+        An exception raised by `upload` is passed to the caller, which can send the input inline instead.
+        """
+        key = (client_name, content_hash)
+        with self.lock:
+            lock_of_key = self.lock_by_key.setdefault(key, threading.Lock())
+        with lock_of_key:
+            with self.lock:
+                entry = self.entry_by_key.get(key)
+                if entry is not None and entry[2] - self.expiry_margin_in_seconds > self.clock():
+                    self.count_hits += 1
+                    self.saved_inline_bytes += size_in_bytes
+                    return (entry[0], entry[1], False)
+            (file_uri, mime_type, expires_at) = upload()
+            if expires_at is None:
+                expires_at = self.clock() + self.const_default_time_to_live_in_seconds
+            with self.lock:
+                self.entry_by_key[key] = (file_uri, mime_type, expires_at)
+                self.count_uploads += 1
+                self.uploaded_bytes += size_in_bytes
+                with self.connection:
+                    self.connection.execute("INSERT OR REPLACE INTO input_upload (client_name, content_hash, file_uri, mime_type, expires_at) VALUES (?, ?, ?, ?, ?)", (client_name, content_hash, file_uri, mime_type, expires_at))
+            return (file_uri, mime_type, True)
+
+    def invalidate(self, client_name: str, content_hash: str) -> None:
+        """
+        Forget the upload of `content_hash`, e.g. when the server no longer has the file. The next request uploads it again.
+        """
+        with self.lock:
+            if self.entry_by_key.pop((client_name, content_hash), None) is None:
+                return
+            self.count_invalidations += 1
+            with self.connection:
+                self.connection.execute("DELETE FROM input_upload WHERE client_name = ? AND content_hash = ?", (client_name, content_hash))
+
+    def show_stats(self) -> None:
+        with self.lock:
+            logger.info(f"[InputUploadCache] Hits: {self.count_hits}, Uploads: {self.count_uploads}, Invalidations: {self.count_invalidations}, Uploaded: {self.uploaded_bytes} bytes, Not sent inline: {self.saved_inline_bytes} bytes")
@@ -0,0 +1,60 @@
+"""
+Define helper functions to log API requests and responses without their binary payloads.
+"""
+import enum
+from typing import Any
+
+from loguru import logger
+from pydantic import BaseModel
+
+
+# Text longer than this, e.g. a long prompt or a base64 string, is cut in the summary.
+const_default_max_text_length = 200
+# Items of a list beyond this are counted instead of summarized.
+const_default_max_list_length = 8
+
+
+def summarize_payload(value: Any, max_text_length: int = const_default_max_text_length) -> str:
+    """
+    Return a one-line summary of `value`, e.g. a response, a candidate or a part, for logging.
+    Bytes are replaced by their length, long text is truncated and unset fields are left out,
+    so that the summary of a response with inline images is short and cheap to build.
+    """
+    return _summarize(value, max_text_length)
+
+
+def _summarize(value: Any, max_text_length: int) -> str:  # pylint: disable=too-many-return-statements
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        if len(value) > max_text_length:
+            return repr(value[:max_text_length]) + f"...<{len(value)} chars>"
+        return repr(value)
+    if isinstance(value, enum.Enum):
+        return str(value.value)
+    if isinstance(value, BaseModel):
+        field_list = []
+        for name in type(value).model_fields:
+            field_value = getattr(value, name, None)
+            if field_value is None:
+                continue
+            field_list.append(f"{name}={_summarize(field_value, max_text_length)}")
+        return f"{type(value).__name__}({', '.join(field_list)})"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{_summarize(k, max_text_length)}: {_summarize(v, max_text_length)}" for (k, v) in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        item_list = [_summarize(x, max_text_length) for x in value[:const_default_max_list_length]]
+        if len(value) > const_default_max_list_length:
+            item_list.append(f"...<{len(value)} items>")
+        return "[" + ", ".join(item_list) + "]"
+    return _summarize(repr(value), max_text_length)
+
+
+def log_payload(level: str, message: str, value: Any) -> None:
+    """
+    Log `message` followed by the summary of `value` at `level`.
+    The summary is built only if a sink takes `level`, so that it costs nothing when the level is off.
+    """
+    logger.opt(lazy=True, depth=1).log(level, message + " {}", lambda: summarize_payload(value))
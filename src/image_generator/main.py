@@ -1,21 +1,52 @@
 """
 Define main functions for image generation.
+The backends, and the Gemini SDK with them, are imported only by the commands which call a model,
+so that validating the config and planning a run start quickly.
+Likewise, the modules which import PIL or sqlite3 are imported only where they are used, so that `validate` imports neither.
 """
+import argparse
 import os
-from typing import Optional
+import signal
+import sys
+from typing import Optional, TYPE_CHECKING
 import yaml
 
 from loguru import logger
 
-from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
-from src.image_generator.image_generator_for_gemini import ImageGeneratorForGemini
+from src.image_generator.call_metrics import CallMetricsRecorder, load_latency_percentile
+from src.image_generator.circuit_breaker import CircuitBreaker
+from src.image_generator.hedged_request import HedgePolicy
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig, build_image_generator_generate_content_config
+from src.image_generator.input_image_preprocessor_enum import InputImagePreprocessorEnum
 from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
-from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories
+from src.image_generator.output_image_writer_enum import OutputImageWriterEnum
+from src.image_generator.parameter_sweep import SweepInputOutputFilePathSpec, build_sweep_variant_list
+from src.image_generator.retry_policy import RetryPolicy
+from src.image_generator.run_journal import RunJournal
+from src.image_generator.simulation_enum import SimulationEnum, get_mean_latency_in_seconds
+from src.image_generator.source_directory_watcher import SourceDirectoryWatcher
+
+if TYPE_CHECKING:
+    from src.image_generator.image_generator_for_gemini import ImageGeneratorForGemini
+    from src.image_generator.input_deduplicator import InputDeduplicator
+    from src.image_generator.input_file_index import InputFileIndex
+    from src.image_generator.input_image_cache import InputImageCache
+    from src.image_generator.input_image_preprocessor import InputImagePreprocessor
+    from src.image_generator.input_upload_cache import InputUploadCache
+    from src.image_generator.output_image_writer import OutputImageWriter
+    from src.image_generator.result_cache import ResultCache
+    from src.image_generator.run_planner import RunPlan
 
 
 class GlobalConfigEnum:
     const_type_pair_of_directories = "pair_of_directories"
     const_type_single_directory = "single_directory"
+    const_backend_gemini = "gemini"
+    const_backend_simulation = "simulation"
+    # As in ImageGeneratorForGemini, which is not imported here.
+    const_default_gemini_model_name = "models/gemini-2.5-flash-image-preview"
+    # Assumed by the run planner when no call has been recorded in the metrics.
+    const_default_latency_in_seconds = 15.0
 
 
 class GlobalConfigValidator:
@@ -39,17 +70,320 @@ class GlobalConfigValidator:
         ]:
             logger.error(f"Invalid 'type' in 'input_output_spec': {config['global']['input_output_spec']['type']}")
             return False
+        if not isinstance(config['global']['input_output_spec'].get('recursive', False), bool):
+            logger.error(f"Invalid 'recursive' in 'input_output_spec': {config['global']['input_output_spec']['recursive']}")
+            return False
+        backend = config['global'].get('backend', GlobalConfigEnum.const_backend_gemini)
+        if backend not in [
+            GlobalConfigEnum.const_backend_gemini,
+            GlobalConfigEnum.const_backend_simulation
+        ]:
+            logger.error(f"Invalid 'backend' in global config: {backend}")
+            return False
+        if backend == GlobalConfigEnum.const_backend_simulation and not self._validate_simulation_config(config.get('simulation')):
+            return False
+
+        if 'dispatch' in config['global']:
+            dispatch_config = config['global'].get('dispatch') or {}
+            if not isinstance(dispatch_config, dict):
+                logger.error(f"Invalid 'dispatch' in global config: {dispatch_config}")
+                return False
+            max_in_flight = dispatch_config.get('max_in_flight', 1)
+            if not isinstance(max_in_flight, int) or isinstance(max_in_flight, bool) or max_in_flight < 1:
+                logger.error(f"Invalid 'max_in_flight' in 'dispatch': {max_in_flight}")
+                return False
+            if not isinstance(dispatch_config.get('stream', False), bool):
+                logger.error(f"Invalid 'stream' in 'dispatch': {dispatch_config.get('stream')}")
+                return False
+            if not self._validate_dispatch_timeouts_config(dispatch_config.get('timeouts') or {}):
+                return False
+            if not self._validate_hedging_config(dispatch_config.get('hedging') or {}):
+                return False
+            if not self._validate_circuit_breaker_config(dispatch_config.get('circuit_breaker') or {}):
+                return False
+
+        if 'retry' in config['global']:
+            retry_config = config['global']['retry'] or {}
+            for key in ['max_attempts', 'retry_budget']:
+                value = retry_config.get(key)
+                if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                    logger.error(f"Invalid '{key}' in 'retry': {value}")
+                    return False
+            for key in ['base_delay_in_seconds', 'max_delay_in_seconds']:
+                value = retry_config.get(key)
+                if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0):
+                    logger.error(f"Invalid '{key}' in 'retry': {value}")
+                    return False
+
+        if 'input_image_cache' in config['global']:
+            max_bytes = (config['global']['input_image_cache'] or {}).get('max_bytes')
+            if not isinstance(max_bytes, int) or isinstance(max_bytes, bool) or max_bytes < 0:
+                logger.error(f"Invalid 'max_bytes' in 'input_image_cache': {max_bytes}")
+                return False
+
+        if 'input_image_preprocessing' in config['global']:
+            preprocessing_config = config['global']['input_image_preprocessing'] or {}
+            for key in ['max_long_edge', 'quality']:
+                value = preprocessing_config.get(key)
+                if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0 or (key == 'quality' and value > 100)):
+                    logger.error(f"Invalid '{key}' in 'input_image_preprocessing': {value}")
+                    return False
+            memo_max_bytes = preprocessing_config.get('memo_max_bytes')
+            if memo_max_bytes is not None and (not isinstance(memo_max_bytes, int) or isinstance(memo_max_bytes, bool) or memo_max_bytes < 0):
+                logger.error(f"Invalid 'memo_max_bytes' in 'input_image_preprocessing': {memo_max_bytes}")
+                return False
+            output_format = preprocessing_config.get('format', InputImagePreprocessorEnum.const_format_jpeg)
+            if output_format not in [
+                InputImagePreprocessorEnum.const_format_jpeg,
+                InputImagePreprocessorEnum.const_format_webp
+            ]:
+                logger.error(f"Invalid 'format' in 'input_image_preprocessing': {output_format}")
+                return False
+
+        if 'result_cache' in config['global']:
+            result_cache_config = config['global']['result_cache'] or {}
+            if not isinstance(result_cache_config.get('directory', ''), str):
+                logger.error(f"Invalid 'directory' in 'result_cache': {result_cache_config.get('directory')}")
+                return False
+            max_bytes = result_cache_config.get('max_bytes')
+            if max_bytes is not None and (not isinstance(max_bytes, int) or isinstance(max_bytes, bool) or max_bytes < 0):
+                logger.error(f"Invalid 'max_bytes' in 'result_cache': {max_bytes}")
+                return False
+
+        if 'input_upload_cache' in config['global']:
+            input_upload_cache_config = config['global']['input_upload_cache'] or {}
+            if not isinstance(input_upload_cache_config.get('file', ''), str):
+                logger.error(f"Invalid 'file' in 'input_upload_cache': {input_upload_cache_config.get('file')}")
+                return False
+            for key in ['min_bytes', 'expiry_margin_in_seconds']:
+                value = input_upload_cache_config.get(key)
+                if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0):
+                    logger.error(f"Invalid '{key}' in 'input_upload_cache': {value}")
+                    return False
+
+        if 'input_file_index' in config['global']:
+            input_file_index_config = config['global']['input_file_index'] or {}
+            if not isinstance(input_file_index_config.get('file', ''), str):
+                logger.error(f"Invalid 'file' in 'input_file_index': {input_file_index_config.get('file')}")
+                return False
+            if not isinstance(input_file_index_config.get('only_new_or_modified', False), bool):
+                logger.error(f"Invalid 'only_new_or_modified' in 'input_file_index': {input_file_index_config.get('only_new_or_modified')}")
+                return False
+
+        if 'deduplication' in config['global']:
+            deduplication_config = config['global']['deduplication'] or {}
+            if not isinstance(deduplication_config.get('perceptual', False), bool):
+                logger.error(f"Invalid 'perceptual' in 'deduplication': {deduplication_config.get('perceptual')}")
+                return False
+            max_hamming_distance = deduplication_config.get('max_hamming_distance', 4)
+            if not isinstance(max_hamming_distance, int) or isinstance(max_hamming_distance, bool) or max_hamming_distance < 0 or max_hamming_distance > 64:
+                logger.error(f"Invalid 'max_hamming_distance' in 'deduplication': {max_hamming_distance}")
+                return False
+
+        if config['global'].get('sweep') is not None:
+            sweep_config = config['global']['sweep']
+            if not isinstance(sweep_config, dict):
+                logger.error(f"Invalid 'sweep': {sweep_config}")
+                return False
+            generate_content_config_key_list = sweep_config.get('generate_content_config_keys', [])
+            if not isinstance(generate_content_config_key_list, list) or not all(isinstance(x, str) for x in generate_content_config_key_list):
+                logger.error(f"Invalid 'generate_content_config_keys' in 'sweep': {generate_content_config_key_list}")
+                return False
+            for (key, max_value) in [('temperature', 2.0), ('top_p', 1.0)]:
+                value_list = sweep_config.get(key, [])
+                if not isinstance(value_list, list) or not all(isinstance(x, (int, float)) and not isinstance(x, bool) and 0 <= x <= max_value for x in value_list):
+                    logger.error(f"Invalid '{key}' in 'sweep': {value_list}")
+                    return False
+            candidate_count = sweep_config.get('candidate_count')
+            if candidate_count is not None and (not isinstance(candidate_count, int) or isinstance(candidate_count, bool) or candidate_count < 1):
+                logger.error(f"Invalid 'candidate_count' in 'sweep': {candidate_count}")
+                return False
+
+        if 'metrics' in config['global']:
+            metrics_config = config['global']['metrics'] or {}
+            if not isinstance(metrics_config.get('directory', ''), str):
+                logger.error(f"Invalid 'directory' in 'metrics': {metrics_config.get('directory')}")
+                return False
+
+        if 'watch' in config['global']:
+            watch_config = config['global']['watch'] or {}
+            for key in ['poll_interval_in_seconds', 'stable_for_in_seconds']:
+                value = watch_config.get(key)
+                if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0):
+                    logger.error(f"Invalid '{key}' in 'watch': {value}")
+                    return False
+            for key in ['use_inotify', 'include_existing']:
+                value = watch_config.get(key)
+                if value is not None and not isinstance(value, bool):
+                    logger.error(f"Invalid '{key}' in 'watch': {value}")
+                    return False
+
+        if 'output_writer' in config['global']:
+            output_writer_config = config['global']['output_writer'] or {}
+            for key in ['max_workers', 'max_pending']:
+                value = output_writer_config.get(key)
+                if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                    logger.error(f"Invalid '{key}' in 'output_writer': {value}")
+                    return False
+            output_format = output_writer_config.get('format', OutputImageWriterEnum.const_format_png)
+            if output_format not in [
+                OutputImageWriterEnum.const_format_png,
+                OutputImageWriterEnum.const_format_webp,
+                OutputImageWriterEnum.const_format_avif
+            ]:
+                logger.error(f"Invalid 'format' in 'output_writer': {output_format}")
+                return False
+            for (key, min_value, max_value) in [('png_compress_level', 0, 9), ('quality', 0, 100)]:
+                value = output_writer_config.get(key)
+                if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < min_value or value > max_value):
+                    logger.error(f"Invalid '{key}' in 'output_writer': {value}")
+                    return False
+            if not isinstance(output_writer_config.get('png_optimize', False), bool):
+                logger.error(f"Invalid 'png_optimize' in 'output_writer': {output_writer_config.get('png_optimize')}")
+                return False
+            fan_out_mode_list = output_writer_config.get('fan_out', [])
+            if not isinstance(fan_out_mode_list, list):
+                logger.error(f"'fan_out' in 'output_writer' must be a list of {OutputImageWriterEnum.const_fan_out_hardlink}, {OutputImageWriterEnum.const_fan_out_reflink} and {OutputImageWriterEnum.const_fan_out_copy}: {fan_out_mode_list}")
+                return False
+            for fan_out_mode in fan_out_mode_list:
+                if fan_out_mode not in [
+                    OutputImageWriterEnum.const_fan_out_hardlink,
+                    OutputImageWriterEnum.const_fan_out_reflink,
+                    OutputImageWriterEnum.const_fan_out_copy
+                ]:
+                    logger.error(f"Invalid 'fan_out' in 'output_writer': {fan_out_mode}")
+                    return False
+
+        for model_specific_key in [GlobalConfigEnum.const_backend_gemini, GlobalConfigEnum.const_backend_simulation]:
+            if isinstance(config.get(model_specific_key), dict) and not self._validate_client_pool_config(config[model_specific_key], model_specific_key):
+                return False
 
         # Gemini-specific
         if config.get('gemini'):
+            const_default_gemini_api_key_template_string = "YOUR GEMINI API KEY"
             if config['gemini'].get('api_key'):
-                const_default_gemini_api_key_template_string = "YOUR GEMINI API KEY"
                 if config['gemini']['api_key'] == const_default_gemini_api_key_template_string:
                     logger.error("Please specify a Gemini API key.")
                     return False
+            for api_key_config in config['gemini'].get('api_keys') or []:
+                if api_key_config.get('api_key') == const_default_gemini_api_key_template_string:
+                    logger.error(f"Please specify the Gemini API key of {api_key_config.get('name', 'each entry of api_keys')}.")
+                    return False
+            rate_limits = config['gemini'].get('rate_limits') or {}
+            if not isinstance(rate_limits, dict):
+                logger.error("'rate_limits' in gemini config must be a mapping from a model name to budgets.")
+                return False
+            for model_name, budget in rate_limits.items():
+                if budget is not None and not isinstance(budget, dict):
+                    logger.error(f"The budgets of {model_name} in 'rate_limits' must be a mapping with requests_per_minute and tokens_per_minute: {budget}")
+                    return False
+                for key in ['requests_per_minute', 'tokens_per_minute']:
+                    value = (budget or {}).get(key)
+                    if value is None:
+                        continue
+                    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                        logger.error(f"Invalid '{key}' in 'rate_limits' for {model_name}: {value}")
+                        return False
 
         return True
 
+    def _validate_dispatch_timeouts_config(self, timeouts_config: dict) -> bool:
+        for key in ['request_in_seconds', 'total_in_seconds']:
+            value = timeouts_config.get(key)
+            if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0):
+                logger.error(f"Invalid '{key}' in 'timeouts': {value}")
+                return False
+        return True
+
+    def _validate_hedging_config(self, hedging_config: dict) -> bool:
+        if not isinstance(hedging_config.get('enabled', False), bool):
+            logger.error(f"Invalid 'enabled' in 'hedging': {hedging_config.get('enabled')}")
+            return False
+        percentile = hedging_config.get('percentile', 95)
+        if not isinstance(percentile, (int, float)) or isinstance(percentile, bool) or not 0 < percentile < 100:
+            logger.error(f"Invalid 'percentile' in 'hedging': {percentile}")
+            return False
+        max_hedge_ratio = hedging_config.get('max_hedge_ratio', 0.05)
+        if not isinstance(max_hedge_ratio, (int, float)) or isinstance(max_hedge_ratio, bool) or not 0 <= max_hedge_ratio <= 1:
+            logger.error(f"Invalid 'max_hedge_ratio' in 'hedging': {max_hedge_ratio}")
+            return False
+        for key in ['min_samples', 'window_size']:
+            value = hedging_config.get(key)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+                logger.error(f"Invalid '{key}' in 'hedging': {value}")
+                return False
+        return True
+
+    def _validate_circuit_breaker_config(self, circuit_breaker_config: dict) -> bool:
+        if not isinstance(circuit_breaker_config.get('enabled', False), bool):
+            logger.error(f"Invalid 'enabled' in 'circuit_breaker': {circuit_breaker_config.get('enabled')}")
+            return False
+        for key in ['window_size', 'min_requests']:
+            value = circuit_breaker_config.get(key)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+                logger.error(f"Invalid '{key}' in 'circuit_breaker': {value}")
+                return False
+        failure_rate_threshold = circuit_breaker_config.get('failure_rate_threshold', 0.5)
+        if not isinstance(failure_rate_threshold, (int, float)) or isinstance(failure_rate_threshold, bool) or not 0 < failure_rate_threshold <= 1:
+            logger.error(f"Invalid 'failure_rate_threshold' in 'circuit_breaker': {failure_rate_threshold}")
+            return False
+        open_in_seconds = circuit_breaker_config.get('open_in_seconds')
+        if open_in_seconds is not None and (not isinstance(open_in_seconds, (int, float)) or isinstance(open_in_seconds, bool) or open_in_seconds < 0):
+            logger.error(f"Invalid 'open_in_seconds' in 'circuit_breaker': {open_in_seconds}")
+            return False
+        return True
+
+    def _validate_client_pool_config(self, model_specific_config: dict, model_specific_key: str) -> bool:
+        api_key_config_list = model_specific_config.get('api_keys')
+        if api_key_config_list is not None:
+            if not isinstance(api_key_config_list, list) or not all(isinstance(x, dict) for x in api_key_config_list):
+                logger.error(f"'api_keys' in {model_specific_key} config must be a list of mappings.")
+                return False
+            for api_key_config in api_key_config_list:
+                for key in ['requests_per_minute', 'tokens_per_minute']:
+                    value = api_key_config.get(key)
+                    if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0):
+                        logger.error(f"Invalid '{key}' in 'api_keys' of {model_specific_key} config: {value}")
+                        return False
+        client_pool_config = model_specific_config.get('client_pool') or {}
+        for key in ['eject_after_consecutive_errors', 'ejection_in_seconds']:
+            value = client_pool_config.get(key)
+            if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0):
+                logger.error(f"Invalid '{key}' in 'client_pool' of {model_specific_key} config: {value}")
+                return False
+        return True
+
+    def _validate_simulation_config(self, simulation_config: Optional[dict]) -> bool:
+        if not isinstance(simulation_config, dict):
+            logger.error("Missing 'simulation' in global config.")
+            return False
+        for key in ['error_rate', 'throttle_rate']:
+            value = simulation_config.get(key, 0.0)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0 or value > 1:
+                logger.error(f"Invalid '{key}' in 'simulation': {value}")
+                return False
+        if simulation_config.get('error_rate', 0.0) + simulation_config.get('throttle_rate', 0.0) > 1:
+            logger.error("The sum of 'error_rate' and 'throttle_rate' in 'simulation' must not exceed 1.")
+            return False
+        number_of_candidates = simulation_config.get('number_of_candidates', 1)
+        if not isinstance(number_of_candidates, int) or isinstance(number_of_candidates, bool) or number_of_candidates < 1:
+            logger.error(f"Invalid 'number_of_candidates' in 'simulation': {number_of_candidates}")
+            return False
+        latency_config = simulation_config.get('latency') or {}
+        distribution = latency_config.get('distribution', SimulationEnum.const_distribution_lognormal)
+        if distribution not in [
+            SimulationEnum.const_distribution_constant,
+            SimulationEnum.const_distribution_uniform,
+            SimulationEnum.const_distribution_lognormal
+        ]:
+            logger.error(f"Invalid 'distribution' in 'latency' in 'simulation': {distribution}")
+            return False
+        for (key, value) in [('median_in_seconds', latency_config.get('median_in_seconds', 1.0)), ('sigma', latency_config.get('sigma', 0.5)), ('time_scale', simulation_config.get('time_scale', 1.0)), ('file_ttl_in_seconds', simulation_config.get('file_ttl_in_seconds', 0))]:
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                logger.error(f"Invalid '{key}' in 'simulation': {value}")
+                return False
+        return True
+
 
 class GlobalConfig:
 
@@ -60,14 +394,233 @@ class GlobalConfig:
         validator = GlobalConfigValidator()
         return validator.validate(self.config)
 
+    def get_backend(self) -> str:
+        return self.config['global'].get('backend', GlobalConfigEnum.const_backend_gemini)
+
+    def get_model_specific_config(self) -> dict:
+        return self.config.get(self.get_backend()) or {}
+
+    def get_model_name(self) -> str:
+        if self.get_backend() == GlobalConfigEnum.const_backend_simulation:
+            return self.get_model_specific_config().get('model_name', SimulationEnum.const_model_name)
+        return self.get_model_specific_config().get('model_name', GlobalConfigEnum.const_default_gemini_model_name)
+
+    def get_rate_limits(self) -> tuple[Optional[float], Optional[float]]:
+        """
+        Return (requests per minute, tokens per minute) of the model summed over the API keys. None means that a budget is not limited.
+        """
+        model_specific_config = self.get_model_specific_config()
+        rate_limit_config = (model_specific_config.get('rate_limits') or {}).get(self.get_model_name()) or {}
+        api_key_config_list = model_specific_config.get('api_keys') or [{}]
+        rate_limit_list = []
+        for key in ['requests_per_minute', 'tokens_per_minute']:
+            # A key's own budget takes precedence over that of the model.
+            budget_list = [api_key_config.get(key, rate_limit_config.get(key)) for api_key_config in api_key_config_list]
+            rate_limit_list.append(None if any(x is None for x in budget_list) else sum(budget_list))
+        return (rate_limit_list[0], rate_limit_list[1])
+
+    def get_max_in_flight(self) -> int:
+        return (self.config['global'].get('dispatch') or {}).get('max_in_flight', 1)
+
+    def get_stream(self) -> bool:
+        return (self.config['global'].get('dispatch') or {}).get('stream', False)
+
+    def get_timeouts(self) -> tuple[Optional[float], Optional[float]]:
+        """
+        Return (timeout of one request, timeout of a call including its hedge) in seconds. None means no timeout.
+        """
+        timeouts_config = (self.config['global'].get('dispatch') or {}).get('timeouts') or {}
+        return (timeouts_config.get('request_in_seconds'), timeouts_config.get('total_in_seconds'))
+
+    def get_hedge_policy(self) -> Optional[HedgePolicy]:
+        hedging_config = (self.config['global'].get('dispatch') or {}).get('hedging') or {}
+        if not hedging_config.get('enabled', False):
+            return None
+        return HedgePolicy(
+            percentile=hedging_config.get('percentile', 95),
+            max_hedge_ratio=hedging_config.get('max_hedge_ratio', 0.05),
+            min_samples=hedging_config.get('min_samples', 20),
+            window_size=hedging_config.get('window_size', 500)
+        )
+
+    def get_circuit_breaker(self) -> Optional[CircuitBreaker]:
+        circuit_breaker_config = (self.config['global'].get('dispatch') or {}).get('circuit_breaker') or {}
+        if not circuit_breaker_config.get('enabled', False):
+            return None
+        return CircuitBreaker(
+            window_size=circuit_breaker_config.get('window_size', 20),
+            min_requests=circuit_breaker_config.get('min_requests', 10),
+            failure_rate_threshold=circuit_breaker_config.get('failure_rate_threshold', 0.5),
+            open_in_seconds=circuit_breaker_config.get('open_in_seconds', 30.0)
+        )
+
+    def get_input_image_cache(self) -> Optional['InputImageCache']:
+        max_bytes = (self.config['global'].get('input_image_cache') or {}).get('max_bytes', 0)
+        if not max_bytes:
+            return None
+        from src.image_generator.input_image_cache import InputImageCache  # pylint: disable=import-outside-toplevel
+        return InputImageCache(max_bytes)
+
+    def get_input_image_preprocessor(self) -> Optional['InputImagePreprocessor']:
+        if 'input_image_preprocessing' not in self.config['global']:
+            return None
+        preprocessing_config = self.config['global']['input_image_preprocessing'] or {}
+        if not preprocessing_config.get('enabled', True):
+            return None
+        from src.image_generator.input_image_preprocessor import InputImagePreprocessor  # pylint: disable=import-outside-toplevel
+        # A key without a value, e.g. `quality:`, takes the default.
+        memo_max_bytes = preprocessing_config.get('memo_max_bytes')
+        return InputImagePreprocessor(
+            max_long_edge=preprocessing_config.get('max_long_edge') or 1536,
+            output_format=preprocessing_config.get('format') or InputImagePreprocessorEnum.const_format_jpeg,
+            quality=preprocessing_config.get('quality') or 90,
+            max_memo_bytes=memo_max_bytes if memo_max_bytes is not None else 64 * 1024 * 1024
+        )
+
+    def get_result_cache(self) -> Optional['ResultCache']:
+        if 'result_cache' not in self.config['global']:
+            return None
+        result_cache_config = self.config['global']['result_cache'] or {}
+        if not result_cache_config.get('enabled', True):
+            return None
+        const_default_cache_dir = os.path.join('data', 'cache')
+        cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', result_cache_config.get('directory', const_default_cache_dir))
+        const_default_max_bytes = 1024 * 1024 * 1024
+        from src.image_generator.result_cache import ResultCache  # pylint: disable=import-outside-toplevel
+        return ResultCache(cache_dir, result_cache_config.get('max_bytes', const_default_max_bytes))
+
+    def is_input_upload_cache_enabled(self) -> bool:
+        if 'input_upload_cache' not in self.config['global']:
+            return False
+        return (self.config['global']['input_upload_cache'] or {}).get('enabled', True)
+
+    def get_input_upload_cache(self) -> Optional['InputUploadCache']:
+        if not self.is_input_upload_cache_enabled():
+            return None
+        input_upload_cache_config = self.config['global']['input_upload_cache'] or {}
+        const_default_cache_file = os.path.join('data', 'cache', 'input_upload_cache.sqlite3')
+        cache_file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', input_upload_cache_config.get('file', const_default_cache_file))
+        from src.image_generator.input_upload_cache import InputUploadCache  # pylint: disable=import-outside-toplevel
+        return InputUploadCache(
+            cache_file_path,
+            min_bytes=input_upload_cache_config.get('min_bytes', 0),
+            expiry_margin_in_seconds=input_upload_cache_config.get('expiry_margin_in_seconds', 600)
+        )
+
+    def get_sweep_config(self) -> Optional[dict]:
+        sweep_config = self.config['global'].get('sweep')
+        if sweep_config is None or not sweep_config.get('enabled', True):
+            return None
+        return sweep_config
+
+    def get_input_file_index(self) -> Optional['InputFileIndex']:
+        if 'input_file_index' not in self.config['global']:
+            return None
+        input_file_index_config = self.config['global']['input_file_index'] or {}
+        if not input_file_index_config.get('enabled', True):
+            return None
+        const_default_index_file = os.path.join('data', 'index', 'input_file_index.sqlite3')
+        index_file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', input_file_index_config.get('file', const_default_index_file))
+        from src.image_generator.input_file_index import InputFileIndex  # pylint: disable=import-outside-toplevel
+        return InputFileIndex(index_file_path)
+
+    def get_only_new_or_modified(self) -> bool:
+        return (self.config['global'].get('input_file_index') or {}).get('only_new_or_modified', False)
+
+    def get_input_deduplicator(self, input_file_index: Optional['InputFileIndex'] = None) -> Optional['InputDeduplicator']:
+        if 'deduplication' not in self.config['global']:
+            return None
+        deduplication_config = self.config['global']['deduplication'] or {}
+        if not deduplication_config.get('enabled', True):
+            return None
+        from src.image_generator.input_deduplicator import InputDeduplicator  # pylint: disable=import-outside-toplevel
+        return InputDeduplicator(
+            input_file_index=input_file_index,
+            flag_perceptual=deduplication_config.get('perceptual', False),
+            max_hamming_distance=deduplication_config.get('max_hamming_distance', 4)
+        )
+
+    def get_metrics_dir(self) -> Optional[str]:
+        if 'metrics' not in self.config['global']:
+            return None
+        metrics_config = self.config['global']['metrics'] or {}
+        if not metrics_config.get('enabled', True):
+            return None
+        const_default_metrics_dir = os.path.join('data', 'metrics')
+        return os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', metrics_config.get('directory', const_default_metrics_dir))
+
+    def get_call_metrics_recorder(self, run_id: str) -> Optional[CallMetricsRecorder]:
+        metrics_dir = self.get_metrics_dir()
+        if metrics_dir is None:
+            return None
+        return CallMetricsRecorder(os.path.join(metrics_dir, f"{run_id}.jsonl"), os.path.join(metrics_dir, "image_generator.prom"))
+
+    def get_latency_in_seconds_to_plan(self) -> float:
+        """
+        Return the latency of a call to plan a run with: that of the simulation config,
+        the median of the calls recorded in the metrics of recent runs, or a default.
+        """
+        if self.get_backend() == GlobalConfigEnum.const_backend_simulation:
+            return get_mean_latency_in_seconds(self.get_model_specific_config())
+        metrics_dir = self.get_metrics_dir()
+        latency_in_seconds = load_latency_percentile(metrics_dir, 50) if metrics_dir else None
+        if latency_in_seconds is None:
+            logger.info(f"No call is recorded in the metrics. Assuming {GlobalConfigEnum.const_default_latency_in_seconds} seconds per call.")
+            return GlobalConfigEnum.const_default_latency_in_seconds
+        return latency_in_seconds
+
+    def get_source_directory_watcher(self, dir_path_list: list[str]) -> SourceDirectoryWatcher:
+        watch_config = self.config['global'].get('watch') or {}
+        from src.image_generator.input_file_index import is_input_image_file_name  # pylint: disable=import-outside-toplevel
+        return SourceDirectoryWatcher(
+            dir_path_list,
+            is_input_image_file_name,
+            poll_interval_in_seconds=watch_config.get('poll_interval_in_seconds', 1.0),
+            stable_for_in_seconds=watch_config.get('stable_for_in_seconds', 2.0),
+            use_inotify=watch_config.get('use_inotify', True),
+            include_existing=watch_config.get('include_existing', True)
+        )
+
+    def get_output_image_writer(self) -> 'OutputImageWriter':
+        output_writer_config = self.config['global'].get('output_writer') or {}
+        from src.image_generator.output_image_writer import OutputImageWriter  # pylint: disable=import-outside-toplevel
+        return OutputImageWriter(
+            max_workers=output_writer_config.get('max_workers', 2),
+            max_pending=output_writer_config.get('max_pending', 16),
+            fan_out_mode_list=output_writer_config.get('fan_out', [OutputImageWriterEnum.const_fan_out_hardlink, OutputImageWriterEnum.const_fan_out_reflink]),
+            encoder_options_by_format={
+                'PNG': {'optimize': output_writer_config.get('png_optimize', False), 'compress_level': output_writer_config.get('png_compress_level', 6)},
+                'WEBP': {'quality': output_writer_config.get('quality', 90)},
+                'AVIF': {'quality': output_writer_config.get('quality', 90)}
+            }
+        )
+
+    def get_output_extension(self) -> str:
+        return '.' + (self.config['global'].get('output_writer') or {}).get('format', OutputImageWriterEnum.const_format_png)
+
+    def get_retry_policy(self) -> Optional[RetryPolicy]:
+        if 'retry' not in self.config['global']:
+            return None
+        retry_config = self.config['global']['retry'] or {}
+        return RetryPolicy(
+            max_attempts=retry_config.get('max_attempts', 5),
+            base_delay_in_seconds=retry_config.get('base_delay_in_seconds', 2.0),
+            max_delay_in_seconds=retry_config.get('max_delay_in_seconds', 60.0),
+            retry_budget=retry_config.get('retry_budget')
+        )
+
 
 class MainController:
     """
     Main controller for image generation.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, options: Optional[argparse.Namespace] = None):
+        self.options = options or argparse.Namespace()
+        self.input_file_index: Optional['InputFileIndex'] = None
+        self.input_deduplicator: Optional['InputDeduplicator'] = None
+        # The content of generate_content_config.yaml
+        self.generate_content_config: dict = {}
 
     def _load_config(self, config_path):
         """
@@ -80,10 +633,13 @@ class MainController:
         """
         Load global and generate content configurations.
         """
-        global_config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'config', 'global_config.yaml')
-        global_config = self._load_config(global_config_path)
-        generate_content_config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'config', 'generate_content_config.yaml')
-        generate_content_config = self._load_config(generate_content_config_path)
+        config_dir = getattr(self.options, 'config_dir', None) or os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'config')
+        try:
+            global_config = self._load_config(os.path.join(config_dir, 'global_config.yaml'))
+            generate_content_config = self._load_config(os.path.join(config_dir, 'generate_content_config.yaml'))
+        except (OSError, yaml.YAMLError) as e:
+            logger.error(f"Error loading configuration: {e}")
+            return None, None
 
         global_config_object = GlobalConfig(global_config)
         if not global_config_object.validate():
@@ -94,35 +650,62 @@ class MainController:
         if generate_content_config_key not in generate_content_config:
             logger.error(f"Generate content config key '{generate_content_config_key}' not found in prompt configuration. Exiting.")
             return None, None
-        prompt = generate_content_config[generate_content_config_key].get('prompt', None)
+        self.generate_content_config = generate_content_config
 
-        image_generator_generate_content_config = ImageGeneratorGenerateContentConfig()
-        image_generator_generate_content_config.set_prompt(prompt)
-        if 'temperature' in generate_content_config[generate_content_config_key]:
-            image_generator_generate_content_config.set_temperature(generate_content_config[generate_content_config_key]['temperature'])
-        if 'top_p' in generate_content_config[generate_content_config_key]:
-            image_generator_generate_content_config.set_top_p(generate_content_config[generate_content_config_key]['top_p'])
+        image_generator_generate_content_config = build_image_generator_generate_content_config(generate_content_config[generate_content_config_key])
 
         return global_config_object, image_generator_generate_content_config
 
-    def _build_input_output_file_path_spec(self, global_config_object: GlobalConfig) -> InputOutputFilePathSpec:
+    def _apply_sweep(self, global_config_object: GlobalConfig, input_output_file_path_spec: InputOutputFilePathSpec) -> Optional[InputOutputFilePathSpec]:
+        """
+        Return a spec with every variant of the sweep for each item, or `input_output_file_path_spec` itself if there is no sweep.
+        """
+        sweep_config = global_config_object.get_sweep_config()
+        if sweep_config is None:
+            return input_output_file_path_spec
+        generate_content_config_key = global_config_object.config['global'].get('generate_content_config_key', 'default')
+        sweep_variant_list = build_sweep_variant_list(self.generate_content_config, sweep_config, generate_content_config_key)
+        if sweep_variant_list is None:
+            return None
+        sweep_input_output_file_path_spec = SweepInputOutputFilePathSpec(input_output_file_path_spec, sweep_variant_list)
+        sweep_input_output_file_path_spec.show_sweep_variants()
+        return sweep_input_output_file_path_spec
+
+    def _build_input_output_file_path_spec(self, global_config_object: GlobalConfig, run_id: Optional[str] = None) -> InputOutputFilePathSpec:
         const_source_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'data', 'source')
         const_reference_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'data', 'reference')
         const_output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'data', 'output')
 
+        flag_lazy = global_config_object.config['global']['input_output_spec'].get('lazy', False)
+        flag_recursive = global_config_object.config['global']['input_output_spec'].get('recursive', False)
+        self.input_file_index = global_config_object.get_input_file_index()
+        self.input_deduplicator = global_config_object.get_input_deduplicator(self.input_file_index)
         if global_config_object.config['global']['input_output_spec']['type'] == GlobalConfigEnum.const_type_single_directory:
-            from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForSingleDirectory
+            from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForSingleDirectory  # pylint: disable=import-outside-toplevel
             builder = InputOutputFilePathSpecBuilderForSingleDirectory()
-            return builder.build(const_source_dir, const_output_dir)
+            builder.set_recursive(flag_recursive)
+            builder.set_output_extension(global_config_object.get_output_extension())
+            builder.set_input_file_index(self.input_file_index, global_config_object.get_only_new_or_modified())
+            builder.set_input_deduplicator(self.input_deduplicator)
+            if flag_lazy:
+                return builder.build_lazy(const_source_dir, const_output_dir, run_id)
+            return builder.build(const_source_dir, const_output_dir, run_id)
         elif global_config_object.config['global']['input_output_spec']['type'] == GlobalConfigEnum.const_type_pair_of_directories:
+            from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories  # pylint: disable=import-outside-toplevel
             builder = InputOutputFilePathSpecBuilderForPairOfDirectories()
-            return builder.build(const_source_dir, const_reference_dir, const_output_dir)
+            builder.set_recursive(flag_recursive)
+            builder.set_output_extension(global_config_object.get_output_extension())
+            builder.set_input_file_index(self.input_file_index, global_config_object.get_only_new_or_modified())
+            builder.set_input_deduplicator(self.input_deduplicator)
+            if flag_lazy:
+                return builder.build_lazy(const_source_dir, const_reference_dir, const_output_dir, run_id)
+            return builder.build(const_source_dir, const_reference_dir, const_output_dir, run_id)
         else:
             logger.error(f"Unsupported input_output_spec type: {global_config_object.config['global']['input_output_spec']['type']}")
             return None
 
-    def _build_and_show_input_output_file_path_spec(self, global_config_object: GlobalConfig) -> Optional[InputOutputFilePathSpec]:
-        input_output_file_path_spec = self._build_input_output_file_path_spec(global_config_object)
+    def _build_and_show_input_output_file_path_spec(self, global_config_object: GlobalConfig, run_id: Optional[str] = None) -> Optional[InputOutputFilePathSpec]:
+        input_output_file_path_spec = self._build_input_output_file_path_spec(global_config_object, run_id)
 
         if input_output_file_path_spec is None:
             logger.error("InputOutputFilePathSpec is None. Exiting.")
@@ -132,6 +715,55 @@ class MainController:
 
         return input_output_file_path_spec
 
+    def _plan_run(self, global_config_object: GlobalConfig, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, input_output_file_path_spec: InputOutputFilePathSpec) -> 'RunPlan':
+        """
+        Estimate and show the calls, upload bytes, tokens and wall time of a run without calling the API or decoding any image.
+        """
+        from src.image_generator.run_planner import RunPlanner  # pylint: disable=import-outside-toplevel
+        (requests_per_minute, tokens_per_minute) = global_config_object.get_rate_limits()
+        run_planner = RunPlanner(global_config_object.get_model_name(), global_config_object.get_latency_in_seconds_to_plan(), global_config_object.get_max_in_flight(), requests_per_minute, tokens_per_minute)
+        run_planner.set_input_file_index(self.input_file_index)
+        run_planner.set_input_image_preprocessor(global_config_object.get_input_image_preprocessor())
+        run_planner.set_upload_once(global_config_object.is_input_upload_cache_enabled())
+        result_cache = None if getattr(self.options, 'no_cache', False) else global_config_object.get_result_cache()
+        run_planner.set_result_cache(result_cache)
+        try:
+            run_plan = run_planner.plan(input_output_file_path_spec, image_generator_generate_content_config)
+        finally:
+            if result_cache:
+                result_cache.close()
+        logger.info(f"[RunPlan] Max in flight: {global_config_object.get_max_in_flight()}, Requests per minute: {requests_per_minute}, Tokens per minute: {tokens_per_minute}, Latency: {run_planner.latency_in_seconds:.1f} seconds per call")
+        run_plan.show()
+        return run_plan
+
+    def _get_run_journal(self, global_config_object: GlobalConfig) -> Optional[RunJournal]:
+        """
+        Get the journal of a new run, or load the journal of the run to resume.
+        """
+        const_journal_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'data', 'journal')
+        run_id_to_resume = getattr(self.options, 'resume', None)
+        if run_id_to_resume:
+            run_journal = RunJournal(const_journal_dir, run_id_to_resume)
+            header = run_journal.load()
+            if header is None:
+                logger.error(f"Journal of run {run_id_to_resume} is not found. Exiting.")
+                return None
+            input_output_spec_type = global_config_object.config['global']['input_output_spec']['type']
+            if header.get('input_output_spec_type', input_output_spec_type) != input_output_spec_type:
+                logger.error(f"Run {run_id_to_resume} used input_output_spec type '{header.get('input_output_spec_type')}', but the config has '{input_output_spec_type}'. Exiting.")
+                return None
+            logger.info(f"Resuming run {run_id_to_resume}: {run_journal.get_count_by_state()}")
+            return run_journal
+        from src.image_generator.input_output_file_path_spec_builder import get_date_and_time_part  # pylint: disable=import-outside-toplevel
+        run_id = get_date_and_time_part()
+        run_journal = RunJournal(const_journal_dir, run_id)
+        suffix = 0
+        while run_journal.exists():
+            suffix += 1
+            run_journal = RunJournal(const_journal_dir, f"{run_id}-{suffix}")
+        logger.info(f"Run ID: {run_journal.run_id}. If this run is interrupted, resume it with --resume {run_journal.run_id}")
+        return run_journal
+
     def _get_user_input_to_continue(self) -> bool:
         """
         Get user input to continue or exit.
@@ -146,32 +778,257 @@ class MainController:
             else:
                 print("Invalid input. Please type 'continue' or 'exit'.")
 
-    def do_main_task(self):
+    def do_main_task(self) -> bool:
         """
         Main task function to load config and perform image generation.
         """
         (global_config_object, image_generator_generate_content_config) = self._get_global_config_and_generate_content_config()
         if not global_config_object or not image_generator_generate_content_config:
-            return
-        input_output_file_path_spec = self._build_and_show_input_output_file_path_spec(global_config_object)
-        if not input_output_file_path_spec:
-            return
-        flag_continue = self._get_user_input_to_continue()
+            return False
+        run_journal = self._get_run_journal(global_config_object)
+        if not run_journal:
+            return False
+        input_output_file_path_spec = self._build_and_show_input_output_file_path_spec(global_config_object, run_journal.run_id)
+        if input_output_file_path_spec is None:
+            return False
+        input_output_file_path_spec = self._apply_sweep(global_config_object, input_output_file_path_spec)
+        if input_output_file_path_spec is None:
+            return False
+        self._plan_run(global_config_object, image_generator_generate_content_config, input_output_file_path_spec)
+        flag_continue = getattr(self.options, 'yes', False) or self._get_user_input_to_continue()
         if not flag_continue:
-            return
-        if global_config_object.config.get('gemini'):
+            return True
+        run_journal.open({
+            'input_output_spec_type': global_config_object.config['global']['input_output_spec']['type'],
+            'generate_content_config_key': global_config_object.config['global'].get('generate_content_config_key', 'default'),
+            'total': input_output_file_path_spec.get_number_of_items(),
+            'sweep_variants': [x.get_label() for x in input_output_file_path_spec.sweep_variant_list] if isinstance(input_output_file_path_spec, SweepInputOutputFilePathSpec) else None
+        })
+        try:
+            flag_success = self._do_generation(global_config_object, image_generator_generate_content_config, input_output_file_path_spec, run_journal)
+        finally:
+            run_journal.close()
+        if self.input_deduplicator:
+            self.input_deduplicator.show_stats()
+        if self.input_file_index:
+            # Files of an interrupted run stay new or modified, so that the next run picks them up again.
+            if flag_success:
+                self.input_file_index.save()
+            self.input_file_index.show_stats()
+            self.input_file_index.close()
+        return flag_success
+
+    def _create_image_generator(self, global_config_object: GlobalConfig, run_journal: Optional[RunJournal] = None) -> Optional["ImageGeneratorForGemini"]:
+        # Imported here, not at the top, because the Gemini SDK takes a long time to import.
+        if global_config_object.get_backend() == GlobalConfigEnum.const_backend_simulation:
+            from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation  # pylint: disable=import-outside-toplevel
+            image_generator = ImageGeneratorForSimulation()
+        elif global_config_object.config.get('gemini'):
+            from src.image_generator.image_generator_for_gemini import ImageGeneratorForGemini  # pylint: disable=import-outside-toplevel
             image_generator = ImageGeneratorForGemini()
-            model_specific_config = global_config_object.config['gemini']
-            image_generator.do_generation(model_specific_config, image_generator_generate_content_config, input_output_file_path_spec)
         else:
             logger.error("Gemini is not configured. Exiting.")
-            return
+            return None
+        image_generator.set_max_in_flight(global_config_object.get_max_in_flight())
+        image_generator.set_stream(global_config_object.get_stream())
+        image_generator.set_timeouts(*global_config_object.get_timeouts())
+        image_generator.set_hedge_policy(global_config_object.get_hedge_policy())
+        image_generator.set_circuit_breaker(global_config_object.get_circuit_breaker())
+        image_generator.set_retry_policy(global_config_object.get_retry_policy())
+        image_generator.set_input_image_cache(global_config_object.get_input_image_cache())
+        image_generator.set_input_image_preprocessor(global_config_object.get_input_image_preprocessor())
+        if not getattr(self.options, 'no_cache', False):
+            image_generator.set_result_cache(global_config_object.get_result_cache())
+        image_generator.set_input_upload_cache(global_config_object.get_input_upload_cache())
+        image_generator.set_run_journal(run_journal)
+        image_generator.set_output_image_writer(global_config_object.get_output_image_writer())
+        return image_generator
+
+    def _do_generation(self, global_config_object: GlobalConfig, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, input_output_file_path_spec: InputOutputFilePathSpec, run_journal: RunJournal) -> bool:
+        image_generator = self._create_image_generator(global_config_object, run_journal)
+        if not image_generator:
+            return False
+        if image_generator.input_image_cache is None and isinstance(input_output_file_path_spec, SweepInputOutputFilePathSpec):
+            # The variants of an item come one after another. A small cache is enough for them to share its decoded inputs.
+            const_sweep_input_image_cache_max_bytes = 64 * 1024 * 1024
+            from src.image_generator.input_image_cache import InputImageCache  # pylint: disable=import-outside-toplevel
+            image_generator.set_input_image_cache(InputImageCache(const_sweep_input_image_cache_max_bytes))
+        call_metrics_recorder = global_config_object.get_call_metrics_recorder(run_journal.run_id)
+        image_generator.set_call_metrics_recorder(call_metrics_recorder)
+        model_specific_config = global_config_object.get_model_specific_config()
+        try:
+            return image_generator.do_generation(model_specific_config, image_generator_generate_content_config, input_output_file_path_spec)
+        finally:
+            if call_metrics_recorder:
+                call_metrics_recorder.close()
+
+    def do_watch_task(self) -> bool:
+        """
+        Watch the source (and reference) directories and generate images for new files until interrupted.
+        """
+        (global_config_object, image_generator_generate_content_config) = self._get_global_config_and_generate_content_config()
+        if not global_config_object or not image_generator_generate_content_config:
+            return False
+        run_journal = self._get_run_journal(global_config_object)
+        if not run_journal:
+            return False
+        const_source_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'data', 'source')
+        const_reference_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'data', 'reference')
+        const_output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'data', 'output')
+        input_output_spec_type = global_config_object.config['global']['input_output_spec']['type']
+        reference_dir = const_reference_dir if input_output_spec_type == GlobalConfigEnum.const_type_pair_of_directories else None
+        image_generator = self._create_image_generator(global_config_object, run_journal)
+        if not image_generator:
+            return False
+        if not image_generator.initialize(global_config_object.get_model_specific_config()):
+            return False
+        watcher = global_config_object.get_source_directory_watcher([const_source_dir] + ([reference_dir] if reference_dir else []))
+        from src.image_generator.watch_folder_daemon import WatchFolderDaemon  # pylint: disable=import-outside-toplevel
+        daemon = WatchFolderDaemon(image_generator, image_generator_generate_content_config, watcher, const_source_dir, const_output_dir, run_journal.run_id, reference_dir)
+        daemon.set_output_extension(global_config_object.get_output_extension())
+        call_metrics_recorder = global_config_object.get_call_metrics_recorder(run_journal.run_id)
+        image_generator.set_call_metrics_recorder(call_metrics_recorder)
+
+        def handle_signal(signum, _) -> None:
+            logger.info(f"Received signal {signum}. Stopping...")
+            daemon.stop()
+
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+        run_journal.open({
+            'input_output_spec_type': input_output_spec_type,
+            'generate_content_config_key': global_config_object.config['global'].get('generate_content_config_key', 'default'),
+            'watch': True
+        })
+        try:
+            daemon.run()
+        finally:
+            run_journal.close()
+            if call_metrics_recorder:
+                call_metrics_recorder.close()
+        return True
+
+    def do_validate_task(self) -> bool:
+        """
+        Validate the configuration without building the spec or calling the API.
+        """
+        (global_config_object, image_generator_generate_content_config) = self._get_global_config_and_generate_content_config()
+        if not global_config_object or not image_generator_generate_content_config:
+            return False
+        logger.info("The configuration is valid.")
+        return True
+
+    def do_plan_task(self) -> bool:
+        """
+        Build and show the spec of a run, and estimate its cost and wall time, without calling the API.
+        """
+        (global_config_object, image_generator_generate_content_config) = self._get_global_config_and_generate_content_config()
+        if not global_config_object or not image_generator_generate_content_config:
+            return False
+        from src.image_generator.input_output_file_path_spec_builder import get_date_and_time_part  # pylint: disable=import-outside-toplevel
+        input_output_file_path_spec = self._build_and_show_input_output_file_path_spec(global_config_object, get_date_and_time_part())
+        try:
+            if input_output_file_path_spec is None:
+                return False
+            input_output_file_path_spec = self._apply_sweep(global_config_object, input_output_file_path_spec)
+            if input_output_file_path_spec is None:
+                return False
+            self._plan_run(global_config_object, image_generator_generate_content_config, input_output_file_path_spec)
+        finally:
+            if self.input_file_index:
+                # Planning does not count as a run. Files stay new or modified until a run completes.
+                self.input_file_index.close()
+        logger.info(f"Planned {input_output_file_path_spec.get_number_of_items()} request(s) with the {global_config_object.get_backend()} backend.")
+        return True
+
+    def do_list_models_task(self) -> bool:
+        """
+        List the models available to the configured backend.
+        """
+        (global_config_object, image_generator_generate_content_config) = self._get_global_config_and_generate_content_config()
+        if not global_config_object or not image_generator_generate_content_config:
+            return False
+        image_generator = self._create_image_generator(global_config_object)
+        if not image_generator:
+            return False
+        if not image_generator.initialize(global_config_object.get_model_specific_config()):
+            return False
+        image_generator.list_all_models()
+        return True
+
+    def do_batch_export_task(self, request_file_path: str, inline: bool = True) -> bool:
+        """
+        Write a JSONL batch request file and its manifest for the spec, without calling the API.
+        """
+        (global_config_object, image_generator_generate_content_config) = self._get_global_config_and_generate_content_config()
+        if not global_config_object or not image_generator_generate_content_config:
+            return False
+        from src.image_generator.input_output_file_path_spec_builder import get_date_and_time_part  # pylint: disable=import-outside-toplevel
+        input_output_file_path_spec = self._build_and_show_input_output_file_path_spec(global_config_object, get_date_and_time_part())
+        if not input_output_file_path_spec:
+            return False
+        image_generator = self._create_image_generator(global_config_object)
+        if not image_generator:
+            return False
+        model_specific_config = global_config_object.get_model_specific_config()
+        return image_generator.export_batch_request_file(model_specific_config, image_generator_generate_content_config, input_output_file_path_spec, request_file_path, inline)
+
+    def do_batch_import_task(self, result_file_path: str, manifest_file_path: str) -> bool:
+        """
+        Write the images of a JSONL batch result file to the output paths in the manifest.
+        """
+        (global_config_object, image_generator_generate_content_config) = self._get_global_config_and_generate_content_config()
+        if not global_config_object or not image_generator_generate_content_config:
+            return False
+        image_generator = self._create_image_generator(global_config_object)
+        if not image_generator:
+            return False
+        return image_generator.import_batch_result_file(result_file_path, manifest_file_path)
+
+
+def _add_run_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--yes', action='store_true', help="Start generation without asking for confirmation.")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the result cache. Always call the API.")
+    parser.add_argument('--resume', metavar='RUN_ID', help="Resume an interrupted run. Items which are already done are skipped.")
+    parser.add_argument('--watch', action='store_true', help="Keep running and generate images for files as they arrive in the source (and reference) directories.")
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate images with generative AI models.")
+    # The options of a run are accepted with and without the 'run' command for compatibility.
+    _add_run_arguments(parser)
+    parser.add_argument('--config-dir', metavar='DIR', help="The directory of global_config.yaml and generate_content_config.yaml. Default: config")
+    parser.add_argument('--export-batch', metavar='REQUEST_FILE', help="Write a JSONL batch request file and its manifest instead of calling the API.")
+    parser.add_argument('--reference-inputs', action='store_true', help="With --export-batch, upload input images with the Files API of the first API key and reference them by URI instead of inlining them.")
+    parser.add_argument('--import-batch-results', nargs=2, metavar=('RESULT_FILE', 'MANIFEST_FILE'), help="Write the images of a JSONL batch result file to the output paths in the manifest.")
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    subparsers.add_parser('validate', help="Validate the configuration.")
+    subparsers.add_parser('plan', help="Build and show the work items of a run, and estimate its calls, upload bytes, tokens and wall time, without calling the API.")
+    # Suppress the defaults, so that the options given before 'run' are not reset.
+    _add_run_arguments(subparsers.add_parser('run', argument_default=argparse.SUPPRESS, help="Generate images. This is the default command."))
+    subparsers.add_parser('list-models', help="List the models available to the configured backend.")
+    return parser.parse_args(argv)
 
 
-def main():
-    main_controller = MainController()
-    main_controller.do_main_task()
+def main(argv: Optional[list[str]] = None) -> int:
+    options = parse_args(argv)
+    main_controller = MainController(options)
+    if options.command == 'validate':
+        result = main_controller.do_validate_task()
+    elif options.command == 'plan':
+        result = main_controller.do_plan_task()
+    elif options.command == 'list-models':
+        result = main_controller.do_list_models_task()
+    elif options.export_batch:
+        result = main_controller.do_batch_export_task(options.export_batch, inline=not options.reference_inputs)
+    elif options.import_batch_results:
+        result = main_controller.do_batch_import_task(*options.import_batch_results)
+    elif options.watch:
+        result = main_controller.do_watch_task()
+    else:
+        result = main_controller.do_main_task()
+    return 0 if result else 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
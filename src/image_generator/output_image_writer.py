@@ -0,0 +1,257 @@
+"""
+Define OutputImageWriter class.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Optional, TYPE_CHECKING
+
+from loguru import logger
+from PIL import Image
+
+from src.image_generator.input_file_index import sniff_image_format
+from src.image_generator.output_image_writer_enum import OutputImageWriterEnum
+
+if TYPE_CHECKING:
+    from src.image_generator.call_metrics import CallMetrics
+
+
+def gather_write_futures(future_list: list[Future], on_complete: Optional[Callable[[list[str], Optional[Exception]], None]] = None) -> Future:
+    """
+    Return a future of the written paths of all of `future_list`, e.g. the images of one response submitted one by one.
+    `on_complete` is called with the written paths and the first error, if any, before the returned future completes.
+    """
+    gathered_future: Future = Future()
+    lock = threading.Lock()
+    count_remaining = [len(future_list)]
+
+    def on_done(_: Optional[Future]) -> None:
+        with lock:
+            count_remaining[0] -= 1
+            if count_remaining[0] > 0:
+                return
+        written_file_path_list: list[str] = []
+        error = None
+        for future in future_list:
+            if future.exception() is not None:
+                error = error or future.exception()
+            else:
+                written_file_path_list.extend(future.result())
+        if on_complete is not None:
+            on_complete(written_file_path_list, error)
+        if error is not None:
+            gathered_future.set_exception(error)
+        else:
+            gathered_future.set_result(written_file_path_list)
+
+    if not future_list:
+        count_remaining[0] = 1
+        on_done(None)
+    for future in future_list:
+        future.add_done_callback(on_done)
+    return gathered_future
+
+
+def write_file_atomically(file_path: str, data: bytes) -> None:
+    """
+    Write `data` to a temporary file next to `file_path` and rename it, so that a reader never sees a partial file.
+    The directory of `file_path` is created if it does not exist, e.g. a subdirectory mirroring the input directory.
+    """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    (fd, temp_file_path) = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="wb") as f:
+            f.write(data)
+        os.replace(temp_file_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_file_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _reflink(source_file_path: str, target_file_path: str) -> None:
+    # FICLONE of linux/fs.h. Supported by Btrfs, XFS and some others.
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflink is supported on Linux only.")
+    import fcntl  # pylint: disable=import-outside-toplevel
+    const_ficlone = 0x40049409
+    with open(source_file_path, mode="rb") as source, open(target_file_path, mode="wb") as target:
+        fcntl.ioctl(target.fileno(), const_ficlone, source.fileno())
+
+
+def clone_file_atomically(source_file_path: str, target_file_path: str, fan_out_mode_list: list[str]) -> str:
+    """
+    Make `target_file_path` have the same content as `source_file_path`.
+    Try the modes of `fan_out_mode_list` in order, and fall back to a byte copy.
+    Returns the mode which worked.
+    """
+    os.makedirs(os.path.dirname(target_file_path) or ".", exist_ok=True)
+    (fd, temp_file_path) = tempfile.mkstemp(dir=os.path.dirname(target_file_path) or ".", prefix=f".{os.path.basename(target_file_path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        for fan_out_mode in fan_out_mode_list + [OutputImageWriterEnum.const_fan_out_copy]:
+            try:
+                if fan_out_mode == OutputImageWriterEnum.const_fan_out_hardlink:
+                    os.remove(temp_file_path)
+                    os.link(source_file_path, temp_file_path)
+                elif fan_out_mode == OutputImageWriterEnum.const_fan_out_reflink:
+                    _reflink(source_file_path, temp_file_path)
+                else:
+                    shutil.copyfile(source_file_path, temp_file_path)
+            except OSError:
+                if fan_out_mode == OutputImageWriterEnum.const_fan_out_copy:
+                    raise
+                continue
+            os.replace(temp_file_path, target_file_path)
+            return fan_out_mode
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+    raise OSError(f"Failed to clone {source_file_path} to {target_file_path}.")
+
+
+def get_format_from_file_path(file_path: str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    image_format = Image.registered_extensions().get(extension)
+    if image_format is None:
+        raise ValueError(f"Unknown image file extension: {file_path}")
+    return image_format
+
+
+class OutputImageWriter:
+    """
+    Encode a generated image once and write it to all of its output paths in a bounded worker pool.
+    An image which is already in the format of the output extension, e.g. a PNG for ".png", is written as it is without decoding.
+    Otherwise it is converted with the options of `encoder_options_by_format`, e.g. {"PNG": {"compress_level": 9}, "WEBP": {"quality": 80}}.
+    The first path is written atomically. The other paths are hardlinked or reflinked to it, falling back to a byte copy.
+    `max_workers` of 0 writes synchronously on the caller's thread.
+    At most `max_pending` images wait in the pool. `submit` blocks the caller beyond that.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, fan_out_mode_list: list[str] | None = None, encoder_options_by_format: Optional[dict[str, dict]] = None):
+        self.max_workers = max_workers
+        self.encoder_options_by_format = encoder_options_by_format or {}
+        self.fan_out_mode_list = fan_out_mode_list if fan_out_mode_list is not None else [OutputImageWriterEnum.const_fan_out_hardlink, OutputImageWriterEnum.const_fan_out_reflink]
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="output_writer") if max_workers > 0 else None
+        self.pending_semaphore = threading.BoundedSemaphore(max(1, max_pending))
+        self.count_images = 0
+        self.count_files = 0
+        self.count_failures = 0
+        self.count_passthrough = 0
+        self.count_converted = 0
+        self.output_bytes = 0
+        self.count_by_fan_out_mode: dict[str, int] = {}
+        self.encode_time_in_seconds = 0.0
+        self.write_time_in_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def submit(self, image_list: list[tuple[bytes, list[str]]], on_complete: Optional[Callable[[list[str], Optional[Exception]], None]] = None, call_metrics: Optional["CallMetrics"] = None) -> Future:
+        """
+        Write each (image bytes, output paths) of `image_list` in the background.
+        `on_complete` is called on the worker with the written paths and the error, if any, before the returned future completes.
+        The encode and write times are added to `call_metrics`, if given.
+        The returned future has the written paths, or the exception on failure.
+        """
+        if self.executor is None:
+            future: Future = Future()
+            try:
+                future.set_result(self._write_all(image_list, on_complete, call_metrics))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                future.set_exception(e)
+            return future
+        self.pending_semaphore.acquire()
+        future = self.executor.submit(self._write_all, image_list, on_complete, call_metrics)
+        future.add_done_callback(lambda _: self.pending_semaphore.release())
+        return future
+
+    def flush(self) -> None:
+        """
+        Wait until every submitted image is written and every callback of the futures has run.
+        """
+        if self.executor is None:
+            return
+        # Shutting down joins the workers, which run the done callbacks of their futures.
+        self.executor.shutdown(wait=True)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="output_writer")
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def _encode(self, image_bytes: bytes, image_format: str) -> tuple[bytes, bool]:
+        """
+        Return the bytes of the image in `image_format`, and whether they are `image_bytes` as they are.
+        """
+        image_format_of_bytes = sniff_image_format(image_bytes[:16])
+        if image_format_of_bytes is not None and image_format_of_bytes.upper() == image_format:
+            return (image_bytes, True)
+        with Image.open(BytesIO(image_bytes)) as image:
+            bytesio = BytesIO()
+            if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image.convert("RGB").save(bytesio, format=image_format, **self.encoder_options_by_format.get(image_format, {}))
+            else:
+                image.save(bytesio, format=image_format, **self.encoder_options_by_format.get(image_format, {}))
+        return (bytesio.getvalue(), False)
+
+    def _write_all(self, image_list: list[tuple[bytes, list[str]]], on_complete: Optional[Callable[[list[str], Optional[Exception]], None]], call_metrics: Optional["CallMetrics"] = None) -> list[str]:
+        written_file_path_list: list[str] = []
+        try:
+            for (image_bytes, output_file_path_list) in image_list:
+                written_file_path_list.extend(self._write(image_bytes, output_file_path_list, call_metrics))
+        except Exception as e:
+            if on_complete is not None:
+                on_complete(written_file_path_list, e)
+            raise
+        if on_complete is not None:
+            on_complete(written_file_path_list, None)
+        return written_file_path_list
+
+    def _write(self, image_bytes: bytes, output_file_path_list: list[str], call_metrics: Optional["CallMetrics"] = None) -> list[str]:
+        try:
+            start = time.perf_counter()
+            (encoded, flag_passthrough) = self._encode(image_bytes, get_format_from_file_path(output_file_path_list[0]))
+            encode_time_in_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            write_file_atomically(output_file_path_list[0], encoded)
+            output_bytes = len(encoded)
+            fan_out_mode_list = []
+            for output_file_path in output_file_path_list[1:]:
+                if get_format_from_file_path(output_file_path) == get_format_from_file_path(output_file_path_list[0]):
+                    fan_out_mode_list.append(clone_file_atomically(output_file_path_list[0], output_file_path, self.fan_out_mode_list))
+                else:
+                    (encoded_in_other_format, _) = self._encode(image_bytes, get_format_from_file_path(output_file_path))
+                    write_file_atomically(output_file_path, encoded_in_other_format)
+                    output_bytes += len(encoded_in_other_format)
+            write_time_in_seconds = time.perf_counter() - start
+        except Exception as e:
+            with self.lock:
+                self.count_failures += 1
+            logger.error(f"Failed to write {output_file_path_list}: {e}")
+            raise
+        with self.lock:
+            self.count_images += 1
+            self.count_files += len(output_file_path_list)
+            self.encode_time_in_seconds += encode_time_in_seconds
+            self.write_time_in_seconds += write_time_in_seconds
+            self.output_bytes += output_bytes
+            if flag_passthrough:
+                self.count_passthrough += 1
+            else:
+                self.count_converted += 1
+            for fan_out_mode in fan_out_mode_list:
+                self.count_by_fan_out_mode[fan_out_mode] = self.count_by_fan_out_mode.get(fan_out_mode, 0) + 1
+        if call_metrics is not None:
+            call_metrics.add_output_times(encode_time_in_seconds, write_time_in_seconds, output_bytes)
+        logger.info(f"Saved {output_file_path_list}.")
+        return list(output_file_path_list)
+
+    def show_stats(self) -> None:
+        logger.info(f"[OutputImageWriter] Images: {self.count_images}, Files: {self.count_files}, Failures: {self.count_failures}, Passthrough: {self.count_passthrough}, Converted: {self.count_converted}, Output: {self.output_bytes} bytes, Fan-out: {self.count_by_fan_out_mode}, Encode time: {self.encode_time_in_seconds:.3f} s, Write time: {self.write_time_in_seconds:.3f} s")
@@ -0,0 +1,13 @@
+"""
+Define OutputImageWriterEnum class.
+It is kept apart from the writer, so that the config can be validated without importing PIL.
+"""
+
+
+class OutputImageWriterEnum:
+    const_fan_out_hardlink = "hardlink"
+    const_fan_out_reflink = "reflink"
+    const_fan_out_copy = "copy"
+    const_format_png = "png"
+    const_format_webp = "webp"
+    const_format_avif = "avif"
@@ -0,0 +1,92 @@
+"""
+Define SweepInputOutputFilePathSpec class and its helpers, which run every combination of prompts and generation parameters as one job.
+"""
+import itertools
+from typing import Iterator, Optional
+
+from loguru import logger
+
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig, build_image_generator_generate_content_config
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec, InputOutputFilePathSpecItem, get_indexed_file_path
+
+
+class SweepVariant:
+    """
+    One combination of a generate content config key and generation parameters in a sweep.
+    """
+
+    def __init__(self, index: int, generate_content_config_key: str, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig):
+        self.index = index
+        self.generate_content_config_key = generate_content_config_key
+        self.image_generator_generate_content_config = image_generator_generate_content_config
+
+    def get_label(self) -> str:
+        config = self.image_generator_generate_content_config
+        return f"variant.{self.index}: {self.generate_content_config_key}, temperature={config.get_temperature()}, top_p={config.get_top_p()}, candidate_count={config.get_candidate_count()}"
+
+
+class SweepItem(InputOutputFilePathSpecItem):
+    """
+    A work item of one variant of a sweep.
+    """
+
+    __slots__ = ('variant',)
+
+    def __init__(self, input_file_path_list: "tuple[str, ...] | list[str]", output_file_path_list: "tuple[str, ...] | list[str]", variant: SweepVariant):
+        super().__init__(input_file_path_list, output_file_path_list)
+        self.variant = variant
+
+
+def build_sweep_variant_list(generate_content_config: dict, sweep_config: dict, default_generate_content_config_key: str) -> Optional[list[SweepVariant]]:
+    """
+    Return one variant per combination of the keys, temperatures and top_p values of `sweep_config`.
+    A parameter which is not swept keeps the value of the key in generate_content_config.yaml.
+    """
+    generate_content_config_key_list = sweep_config.get('generate_content_config_keys') or [default_generate_content_config_key]
+    temperature_list = sweep_config.get('temperature') or [None]
+    top_p_list = sweep_config.get('top_p') or [None]
+    candidate_count = sweep_config.get('candidate_count')
+    sweep_variant_list = []
+    for (generate_content_config_key, temperature, top_p) in itertools.product(generate_content_config_key_list, temperature_list, top_p_list):
+        if generate_content_config_key not in generate_content_config:
+            logger.error(f"Generate content config key '{generate_content_config_key}' in 'sweep' is not found in prompt configuration.")
+            return None
+        image_generator_generate_content_config = build_image_generator_generate_content_config(generate_content_config[generate_content_config_key])
+        if temperature is not None:
+            image_generator_generate_content_config.set_temperature(temperature)
+        if top_p is not None:
+            image_generator_generate_content_config.set_top_p(top_p)
+        if candidate_count is not None:
+            image_generator_generate_content_config.set_candidate_count(candidate_count)
+        sweep_variant_list.append(SweepVariant(len(sweep_variant_list), generate_content_config_key, image_generator_generate_content_config))
+    return sweep_variant_list
+
+
+class SweepInputOutputFilePathSpec(InputOutputFilePathSpec):
+    """
+    A spec with one item per (item of `input_output_file_path_spec`, variant).
+    The outputs of variant N are named `<name>.variant.N.<ext>`, and their candidates `<name>.variant.N.candidate.M.<ext>`.
+    The variants of an item come one after another, so that its inputs are decoded and uploaded once and taken from the caches for the other variants.
+    """
+
+    def __init__(self, input_output_file_path_spec: InputOutputFilePathSpec, sweep_variant_list: list[SweepVariant]):
+        super().__init__()
+        self.input_output_file_path_spec = input_output_file_path_spec
+        self.sweep_variant_list = sweep_variant_list
+
+    def add_item_with_lists(self, input_file_path_list: list[str], output_file_path_list: list[str]) -> None:
+        raise TypeError("SweepInputOutputFilePathSpec does not support adding items.")
+
+    def iter_items(self) -> Iterator[SweepItem]:
+        for item in self.input_output_file_path_spec.iter_items():
+            for variant in self.sweep_variant_list:
+                output_file_path_list = [get_indexed_file_path(x, "variant", variant.index) for x in item.output_file_path_list]
+                yield SweepItem(item.input_file_path_list, output_file_path_list, variant)
+
+    def get_number_of_items(self) -> int:
+        return self.input_output_file_path_spec.get_number_of_items() * len(self.sweep_variant_list)
+
+    def show_sweep_variants(self) -> None:
+        logger.info(f"[Sweep] {len(self.sweep_variant_list)} variant(s) x {self.input_output_file_path_spec.get_number_of_items()} item(s):")
+        for variant in self.sweep_variant_list:
+            logger.info(f"[Sweep] {variant.get_label()}")
@@ -0,0 +1,181 @@
+"""
+Define AdaptiveRateLimiter class.
+"""
+from collections import deque
+import threading
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+
+
+def estimate_number_of_tokens(prompt: str, image_size_list: list[tuple[int, int]], number_of_candidates: int = 1) -> int:
+    """
+    Estimate the number of tokens of one request with input images of `image_size_list`, (width, height) each, before sending it.
+    """
+    # Roughly 4 characters per text token.
+    number_of_tokens = len(prompt or "") // 4 + 1
+    # An image counts as 258 tokens if both dimensions are <= 384 pixels.
+    # Otherwise, it is cropped into tiles of 768x768 pixels, each of which counts as 258 tokens.
+    const_tokens_per_tile = 258
+    const_tile_size = 768
+    for (width, height) in image_size_list:
+        if width <= 384 and height <= 384:
+            number_of_tokens += const_tokens_per_tile
+        else:
+            number_of_tiles = -(-width // const_tile_size) * -(-height // const_tile_size)
+            number_of_tokens += const_tokens_per_tile * number_of_tiles
+    # An output image counts as 1290 tokens.
+    const_tokens_per_output_image = 1290
+    number_of_tokens += const_tokens_per_output_image * number_of_candidates
+    return number_of_tokens
+
+
+class TokenBucket:
+    """
+    A token bucket which holds at most `capacity_per_minute` tokens and refills at `capacity_per_minute` / 60 per second.
+    """
+
+    def __init__(self, capacity_per_minute: float, now: float):
+        self.capacity = float(capacity_per_minute)
+        self.tokens = float(capacity_per_minute)
+        self.last_refill = now
+
+    def refill(self, now: float, rate_factor: float) -> None:
+        elapsed = max(0.0, now - self.last_refill)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / 60.0 * rate_factor)
+        self.last_refill = now
+
+    def get_time_until_available(self, amount: float, rate_factor: float) -> float:
+        # A request larger than the whole bucket goes through once the bucket is full.
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.capacity / 60.0 * rate_factor)
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """
+        Correct a previous `consume` by `amount`. A positive amount takes more tokens.
+        """
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AdaptiveRateLimiter:
+    """
+    Pace requests with requests-per-minute and tokens-per-minute budgets.
+    The effective rate is multiplied by a factor which decreases multiplicatively when the API throttles us
+    and increases additively on success (AIMD). A retry-after hint blocks every request until it expires.
+    When no requests-per-minute budget is configured, the first throttling sets it from the measured request rate.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        now = self.clock()
+        self.request_bucket = TokenBucket(requests_per_minute, now) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, now) if tokens_per_minute else None
+        self.rate_factor = 1.0
+        self.const_min_rate_factor = 0.05
+        self.const_multiplicative_decrease = 0.5
+        self.const_additive_increase = 0.05
+        self.blocked_until = 0.0
+        self.recent_request_time_list: deque[float] = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int = 0, cancel_event: Optional[threading.Event] = None) -> bool:
+        """
+        Block until a request with `estimated_tokens` may be sent.
+        Returns False if `cancel_event` is set while waiting.
+        """
+        while True:
+            time_to_wait = self.try_acquire(estimated_tokens)
+            if time_to_wait <= 0:
+                return True
+            logger.debug(f"Rate limiter: waiting for {time_to_wait:.2f} seconds...")
+            if cancel_event is not None:
+                if cancel_event.wait(time_to_wait):
+                    return False
+            else:
+                time.sleep(time_to_wait)
+
+    def try_acquire(self, estimated_tokens: int = 0) -> float:
+        """
+        Take the budget of a request with `estimated_tokens` if it is available now.
+        Returns 0 if it is taken, or the time to wait in seconds otherwise.
+        """
+        with self.lock:
+            now = self.clock()
+            time_to_wait = self._get_time_to_wait(now, estimated_tokens)
+            if time_to_wait <= 0:
+                self._consume(now, estimated_tokens)
+                return 0.0
+            return time_to_wait
+
+    def get_headroom(self) -> float:
+        """
+        Return the fraction of the budget available now, scaled by the rate factor. 1 means unused and not throttled.
+        """
+        with self.lock:
+            now = self.clock()
+            if now < self.blocked_until:
+                return 0.0
+            headroom = 1.0
+            for bucket in [self.request_bucket, self.token_bucket]:
+                if bucket:
+                    bucket.refill(now, self.rate_factor)
+                    headroom = min(headroom, max(0.0, bucket.tokens) / bucket.capacity)
+            return headroom * self.rate_factor
+
+    def on_success(self, estimated_tokens: int = 0, actual_tokens: Optional[int] = None) -> None:
+        """
+        Recover the rate additively and correct the token budget with the measured usage.
+        """
+        with self.lock:
+            self.rate_factor = min(1.0, self.rate_factor + self.const_additive_increase)
+            if self.token_bucket and actual_tokens is not None:
+                self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def on_throttled(self, retry_after_in_seconds: Optional[float] = None) -> None:
+        """
+        Back off multiplicatively and honor the retry-after hint if there is one.
+        """
+        with self.lock:
+            now = self.clock()
+            if self.request_bucket is None:
+                measured_requests_per_minute = max(1, len(self._get_recent_request_time_list(now)))
+                logger.info(f"Rate limiter: setting requests per minute to the measured rate {measured_requests_per_minute}.")
+                self.request_bucket = TokenBucket(measured_requests_per_minute, now)
+                self.request_bucket.tokens = 0.0
+            self.rate_factor = max(self.const_min_rate_factor, self.rate_factor * self.const_multiplicative_decrease)
+            if retry_after_in_seconds:
+                self.blocked_until = max(self.blocked_until, now + retry_after_in_seconds)
+            logger.warning(f"Rate limiter: throttled. Rate factor is now {self.rate_factor:.2f}.")
+
+    def get_rate_factor(self) -> float:
+        return self.rate_factor
+
+    def _get_time_to_wait(self, now: float, estimated_tokens: int) -> float:
+        time_to_wait = max(0.0, self.blocked_until - now)
+        if self.request_bucket:
+            self.request_bucket.refill(now, self.rate_factor)
+            time_to_wait = max(time_to_wait, self.request_bucket.get_time_until_available(1, self.rate_factor))
+        if self.token_bucket:
+            self.token_bucket.refill(now, self.rate_factor)
+            time_to_wait = max(time_to_wait, self.token_bucket.get_time_until_available(estimated_tokens, self.rate_factor))
+        return time_to_wait
+
+    def _consume(self, now: float, estimated_tokens: int) -> None:
+        if self.request_bucket:
+            self.request_bucket.consume(1)
+        if self.token_bucket:
+            self.token_bucket.consume(estimated_tokens)
+        self.recent_request_time_list.append(now)
+        self._get_recent_request_time_list(now)
+
+    def _get_recent_request_time_list(self, now: float) -> deque[float]:
+        const_window_in_seconds = 60.0
+        while self.recent_request_time_list and self.recent_request_time_list[0] < now - const_window_in_seconds:
+            self.recent_request_time_list.popleft()
+        return self.recent_request_time_list
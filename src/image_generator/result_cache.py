@@ -0,0 +1,151 @@
+"""
+Define ResultCache class.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+
+def compute_result_cache_key(model_name: str, prompt: str, generation_config_json: str, input_bytes_digest_list: list[str]) -> str:
+    """
+    Return the content address of one generation request.
+    `input_bytes_digest_list` has the SHA-256 hex digests of the input images in order.
+    """
+    hasher = hashlib.sha256()
+    for part in [model_name, prompt, generation_config_json] + input_bytes_digest_list:
+        encoded = part.encode("utf-8")
+        # Length-prefix each part so that different splits of the same string do not collide.
+        hasher.update(len(encoded).to_bytes(8, "big"))
+        hasher.update(encoded)
+    return hasher.hexdigest()
+
+
+def compute_result_source_key(model_name: str, prompt: str, parameters_json: str, input_preparation: str, input_file_digest_list: list[str]) -> str:
+    """
+    Return the key of one generation request by what is known before its inputs are loaded:
+    the SHA-256 hex digests of the input files, instead of the bytes sent, and `input_preparation`, how they are turned into the bytes sent.
+    A result stored with it can be looked up without decoding or preprocessing any image, e.g. to plan a run.
+    """
+    return compute_result_cache_key(model_name, prompt, parameters_json, [input_preparation] + input_file_digest_list)
+
+
+def compute_file_digest(file_path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(file_path, mode="rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    """
+    A persistent, content-addressed cache of generated images.
+    The index is a SQLite database and the images are stored in a blob directory named by their SHA-256.
+    An image is stored as in the response, not as written to the output, so that a hit is encoded for the output format of the run which reads it.
+    The least recently used results are evicted when the blobs exceed `max_bytes`.
+    A result may also be stored with its source key (see `compute_result_source_key`), so that a planned request can be looked up.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.max_bytes = max_bytes
+        self.count_hits = 0
+        self.count_misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(cache_dir, "result_cache.sqlite3"), check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS result (key TEXT PRIMARY KEY, last_accessed_at REAL NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS result_blob (key TEXT NOT NULL, candidate_index INTEGER NOT NULL, blob_name TEXT NOT NULL, size_in_bytes INTEGER NOT NULL, PRIMARY KEY (key, candidate_index))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS result_blob_blob_name ON result_blob (blob_name)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS result_source (source_key TEXT PRIMARY KEY, key TEXT NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS result_source_key ON result_source (key)")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def get(self, key: str) -> Optional[list[str]]:
+        """
+        Return the blob paths of the candidates of `key` in order, or None on a miss.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT blob_name FROM result_blob WHERE key = ? ORDER BY candidate_index", (key,)).fetchall()
+            blob_path_list = [os.path.join(self.blob_dir, row[0]) for row in rows]
+            if not blob_path_list or not all(os.path.exists(x) for x in blob_path_list):
+                self.count_misses += 1
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE result SET last_accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.count_hits += 1
+            return blob_path_list
+
+    def has_source_key(self, source_key: str) -> bool:
+        """
+        Return True if there is a result stored with `source_key`. Hits and misses are not counted.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT result_blob.blob_name FROM result_source JOIN result_blob ON result_source.key = result_blob.key WHERE result_source.source_key = ?", (source_key,)).fetchall()
+        return bool(rows) and all(os.path.exists(os.path.join(self.blob_dir, row[0])) for row in rows)
+
+    def put(self, key: str, candidate_image_bytes_list: list[bytes], source_key: Optional[str] = None) -> None:
+        """
+        Store `candidate_image_bytes_list`, the image bytes of each candidate, as the result of `key`, and of `source_key` if given.
+        """
+        blob_row_list = []
+        for (candidate_index, image_bytes) in enumerate(candidate_image_bytes_list):
+            blob_name = hashlib.sha256(image_bytes).hexdigest()
+            blob_path = os.path.join(self.blob_dir, blob_name)
+            if not os.path.exists(blob_path):
+                temp_blob_path = f"{blob_path}.{threading.get_ident()}.tmp"
+                with open(temp_blob_path, mode="wb") as f:
+                    f.write(image_bytes)
+                os.replace(temp_blob_path, blob_path)
+            blob_row_list.append((key, candidate_index, blob_name, len(image_bytes)))
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM result_blob WHERE key = ?", (key,))
+                self.connection.execute("INSERT OR REPLACE INTO result (key, last_accessed_at) VALUES (?, ?)", (key, time.time()))
+                self.connection.executemany("INSERT INTO result_blob (key, candidate_index, blob_name, size_in_bytes) VALUES (?, ?, ?, ?)", blob_row_list)
+                if source_key is not None:
+                    self.connection.execute("INSERT OR REPLACE INTO result_source (source_key, key) VALUES (?, ?)", (source_key, key))
+            self._evict()
+
+    def get_total_bytes(self) -> int:
+        with self.lock:
+            return self._get_total_bytes()
+
+    def _get_total_bytes(self) -> int:
+        # A blob may be shared by several keys. Count it once.
+        row = self.connection.execute("SELECT COALESCE(SUM(size_in_bytes), 0) FROM (SELECT DISTINCT blob_name, size_in_bytes FROM result_blob)").fetchone()
+        return row[0]
+
+    def _evict(self) -> None:
+        total_bytes = self._get_total_bytes()
+        while total_bytes > self.max_bytes:
+            row = self.connection.execute("SELECT key FROM result ORDER BY last_accessed_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            key = row[0]
+            blob_name_list = [x[0] for x in self.connection.execute("SELECT blob_name FROM result_blob WHERE key = ?", (key,)).fetchall()]
+            with self.connection:
+                self.connection.execute("DELETE FROM result_blob WHERE key = ?", (key,))
+                self.connection.execute("DELETE FROM result WHERE key = ?", (key,))
+                self.connection.execute("DELETE FROM result_source WHERE key = ?", (key,))
+            for blob_name in blob_name_list:
+                if self.connection.execute("SELECT 1 FROM result_blob WHERE blob_name = ? LIMIT 1", (blob_name,)).fetchone() is None:
+                    try:
+                        os.remove(os.path.join(self.blob_dir, blob_name))
+                    except FileNotFoundError:
+                        pass
+            logger.info(f"[ResultCache] Evicted {key}.")
+            total_bytes = self._get_total_bytes()
+
+    def show_stats(self) -> None:
+        logger.info(f"[ResultCache] Hits: {self.count_hits}, Misses: {self.count_misses}, Bytes: {self.get_total_bytes()}/{self.max_bytes}")
@@ -0,0 +1,55 @@
+"""
+Define RetryPolicy class.
+"""
+import random
+import threading
+from typing import Optional
+
+from loguru import logger
+
+from src.image_generator.generation_result import GenerationResult
+
+
+class RetryPolicy:
+    """
+    Decide whether a failed work item is retried and when.
+    The delay is a capped exponential backoff with full jitter, and the number of retries is limited per run by `retry_budget`.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay_in_seconds: float = 2.0, max_delay_in_seconds: float = 60.0, retry_budget: Optional[int] = None, random_generator: Optional[random.Random] = None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay_in_seconds = base_delay_in_seconds
+        self.max_delay_in_seconds = max_delay_in_seconds
+        self.retry_budget = retry_budget
+        self.random_generator = random_generator or random.Random()
+        self.count_retries = 0
+        self.lock = threading.Lock()
+
+    def should_retry(self, result: GenerationResult) -> bool:
+        """
+        Return True if `result` should be retried. A True return value consumes one retry from the budget.
+        """
+        if result.success or not result.retryable:
+            return False
+        if result.attempt_count >= self.max_attempts:
+            logger.warning(f"Giving up after {result.attempt_count} attempt(s): {result.error}")
+            return False
+        with self.lock:
+            if self.retry_budget is not None and self.count_retries >= self.retry_budget:
+                logger.warning(f"Retry budget of {self.retry_budget} is exhausted. Not retrying: {result.error}")
+                return False
+            self.count_retries += 1
+        return True
+
+    def get_delay_in_seconds(self, result: GenerationResult) -> float:
+        """
+        Return how long to wait before the next attempt of `result`.
+        """
+        cap = min(self.max_delay_in_seconds, self.base_delay_in_seconds * (2 ** (result.attempt_count - 1)))
+        delay = self.random_generator.uniform(0, cap)
+        if result.retry_after_in_seconds:
+            delay = max(delay, result.retry_after_in_seconds)
+        return delay
+
+    def get_count_retries(self) -> int:
+        return self.count_retries
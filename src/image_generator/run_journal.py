@@ -0,0 +1,116 @@
+"""
+Define RunJournal class.
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+
+class RunJournalEnum:
+    const_state_pending = "pending"
+    const_state_in_flight = "in_flight"
+    const_state_done = "done"
+    const_state_failed = "failed"
+
+
+def get_item_key(output_file_path_list: "list[str] | tuple[str, ...]") -> str:
+    """
+    Return the key of a work item in a journal.
+    Output file names are deterministic per run, so the first output path identifies an item.
+    """
+    return output_file_path_list[0]
+
+
+class RunJournal:
+    """
+    An append-only JSONL journal of the state of each work item in one run.
+    Each line is flushed and synced so that the journal survives a crash. A truncated last line is ignored on load.
+    An item without any line is pending.
+    """
+
+    def __init__(self, journal_dir: str, run_id: str):
+        self.run_id = run_id
+        self.journal_path = os.path.join(journal_dir, f"{run_id}.jsonl")
+        self.state_dict: dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.file = None
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.journal_path)
+
+    def load(self) -> Optional[dict]:
+        """
+        Load the states of the items of an existing journal.
+        Returns the header of the run, or None if the journal is not found.
+        """
+        header = None
+        try:
+            with open(self.journal_path, encoding="utf-8", mode="r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Ignoring a broken line in the journal {self.journal_path}.")
+                        continue
+                    if record.get("event") == "start":
+                        header = record
+                    elif "item" in record and "state" in record:
+                        self.state_dict[record["item"]] = record["state"]
+        except FileNotFoundError:
+            return None
+        return header or {}
+
+    def open(self, header: dict) -> None:
+        """
+        Open the journal to append, and write `header` as a start event.
+        """
+        self.file = open(self.journal_path, encoding="utf-8", mode="a")
+        self._append({"event": "start", "run_id": self.run_id, **header})
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def get_state(self, key: str) -> str:
+        with self.lock:
+            return self.state_dict.get(key, RunJournalEnum.const_state_pending)
+
+    def is_done(self, key: str) -> bool:
+        return self.get_state(key) == RunJournalEnum.const_state_done
+
+    def get_count_by_state(self) -> dict[str, int]:
+        with self.lock:
+            count_by_state: dict[str, int] = {}
+            for state in self.state_dict.values():
+                count_by_state[state] = count_by_state.get(state, 0) + 1
+            return count_by_state
+
+    def record_in_flight(self, key: str) -> None:
+        self._record(key, RunJournalEnum.const_state_in_flight)
+
+    def record_done(self, key: str, output_file_path_list: list[str], attempt_count: int) -> None:
+        self._record(key, RunJournalEnum.const_state_done, output_file_path_list=output_file_path_list, attempt_count=attempt_count)
+
+    def record_failed(self, key: str, error: Optional[str], attempt_count: int) -> None:
+        self._record(key, RunJournalEnum.const_state_failed, error=error, attempt_count=attempt_count)
+
+    def _record(self, key: str, state: str, **kwargs) -> None:
+        with self.lock:
+            self.state_dict[key] = state
+        self._append({"item": key, "state": state, "time": time.time(), **kwargs})
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
@@ -0,0 +1,165 @@
+"""
+Define RunPlanner class, which estimates the calls, bytes, tokens and wall time of a run before anything is submitted.
+"""
+import os
+from typing import Optional
+
+from loguru import logger
+from PIL import Image, UnidentifiedImageError
+
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_file_index import InputFileIndex
+from src.image_generator.input_image_preprocessor import InputImagePreprocessor
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.parameter_sweep import SweepItem
+from src.image_generator.rate_limiter import estimate_number_of_tokens
+from src.image_generator.result_cache import ResultCache, compute_file_digest, compute_result_source_key
+
+
+class PlannedInputFile:
+    """
+    What the planner knows about one input file from its stat and header, or from the input file index.
+    `prepared_size` and `prepared_size_in_bytes` are those of the bytes sent, i.e. after preprocessing if any.
+    `content_hash` is None if it is neither in the index nor needed.
+    """
+
+    __slots__ = ('prepared_size', 'prepared_size_in_bytes', 'content_hash')
+
+    def __init__(self, prepared_size: tuple[int, int], prepared_size_in_bytes: int, content_hash: Optional[str]):
+        self.prepared_size = prepared_size
+        self.prepared_size_in_bytes = prepared_size_in_bytes
+        self.content_hash = content_hash
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    (hours, seconds) = divmod(seconds, 3600)
+    (minutes, seconds) = divmod(seconds, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+class RunPlan:
+    """
+    The estimates of one run. Items whose inputs cannot be read count as calls, which will fail, but add no bytes or tokens.
+    """
+
+    def __init__(self):
+        self.number_of_items = 0
+        self.number_of_cache_hits = 0
+        self.number_of_calls = 0
+        self.number_of_input_files = 0
+        self.number_of_unreadable_input_files = 0
+        self.upload_bytes = 0
+        self.input_tokens = 0
+        self.total_tokens = 0
+        self.wall_time_in_seconds = 0.0
+
+    def show(self) -> None:
+        logger.info(f"[RunPlan] Items: {self.number_of_items}, Expected result cache hits: {self.number_of_cache_hits}, Calls: {self.number_of_calls}")
+        logger.info(f"[RunPlan] Input files: {self.number_of_input_files}, Unreadable: {self.number_of_unreadable_input_files}, Upload: {self.upload_bytes / (1024 * 1024):.1f} MiB")
+        logger.info(f"[RunPlan] Estimated tokens: input {self.input_tokens}, total {self.total_tokens}")
+        logger.info(f"[RunPlan] Estimated wall time: {_format_duration(self.wall_time_in_seconds)}")
+
+
+class RunPlanner:
+    """
+    Estimate a run without decoding any image: the dimensions come from the file headers or the input file index,
+    the sizes after preprocessing are computed from them, and expected result cache hits are looked up by source key.
+    Each input file is read once however many items use it, so a pair of directories costs N + M reads, not N x M.
+    The wall time assumes `latency_in_seconds` per call, `max_in_flight` calls at a time,
+    and the request and token budgets per minute summed over the API keys. The budgets start full, as in AdaptiveRateLimiter.
+    """
+
+    def __init__(self, model_name: str, latency_in_seconds: float, max_in_flight: int = 1, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.model_name = model_name
+        self.latency_in_seconds = latency_in_seconds
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.input_file_index: Optional[InputFileIndex] = None
+        self.input_image_preprocessor: Optional[InputImagePreprocessor] = None
+        self.result_cache: Optional[ResultCache] = None
+        self.flag_upload_once = False
+        # Input file path -> what is known about it, or None if it cannot be read.
+        self.planned_input_file_by_path: dict[str, Optional[PlannedInputFile]] = {}
+
+    def set_input_file_index(self, input_file_index: Optional[InputFileIndex]) -> None:
+        self.input_file_index = input_file_index
+
+    def set_input_image_preprocessor(self, input_image_preprocessor: Optional[InputImagePreprocessor]) -> None:
+        self.input_image_preprocessor = input_image_preprocessor
+
+    def set_result_cache(self, result_cache: Optional[ResultCache]) -> None:
+        self.result_cache = result_cache
+
+    def set_upload_once(self, flag_upload_once: bool) -> None:
+        """
+        Count the bytes of each distinct input once, as with an input upload cache, instead of once per call.
+        """
+        self.flag_upload_once = flag_upload_once
+
+    def plan(self, input_output_file_path_spec: InputOutputFilePathSpec, image_generator_generate_content_config: ImageGeneratorGenerateContentConfig) -> RunPlan:
+        run_plan = RunPlan()
+        uploaded_key_set = set()
+        input_preparation = self.input_image_preprocessor.get_signature() if self.input_image_preprocessor else "original"
+        for item in input_output_file_path_spec.iter_items():
+            run_plan.number_of_items += 1
+            config = item.variant.image_generator_generate_content_config if isinstance(item, SweepItem) else image_generator_generate_content_config
+            planned_input_file_list = [self._get_planned_input_file(input_file_path) for input_file_path in item.input_file_path_list]
+            if any(x is None for x in planned_input_file_list):
+                run_plan.number_of_calls += 1
+                continue
+            if self.result_cache and all(x.content_hash is not None for x in planned_input_file_list):
+                source_key = compute_result_source_key(self.model_name, config.get_prompt() or "", config.get_optional_config_json(), input_preparation, [x.content_hash for x in planned_input_file_list])
+                if self.result_cache.has_source_key(source_key):
+                    run_plan.number_of_cache_hits += 1
+                    continue
+            run_plan.number_of_calls += 1
+            image_size_list = [x.prepared_size for x in planned_input_file_list]
+            run_plan.input_tokens += estimate_number_of_tokens(config.get_prompt(), image_size_list, 0)
+            run_plan.total_tokens += estimate_number_of_tokens(config.get_prompt(), image_size_list, config.get_candidate_count() or 1)
+            for (input_file_path, planned_input_file) in zip(item.input_file_path_list, planned_input_file_list):
+                if self.flag_upload_once:
+                    key = planned_input_file.content_hash or os.path.abspath(input_file_path)
+                    if key in uploaded_key_set:
+                        continue
+                    uploaded_key_set.add(key)
+                run_plan.upload_bytes += planned_input_file.prepared_size_in_bytes
+        run_plan.number_of_input_files = len(self.planned_input_file_by_path)
+        run_plan.number_of_unreadable_input_files = sum(1 for x in self.planned_input_file_by_path.values() if x is None)
+        run_plan.wall_time_in_seconds = self._estimate_wall_time_in_seconds(run_plan.number_of_calls, run_plan.total_tokens)
+        return run_plan
+
+    def _estimate_wall_time_in_seconds(self, number_of_calls: int, number_of_tokens: int) -> float:
+        if number_of_calls == 0:
+            return 0.0
+        wall_time_in_seconds = number_of_calls * self.latency_in_seconds / max(1, self.max_in_flight)
+        # A full budget lets the first minute's worth through at once. The rest goes at the rate of the budget.
+        if self.requests_per_minute:
+            wall_time_in_seconds = max(wall_time_in_seconds, max(0, number_of_calls - self.requests_per_minute) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            wall_time_in_seconds = max(wall_time_in_seconds, max(0, number_of_tokens - self.tokens_per_minute) * 60 / self.tokens_per_minute)
+        return wall_time_in_seconds
+
+    def _get_planned_input_file(self, input_file_path: str) -> Optional[PlannedInputFile]:
+        if input_file_path in self.planned_input_file_by_path:
+            return self.planned_input_file_by_path[input_file_path]
+        planned_input_file = None
+        try:
+            stat_result = os.stat(input_file_path)
+            entry = self.input_file_index.get_entry(input_file_path) if self.input_file_index else None
+            if entry is not None and entry.width is not None and (entry.size, entry.mtime_ns) == (stat_result.st_size, stat_result.st_mtime_ns):
+                (size, content_hash) = ((entry.width, entry.height), entry.content_hash)
+            else:
+                # Only the header is parsed. The pixels are not decoded.
+                with Image.open(input_file_path) as image:
+                    size = image.size
+                content_hash = compute_file_digest(input_file_path) if self.result_cache else None
+            if self.input_image_preprocessor:
+                planned_input_file = PlannedInputFile(self.input_image_preprocessor.get_prepared_size(size), self.input_image_preprocessor.estimate_prepared_size_in_bytes(size), content_hash)
+            else:
+                planned_input_file = PlannedInputFile(size, stat_result.st_size, content_hash)
+        except (OSError, UnidentifiedImageError) as e:
+            logger.warning(f"[RunPlanner] Could not read {input_file_path}: {e}")
+        self.planned_input_file_by_path[input_file_path] = planned_input_file
+        return planned_input_file
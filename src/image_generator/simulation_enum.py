@@ -0,0 +1,26 @@
+"""
+Define SimulationEnum class and a helper function of the simulation config.
+It is kept apart from the simulated backend, so that the config can be validated without importing the Gemini SDK.
+"""
+import math
+
+
+class SimulationEnum:
+    const_distribution_constant = "constant"
+    const_distribution_uniform = "uniform"
+    const_distribution_lognormal = "lognormal"
+    # A model name of its own keeps simulated results apart from real ones in the result cache.
+    const_model_name = "models/simulated-image-model"
+
+
+def get_mean_latency_in_seconds(simulation_config: dict) -> float:
+    """
+    Return the mean latency of a simulated request in wall time, with the defaults of the simulated backend.
+    """
+    latency_config = simulation_config.get("latency") or {}
+    median_in_seconds = latency_config.get("median_in_seconds", 1.0)
+    time_scale = simulation_config.get("time_scale", 1.0)
+    if latency_config.get("distribution", SimulationEnum.const_distribution_lognormal) == SimulationEnum.const_distribution_lognormal:
+        return median_in_seconds * math.exp(latency_config.get("sigma", 0.5) ** 2 / 2) * time_scale
+    # The mean of "constant" and "uniform" is the median.
+    return median_in_seconds * time_scale
@@ -0,0 +1,192 @@
+"""
+Define SourceDirectoryWatcher class.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+
+
+class _Inotify:
+    """
+    A minimal binding of inotify(7) of Linux by ctypes.
+    """
+
+    const_in_modify = 0x00000002
+    const_in_close_write = 0x00000008
+    const_in_moved_to = 0x00000080
+    const_in_create = 0x00000100
+    const_in_q_overflow = 0x00004000
+    const_in_nonblock = 0o4000
+    const_in_cloexec = 0o2000000
+    const_event_header_format = "iIII"
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is supported on Linux only.")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(self.const_in_nonblock | self.const_in_cloexec)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.dir_path_by_wd: dict[int, str] = {}
+
+    def add_watch(self, dir_path: str) -> None:
+        mask = self.const_in_modify | self.const_in_close_write | self.const_in_moved_to | self.const_in_create
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), dir_path)
+        self.dir_path_by_wd[wd] = dir_path
+
+    def read_events(self, timeout_in_seconds: float) -> tuple[list[tuple[str, str]], bool]:
+        """
+        Wait for events up to `timeout_in_seconds`.
+        Returns (dir path, file name) of each event, and whether the event queue overflowed.
+        """
+        (readable, _, _) = select.select([self.fd], [], [], max(0.0, timeout_in_seconds))
+        if not readable:
+            return ([], False)
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return ([], False)
+        event_list = []
+        flag_overflow = False
+        header_size = struct.calcsize(self.const_event_header_format)
+        offset = 0
+        while offset + header_size <= len(data):
+            (wd, mask, _, name_length) = struct.unpack_from(self.const_event_header_format, data, offset)
+            name = data[offset + header_size:offset + header_size + name_length].rstrip(b"\0")
+            offset += header_size + name_length
+            if mask & self.const_in_q_overflow:
+                flag_overflow = True
+            elif wd in self.dir_path_by_wd and name:
+                event_list.append((self.dir_path_by_wd[wd], os.fsdecode(name)))
+        return (event_list, flag_overflow)
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class SourceDirectoryWatcher:
+    """
+    Watch directories for new files with inotify, or by polling if inotify is not available.
+    A file is reported once, when its size and modification time have not changed for `stable_for_in_seconds`,
+    so that a file which is still being copied is not picked up.
+    """
+
+    def __init__(self, dir_path_list: list[str], file_name_filter: Callable[[str], bool], poll_interval_in_seconds: float = 1.0, stable_for_in_seconds: float = 2.0, use_inotify: bool = True, include_existing: bool = True, clock: Callable[[], float] = time.monotonic):
+        self.dir_path_list = dir_path_list
+        self.file_name_filter = file_name_filter
+        self.poll_interval_in_seconds = poll_interval_in_seconds
+        self.stable_for_in_seconds = stable_for_in_seconds
+        self.use_inotify = use_inotify
+        self.include_existing = include_existing
+        self.clock = clock
+        self.inotify: Optional[_Inotify] = None
+        # (dir path, file name) -> (size, mtime in ns, time since when they have not changed)
+        self.pending_dict: dict[tuple[str, str], tuple[int, int, float]] = {}
+        self.reported_set: set[tuple[str, str]] = set()
+
+    def start(self) -> None:
+        if self.use_inotify:
+            try:
+                self.inotify = _Inotify()
+                for dir_path in self.dir_path_list:
+                    self.inotify.add_watch(dir_path)
+                logger.info(f"Watching {self.dir_path_list} with inotify.")
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify is not available. Polling every {self.poll_interval_in_seconds} seconds instead: {e}")
+                if self.inotify:
+                    self.inotify.close()
+                self.inotify = None
+        if self.inotify is None:
+            logger.info(f"Watching {self.dir_path_list} by polling.")
+        for (dir_path, file_name) in self._scan():
+            if self.include_existing:
+                self._touch(dir_path, file_name)
+            else:
+                self.reported_set.add((dir_path, file_name))
+
+    def close(self) -> None:
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def wait_for_new_files(self, timeout_in_seconds: float, cancel_event: Optional[threading.Event] = None) -> list[tuple[str, str]]:
+        """
+        Wait up to `timeout_in_seconds` for files which have become stable, and return their (dir path, file name) sorted.
+        Returns an empty list on timeout or if `cancel_event` is set.
+        """
+        deadline = self.clock() + timeout_in_seconds
+        while True:
+            stable_list = self._pop_stable_files()
+            if stable_list:
+                return stable_list
+            now = self.clock()
+            if now >= deadline or (cancel_event is not None and cancel_event.is_set()):
+                return []
+            time_to_wait = min(self.poll_interval_in_seconds, deadline - now)
+            if self.inotify:
+                (event_list, flag_overflow) = self.inotify.read_events(time_to_wait)
+                if flag_overflow:
+                    logger.warning("inotify event queue overflowed. Rescanning.")
+                    event_list = self._scan()
+                for (dir_path, file_name) in event_list:
+                    if self.file_name_filter(file_name) and (dir_path, file_name) not in self.reported_set:
+                        self._touch(dir_path, file_name)
+            else:
+                if cancel_event is not None:
+                    cancel_event.wait(time_to_wait)
+                else:
+                    time.sleep(time_to_wait)
+                for (dir_path, file_name) in self._scan():
+                    if (dir_path, file_name) not in self.reported_set and (dir_path, file_name) not in self.pending_dict:
+                        self._touch(dir_path, file_name)
+
+    def _scan(self) -> list[tuple[str, str]]:
+        file_list = []
+        for dir_path in self.dir_path_list:
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.is_file() and self.file_name_filter(entry.name):
+                            file_list.append((dir_path, entry.name))
+            except OSError as e:
+                logger.error(f"Error reading directory: {e}")
+        return file_list
+
+    def _touch(self, dir_path: str, file_name: str) -> None:
+        try:
+            stat_result = os.stat(os.path.join(dir_path, file_name))
+        except FileNotFoundError:
+            self.pending_dict.pop((dir_path, file_name), None)
+            return
+        self.pending_dict[(dir_path, file_name)] = (stat_result.st_size, stat_result.st_mtime_ns, self.clock())
+
+    def _pop_stable_files(self) -> list[tuple[str, str]]:
+        now = self.clock()
+        stable_list = []
+        for (key, (size, mtime_ns, since)) in list(self.pending_dict.items()):
+            try:
+                stat_result = os.stat(os.path.join(*key))
+            except FileNotFoundError:
+                del self.pending_dict[key]
+                continue
+            if (stat_result.st_size, stat_result.st_mtime_ns) != (size, mtime_ns):
+                self.pending_dict[key] = (stat_result.st_size, stat_result.st_mtime_ns, now)
+            elif now - since >= self.stable_for_in_seconds:
+                del self.pending_dict[key]
+                self.reported_set.add(key)
+                stable_list.append(key)
+        return sorted(stable_list)
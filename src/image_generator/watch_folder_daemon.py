@@ -0,0 +1,99 @@
+"""
+Define WatchFolderDaemon class.
+"""
+import os
+import threading
+from typing import Optional, TYPE_CHECKING
+
+from loguru import logger
+
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.input_output_file_path_spec_builder import get_output_image_name, get_output_image_names
+from src.image_generator.source_directory_watcher import SourceDirectoryWatcher
+
+if TYPE_CHECKING:
+    from src.image_generator.image_generator_for_gemini import ImageGeneratorForGemini
+
+
+class WatchFolderDaemon:
+    """
+    Generate images for files as they arrive in the source (and reference) directories, until stopped.
+    Only the new work items are dispatched: in pair mode, a new source file is paired with every reference file and vice versa.
+    The image generator is initialized once, so the client, the rate limiter and the caches stay warm between arrivals.
+    Limits: only the files directly in the directories are watched, whatever `recursive` says,
+    and each file name is processed once, so a file saved again under the same name is not processed again.
+    """
+
+    def __init__(self, image_generator: "ImageGeneratorForGemini", image_generator_generate_content_config: ImageGeneratorGenerateContentConfig, watcher: SourceDirectoryWatcher, source_dir: str, output_dir: str, date_and_time_part: str, reference_dir: Optional[str] = None):
+        self.image_generator = image_generator
+        self.image_generator_generate_content_config = image_generator_generate_content_config
+        self.watcher = watcher
+        self.source_dir = source_dir
+        self.reference_dir = reference_dir
+        self.output_dir = output_dir
+        self.date_and_time_part = date_and_time_part
+        self.output_extension = '.png'
+        self.source_file_list: list[str] = []
+        self.reference_file_list: list[str] = []
+        self.stop_event = threading.Event()
+        self.count_batches = 0
+        self.count_items = 0
+
+    def set_output_extension(self, output_extension: str) -> None:
+        self.output_extension = output_extension
+
+    def stop(self) -> None:
+        """
+        Stop watching. The batch in progress is cancelled, and requests already sent run to completion.
+        """
+        self.stop_event.set()
+        self.image_generator.cancel()
+
+    def build_input_output_file_path_spec(self, new_file_list: list[tuple[str, str]]) -> InputOutputFilePathSpec:
+        """
+        Remember the new files and return the spec of the work items which they make.
+        """
+        new_source_file_list = sorted(file_name for (dir_path, file_name) in new_file_list if dir_path == self.source_dir)
+        new_reference_file_list = sorted(file_name for (dir_path, file_name) in new_file_list if dir_path == self.reference_dir)
+        spec = InputOutputFilePathSpec()
+        if self.reference_dir is None:
+            for source in new_source_file_list:
+                spec.add_item_with_lists([os.path.join(self.source_dir, source)], [os.path.join(self.output_dir, get_output_image_name(source, self.date_and_time_part, self.output_extension))])
+            self.source_file_list.extend(new_source_file_list)
+            return spec
+        # New sources with every reference, and the known sources with the new references.
+        pair_list = [(source, reference) for source in new_source_file_list for reference in self.reference_file_list + new_reference_file_list]
+        pair_list.extend((source, reference) for source in self.source_file_list for reference in new_reference_file_list)
+        for (source, reference) in pair_list:
+            output_image_names = get_output_image_names(source, reference, self.date_and_time_part, self.output_extension)
+            spec.add_item_with_lists(
+                [os.path.join(self.source_dir, source), os.path.join(self.reference_dir, reference)],
+                [os.path.join(self.output_dir, output_image_names[0]), os.path.join(self.output_dir, output_image_names[1])]
+            )
+        self.source_file_list.extend(new_source_file_list)
+        self.reference_file_list.extend(new_reference_file_list)
+        return spec
+
+    def run(self) -> None:
+        """
+        Watch and generate until `stop` is called.
+        """
+        self.watcher.start()
+        logger.info("Watching for new input images. Press Ctrl+C to stop.")
+        try:
+            while not self.stop_event.is_set():
+                const_wait_timeout_in_seconds = 60.0
+                new_file_list = self.watcher.wait_for_new_files(const_wait_timeout_in_seconds, self.stop_event)
+                if not new_file_list:
+                    continue
+                logger.info(f"{len(new_file_list)} new input image(s): {new_file_list}")
+                spec = self.build_input_output_file_path_spec(new_file_list)
+                if spec.get_number_of_items() == 0 or self.stop_event.is_set():
+                    continue
+                self.count_batches += 1
+                self.count_items += spec.get_number_of_items()
+                self.image_generator.generate_one_batch_of_images(spec, self.image_generator_generate_content_config)
+        finally:
+            self.watcher.close()
+            logger.info(f"Stopped watching. Batches: {self.count_batches}, Items: {self.count_items}")
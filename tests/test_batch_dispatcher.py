@@ -0,0 +1,67 @@
+"""
+Unit tests for the BatchDispatcher class.
+"""
+
+import threading
+import time
+import unittest
+from src.image_generator.batch_dispatcher import BatchDispatcher
+
+class TestBatchDispatcher(unittest.TestCase):
+    def test_counts_success_and_failure(self):
+        dispatcher = BatchDispatcher(max_in_flight=3)
+        progress = dispatcher.run(range(10), lambda x: x % 2 == 0, 10)
+        self.assertEqual(progress.count, 10)
+        self.assertEqual(progress.count_success, 5)
+        self.assertEqual(progress.count_failure, 5)
+        self.assertEqual(progress.count_cancelled, 0)
+
+    def test_exception_is_counted_as_failure(self):
+        def func(x):
+            if x == 1:
+                raise RuntimeError("boom")
+            return True
+        dispatcher = BatchDispatcher(max_in_flight=2)
+        progress = dispatcher.run(range(3), func, 3)
+        self.assertEqual(progress.count_success, 2)
+        self.assertEqual(progress.count_failure, 1)
+
+    def test_max_in_flight_is_respected(self):
+        lock = threading.Lock()
+        current = 0
+        peak = 0
+        def func(_):
+            nonlocal current, peak
+            with lock:
+                current += 1
+                peak = max(peak, current)
+            time.sleep(0.01)
+            with lock:
+                current -= 1
+            return True
+        dispatcher = BatchDispatcher(max_in_flight=4)
+        progress = dispatcher.run(range(20), func, 20)
+        self.assertEqual(progress.count_success, 20)
+        self.assertLessEqual(peak, 4)
+        self.assertGreater(peak, 1)
+
+    def test_cancel_stops_dispatching(self):
+        dispatcher = BatchDispatcher(max_in_flight=1)
+        def func(x):
+            if x == 2:
+                dispatcher.cancel()
+            return True
+        progress = dispatcher.run(range(10), func, 10)
+        self.assertTrue(dispatcher.is_cancelled())
+        self.assertEqual(progress.count, 3)
+        self.assertEqual(progress.count_cancelled, 7)
+
+    def test_wait_unless_cancelled_returns_early(self):
+        dispatcher = BatchDispatcher()
+        dispatcher.cancel()
+        start = time.monotonic()
+        self.assertTrue(dispatcher.wait_unless_cancelled(10))
+        self.assertLess(time.monotonic() - start, 1)
+
+if __name__ == "__main__":
+    unittest.main()
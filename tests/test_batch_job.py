@@ -0,0 +1,125 @@
+"""
+End-to-end tests of the JSONL batch mode against the local stand-in.
+"""
+
+import base64
+from io import BytesIO
+import json
+import os
+import tempfile
+from typing import Optional
+import unittest
+from PIL import Image
+from src.image_generator.batch_job import get_manifest_file_path
+from src.image_generator.image_generator_for_gemini import ImageGeneratorForGemini
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+
+
+def run_local_batch_stand_in(request_file_path: str, result_file_path: str, number_of_candidates: int = 1, failing_key_set: Optional[set[str]] = None) -> int:
+    """
+    Produce a result file for a request file without calling any API, as a local stand-in for the batch service.
+    Each candidate echoes the first inline input image converted to PNG, or a gray image if there is none.
+    Keys in `failing_key_set` get an error instead. Returns the number of lines written.
+    """
+    count = 0
+    with open(request_file_path, encoding="utf-8", mode="r") as request_file, open(result_file_path, encoding="utf-8", mode="w") as result_file:
+        for line in request_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            key = record["key"]
+            if failing_key_set and key in failing_key_set:
+                result_file.write(json.dumps({"key": key, "error": {"code": 500, "message": "Simulated failure."}}) + "\n")
+                count += 1
+                continue
+            image = Image.new("RGB", (64, 64), (128, 128, 128))
+            for part in record["request"]["contents"][0]["parts"]:
+                if "inlineData" in part:
+                    with Image.open(BytesIO(base64.b64decode(part["inlineData"]["data"]))) as input_image:
+                        image = input_image.convert("RGB")
+                    break
+            bytesio = BytesIO()
+            image.save(bytesio, format="PNG")
+            data = base64.b64encode(bytesio.getvalue()).decode("ascii")
+            candidates = [{"content": {"role": "model", "parts": [{"inlineData": {"mimeType": "image/png", "data": data}}]}, "finishReason": "STOP"} for _ in range(number_of_candidates)]
+            result_file.write(json.dumps({"key": key, "response": {"candidates": candidates}}) + "\n")
+            count += 1
+    return count
+
+
+class TestBatchJob(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.temp_dir.name, "output")
+        os.makedirs(self.output_dir)
+        self.spec = InputOutputFilePathSpec()
+        for i in range(3):
+            input_file_path = os.path.join(self.temp_dir.name, f"input_{i}.png")
+            Image.new("RGB", (16, 16), (i, 0, 0)).save(input_file_path)
+            self.spec.add_item_with_lists([input_file_path], [os.path.join(self.output_dir, f"output_{i}.png")])
+        self.generate_content_config = ImageGeneratorGenerateContentConfig()
+        self.generate_content_config.set_prompt("Make it blue.")
+        self.generate_content_config.set_temperature(0.5)
+        self.request_file_path = os.path.join(self.temp_dir.name, "requests.jsonl")
+        self.result_file_path = os.path.join(self.temp_dir.name, "results.jsonl")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_export_request_file(self):
+        image_generator = ImageGeneratorForGemini()
+        self.assertTrue(image_generator.export_batch_request_file({}, self.generate_content_config, self.spec, self.request_file_path))
+        with open(self.request_file_path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 3)
+        request = lines[0]["request"]
+        self.assertEqual(request["contents"][0]["parts"][0], {"text": "Make it blue."})
+        self.assertEqual(request["contents"][0]["parts"][1]["inlineData"]["mimeType"], "image/png")
+        self.assertEqual(request["generationConfig"]["temperature"], 0.5)
+        self.assertEqual(request["generationConfig"]["responseModalities"], ["IMAGE"])
+        self.assertIn("safetySettings", request)
+        with open(get_manifest_file_path(self.request_file_path), encoding="utf-8") as f:
+            manifest = [json.loads(line) for line in f]
+        self.assertEqual([x["key"] for x in manifest], [x["key"] for x in lines])
+
+    def test_reference_inputs(self):
+        image_generator = ImageGeneratorForSimulation()
+        # The same input twice is uploaded once.
+        self.spec.add_item_with_lists([os.path.join(self.temp_dir.name, "input_0.png")], [os.path.join(self.output_dir, "output_again.png")])
+        self.assertTrue(image_generator.export_batch_request_file({}, self.generate_content_config, self.spec, self.request_file_path, inline=False))
+        with open(self.request_file_path, encoding="utf-8") as f:
+            part_list = [json.loads(line)["request"]["contents"][0]["parts"][1] for line in f]
+        self.assertTrue(all(part["fileData"]["fileUri"].startswith("https://simulated.invalid/") for part in part_list))
+        self.assertEqual(part_list[0], part_list[3])
+        self.assertEqual(image_generator.client.files.count_uploads, 3)
+
+    def test_round_trip_with_candidates_and_failure(self):
+        image_generator = ImageGeneratorForGemini()
+        image_generator.export_batch_request_file({}, self.generate_content_config, self.spec, self.request_file_path)
+        run_local_batch_stand_in(self.request_file_path, self.result_file_path, number_of_candidates=2, failing_key_set={"item-00000002"})
+        result = image_generator.import_batch_result_file(self.result_file_path, get_manifest_file_path(self.request_file_path))
+        self.assertFalse(result)
+        self.assertEqual(sorted(os.listdir(self.output_dir)), [
+            "output_0.candidate.1.png", "output_0.png",
+            "output_1.candidate.1.png", "output_1.png"
+        ])
+        with Image.open(os.path.join(self.output_dir, "output_1.png")) as image:
+            self.assertEqual(image.getpixel((0, 0)), (1, 0, 0))
+
+    def test_broken_lines_do_not_stop_the_import(self):
+        image_generator = ImageGeneratorForGemini()
+        image_generator.export_batch_request_file({}, self.generate_content_config, self.spec, self.request_file_path)
+        run_local_batch_stand_in(self.request_file_path, self.result_file_path)
+        with open(self.result_file_path, encoding="utf-8") as f:
+            line_list = f.readlines()
+        line_list[1] = json.dumps({"key": "item-00000001", "response": {"candidates": "broken"}}) + "\n"
+        line_list.insert(1, "[1, 2]\n")
+        with open(self.result_file_path, encoding="utf-8", mode="w") as f:
+            f.writelines(line_list)
+        self.assertFalse(image_generator.import_batch_result_file(self.result_file_path, get_manifest_file_path(self.request_file_path)))
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ["output_0.png", "output_2.png"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Tests of the benchmark runner.
+"""
+
+import os
+import tempfile
+import unittest
+from benchmarks.benchmark import Benchmark, compare_with_baseline, get_percentile, load_baseline, save_baseline, summarize
+
+class TestBenchmark(unittest.TestCase):
+    def test_get_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual(get_percentile(values, 50), 50.0)
+        self.assertEqual(get_percentile(values, 99), 99.0)
+        self.assertEqual(get_percentile(values, 100), 100.0)
+        self.assertEqual(get_percentile(values, 0), 1.0)
+        self.assertEqual(get_percentile([3.0], 90), 3.0)
+        with self.assertRaises(ValueError):
+            get_percentile([], 50)
+
+    def test_summarize(self):
+        summary = summarize([0.4, 0.1, 0.2, 0.3], number_of_items=10)
+        self.assertEqual(summary["count"], 4)
+        self.assertEqual(summary["min"], 0.1)
+        self.assertEqual(summary["p50"], 0.2)
+        self.assertEqual(summary["max"], 0.4)
+        self.assertAlmostEqual(summary["items_per_second"], 50.0)
+
+    def test_run_calls_setup_and_teardown(self):
+        calls = []
+        benchmark = Benchmark("test", lambda context: calls.append(context), lambda: "context", lambda context: calls.append(f"teardown {context}"), repeat=3)
+        summary = benchmark.run()
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(calls, ["context", "context", "context", "teardown context"])
+
+    def test_compare_with_baseline(self):
+        result_by_name = {"fast": {"p50": 1.0}, "slow": {"p50": 1.5}, "new": {"p50": 1.0}}
+        baseline_by_name = {"fast": {"p50": 1.1}, "slow": {"p50": 1.0}}
+        comparison_by_name = {x["name"]: x for x in compare_with_baseline(result_by_name, baseline_by_name, 0.2)}
+        self.assertEqual(set(comparison_by_name), {"fast", "slow"})
+        self.assertFalse(comparison_by_name["fast"]["regression"])
+        self.assertTrue(comparison_by_name["slow"]["regression"])
+
+    def test_save_and_load_baseline(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            baseline_file_path = os.path.join(temp_dir, "baseline.json")
+            self.assertEqual(load_baseline(baseline_file_path), {})
+            save_baseline(baseline_file_path, {"a": {"p50": 1.0}}, {"python": "3"})
+            self.assertEqual(load_baseline(baseline_file_path), {"a": {"p50": 1.0}})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests of per-call metrics.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.call_metrics import CallMetrics, CallMetricsEnum, CallMetricsRecorder
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.retry_policy import RetryPolicy
+
+class TestCallMetrics(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.metrics_file_path = os.path.join(self.temp_dir.name, "metrics", "run.jsonl")
+        self.prometheus_file_path = os.path.join(self.temp_dir.name, "metrics", "image_generator.prom")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read_metrics(self) -> list[dict]:
+        with open(self.metrics_file_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_summary_and_prometheus_textfile(self):
+        recorder = CallMetricsRecorder(self.metrics_file_path, self.prometheus_file_path)
+        for i in range(1, 101):
+            call_metrics = CallMetrics(f"item_{i}")
+            call_metrics.outcome = CallMetricsEnum.const_outcome_success
+            call_metrics.latency_in_seconds = float(i)
+            call_metrics.total_token_count = 10
+            recorder.record(call_metrics)
+        recorder.close()
+        summary = recorder.get_summary()
+        self.assertEqual(summary["latency_in_seconds"]["p50"], 50.0)
+        self.assertEqual(summary["latency_in_seconds"]["p95"], 95.0)
+        self.assertEqual(summary["latency_in_seconds"]["p99"], 99.0)
+        self.assertNotIn("queue_wait_in_seconds", summary)
+        self.assertEqual(len(self._read_metrics()), 100)
+        recorder.write_prometheus_textfile()
+        with open(self.prometheus_file_path, encoding="utf-8") as f:
+            text = f.read()
+        self.assertIn('image_generator_request_latency_seconds{quantile="0.95"} 95.0', text)
+        self.assertIn("image_generator_request_latency_seconds_count 100", text)
+        self.assertIn('image_generator_calls_total{outcome="success"} 100', text)
+        self.assertIn('image_generator_tokens_total{kind="total"} 1000', text)
+
+    def test_generation_records_each_attempt(self):
+        input_file_path = os.path.join(self.temp_dir.name, "input.png")
+        Image.new("RGB", (16, 16)).save(input_file_path)
+        spec = InputOutputFilePathSpec()
+        for i in range(10):
+            spec.add_item_with_lists([input_file_path], [os.path.join(self.temp_dir.name, f"output_{i}.png")])
+        config = ImageGeneratorGenerateContentConfig()
+        config.set_prompt("Prompt")
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_max_in_flight(2)
+        image_generator.set_retry_policy(RetryPolicy(max_attempts=20, base_delay_in_seconds=0, max_delay_in_seconds=0))
+        recorder = CallMetricsRecorder(self.metrics_file_path, self.prometheus_file_path)
+        image_generator.set_call_metrics_recorder(recorder)
+        simulation_config = {"seed": 1, "time_scale": 0, "throttle_rate": 0.3, "image_size": [8, 8], "rate_limits": {"models/simulated-image-model": {"requests_per_minute": 1000000}}}
+        self.assertTrue(image_generator.do_generation(simulation_config, config, spec))
+        recorder.close()
+        record_list = self._read_metrics()
+        self.assertEqual(len(record_list), image_generator.client.models.count_calls)
+        success_list = [x for x in record_list if x["outcome"] == CallMetricsEnum.const_outcome_success]
+        self.assertEqual(len(success_list), 10)
+        for record in success_list:
+            self.assertIsNotNone(record["queue_wait_in_seconds"])
+            self.assertIsNotNone(record["decode_time_in_seconds"])
+            self.assertIsNotNone(record["latency_in_seconds"])
+            self.assertIsNotNone(record["encode_time_in_seconds"])
+            self.assertGreater(record["input_bytes"], 0)
+            self.assertGreater(record["response_bytes"], 0)
+            self.assertEqual(record["number_of_candidates"], 1)
+            self.assertGreater(record["total_token_count"], 0)
+        throttled_list = [x for x in record_list if x["outcome"] == CallMetricsEnum.const_outcome_throttled]
+        self.assertEqual(len(throttled_list), image_generator.client.models.count_throttles)
+        self.assertTrue(os.path.exists(self.prometheus_file_path))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests of the circuit breaker.
+"""
+
+import time
+import unittest
+from src.image_generator.batch_dispatcher import BatchDispatcher
+from src.image_generator.circuit_breaker import CircuitBreaker, CircuitBreakerEnum
+from src.image_generator.generation_result import GenerationResult
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_on_failure_rate_and_closes_after_a_probe(self):
+        clock = FakeClock()
+        circuit_breaker = CircuitBreaker(window_size=4, min_requests=4, failure_rate_threshold=0.5, open_in_seconds=10.0, clock=clock)
+        for flag_failure in [False, True, False]:
+            circuit_breaker.record(flag_failure)
+        self.assertEqual(circuit_breaker.get_time_until_allowed(), 0.0)
+        circuit_breaker.record(True)
+        self.assertEqual(circuit_breaker.state, CircuitBreakerEnum.const_state_open)
+        self.assertEqual(circuit_breaker.get_time_until_allowed(), 10.0)
+        clock.now = 10.0
+        # Half-open: one probe and no more until it returns.
+        self.assertEqual(circuit_breaker.get_time_until_allowed(), 0.0)
+        circuit_breaker.on_dispatch()
+        self.assertGreater(circuit_breaker.get_time_until_allowed(), 0.0)
+        circuit_breaker.record(True)
+        self.assertEqual((circuit_breaker.state, circuit_breaker.count_openings), (CircuitBreakerEnum.const_state_open, 2))
+        clock.now = 20.0
+        self.assertEqual(circuit_breaker.get_time_until_allowed(), 0.0)
+        circuit_breaker.on_dispatch()
+        circuit_breaker.record(False)
+        self.assertEqual(circuit_breaker.state, CircuitBreakerEnum.const_state_closed)
+        # The failures before the circuit closed do not count any more.
+        circuit_breaker.record(True)
+        self.assertEqual(circuit_breaker.get_time_until_allowed(), 0.0)
+
+    def test_dispatcher_pauses_while_open(self):
+        circuit_breaker = CircuitBreaker(window_size=2, min_requests=2, failure_rate_threshold=1.0, open_in_seconds=0.2)
+        dispatch_time_list = []
+
+        def func(x):
+            dispatch_time_list.append(time.monotonic())
+            # The first two fail with a backend error, a bad request does not count.
+            if x < 2:
+                return GenerationResult(False, retryable=True, error="Unavailable.")
+            return GenerationResult(False, error="Bad request.") if x == 2 else GenerationResult(True)
+
+        dispatcher = BatchDispatcher(max_in_flight=1)
+        dispatcher.set_circuit_breaker(circuit_breaker)
+        progress = dispatcher.run(range(5), func, 5)
+        self.assertEqual((progress.count_success, progress.count_failure), (2, 3))
+        self.assertGreaterEqual(dispatch_time_list[2] - dispatch_time_list[1], 0.2)
+        self.assertLess(dispatch_time_list[4] - dispatch_time_list[2], 0.2)
+        self.assertEqual((circuit_breaker.state, circuit_breaker.count_openings), (CircuitBreakerEnum.const_state_closed, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Unit tests for the ClientPool class.
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from PIL import Image
+from src.image_generator.client_pool import ClientPool
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.rate_limiter import AdaptiveRateLimiter
+from src.image_generator.retry_policy import RetryPolicy
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestClientPool(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _make_pool(self, requests_per_minute_list, **kwargs):
+        pool = ClientPool(clock=self.clock, **kwargs)
+        for (i, requests_per_minute) in enumerate(requests_per_minute_list):
+            pool.add(f"key-{i}", f"client-{i}", AdaptiveRateLimiter(requests_per_minute, clock=self.clock))
+        return pool
+
+    def test_routes_to_the_key_with_the_most_headroom(self):
+        pool = self._make_pool([10, 30])
+        names = [pool.acquire().name for _ in range(8)]
+        # key-1 has three times the budget, so it keeps more headroom until key-0 is used once for every three uses of key-1.
+        self.assertEqual(names.count("key-1"), 6)
+        self.assertEqual(names.count("key-0"), 2)
+
+    def test_spreads_unlimited_keys_evenly(self):
+        pool = self._make_pool([None, None, None])
+        names = [pool.acquire().name for _ in range(9)]
+        self.assertEqual([names.count(f"key-{i}") for i in range(3)], [3, 3, 3])
+
+    def test_waits_when_every_key_is_out_of_budget(self):
+        pool = self._make_pool([1, 1])
+        pool.acquire()
+        pool.acquire()
+        cancel_event = threading.Event()
+        cancel_event.set()
+        self.assertIsNone(pool.acquire(cancel_event=cancel_event))
+
+    def test_ejects_a_key_after_repeated_errors(self):
+        pool = self._make_pool([None, None], eject_after_consecutive_errors=2, ejection_in_seconds=30)
+        (key_0, key_1) = pool.pooled_client_list
+        pool.on_auth_error(key_0)
+        pool.on_success(key_0)
+        pool.on_auth_error(key_0)
+        self.assertEqual(key_0.count_ejections, 0)
+        pool.on_auth_error(key_0)
+        self.assertEqual(key_0.count_ejections, 1)
+        self.assertEqual({pool.acquire().name for _ in range(5)}, {"key-1"})
+        self.clock.now += 30
+        # key-0 is back, and it takes the requests while key-1 is ejected.
+        for _ in range(2):
+            pool.on_auth_error(key_1)
+        self.assertEqual({pool.acquire().name for _ in range(5)}, {"key-0"})
+
+    def test_never_ejects_the_only_key(self):
+        pool = self._make_pool([None], eject_after_consecutive_errors=1)
+        pool.on_auth_error(pool.pooled_client_list[0])
+        self.assertEqual(pool.pooled_client_list[0].count_ejections, 0)
+        self.assertEqual(pool.acquire().name, "key-0")
+
+    def test_generation_with_a_throttled_key(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_file_path = os.path.join(temp_dir, "input.png")
+            Image.new("RGB", (16, 16)).save(input_file_path)
+            spec = InputOutputFilePathSpec()
+            for i in range(30):
+                spec.add_item_with_lists([input_file_path], [os.path.join(temp_dir, f"output_{i}.png")])
+            config = ImageGeneratorGenerateContentConfig()
+            config.set_prompt("Prompt")
+            simulation_config = {
+                "time_scale": 0,
+                "image_size": [8, 8],
+                "api_keys": [{"name": "healthy"}, {"name": "throttled", "throttle_rate": 1.0}],
+                "client_pool": {"eject_after_consecutive_errors": 1, "ejection_in_seconds": 600}
+            }
+            image_generator = ImageGeneratorForSimulation()
+            image_generator.set_retry_policy(RetryPolicy(max_attempts=5, base_delay_in_seconds=0, max_delay_in_seconds=0))
+            self.assertTrue(image_generator.do_generation(simulation_config, config, spec))
+            (healthy, throttled) = image_generator.client_pool.pooled_client_list
+            self.assertEqual(healthy.count_success, 30)
+            self.assertEqual(throttled.count_success, 0)
+            self.assertEqual(throttled.count_ejections, 1)
+            self.assertEqual(throttled.count_requests, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from src.image_generator.main import GlobalConfigValidator
+from src.image_generator.main import GlobalConfig, GlobalConfigValidator
 
 class TestGlobalConfigValidator(unittest.TestCase):
     def setUp(self):
@@ -97,5 +97,175 @@ class TestGlobalConfigValidator(unittest.TestCase):
         # Should still pass since gemini is not strictly required for validation
         self.assertTrue(self.validator.validate(config))
 
+    def test_valid_dispatch_config(self):
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                },
+                "dispatch": {
+                    "max_in_flight": 4
+                }
+            }
+        }
+        self.assertTrue(self.validator.validate(config))
+
+    def test_invalid_max_in_flight(self):
+        for max_in_flight in [0, -1, "4", 1.5, True]:
+            config = {
+                "global": {
+                    "input_output_spec": {
+                        "type": "single_directory"
+                    },
+                    "dispatch": {
+                        "max_in_flight": max_in_flight
+                    }
+                }
+            }
+            self.assertFalse(self.validator.validate(config))
+
+    def test_timeouts_hedging_and_circuit_breaker(self):
+        dispatch_config = {
+            "timeouts": {"request_in_seconds": 120, "total_in_seconds": 300},
+            "hedging": {"enabled": True, "percentile": 95, "max_hedge_ratio": 0.05, "min_samples": 20},
+            "circuit_breaker": {"enabled": True, "window_size": 20, "min_requests": 10, "failure_rate_threshold": 0.5, "open_in_seconds": 30}
+        }
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                },
+                "dispatch": dispatch_config
+            }
+        }
+        self.assertTrue(self.validator.validate(config))
+        for (section, key, value) in [
+            ("timeouts", "request_in_seconds", 0),
+            ("timeouts", "total_in_seconds", "300"),
+            ("hedging", "percentile", 100),
+            ("hedging", "max_hedge_ratio", 1.5),
+            ("circuit_breaker", "failure_rate_threshold", 0),
+            ("circuit_breaker", "window_size", 0)
+        ]:
+            config["global"]["dispatch"] = {**dispatch_config, section: {**dispatch_config[section], key: value}}
+            self.assertFalse(self.validator.validate(config), (section, key, value))
+
+    def test_empty_or_invalid_dispatch(self):
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                },
+                "dispatch": None
+            }
+        }
+        self.assertTrue(self.validator.validate(config))
+        config["global"]["dispatch"] = [4]
+        self.assertFalse(self.validator.validate(config))
+
+    def test_preprocessing_quality_is_at_most_100(self):
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                },
+                "input_image_preprocessing": {
+                    "quality": 100
+                }
+            }
+        }
+        self.assertTrue(self.validator.validate(config))
+        config["global"]["input_image_preprocessing"]["quality"] = 101
+        self.assertFalse(self.validator.validate(config))
+        # Without a value, the default quality is used.
+        config["global"]["input_image_preprocessing"]["quality"] = None
+        self.assertTrue(self.validator.validate(config))
+        self.assertEqual(GlobalConfig(config).get_input_image_preprocessor().quality, 90)
+
+    def test_fan_out(self):
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                },
+                "output_writer": {
+                    "fan_out": ["reflink", "hardlink"]
+                }
+            },
+            "gemini": {
+                "api_key": "real-api-key"
+            }
+        }
+        self.assertTrue(self.validator.validate(config))
+        for fan_out in ["hardlink", None, ["symlink"]]:
+            config["global"]["output_writer"]["fan_out"] = fan_out
+            self.assertFalse(self.validator.validate(config), fan_out)
+
+    def test_valid_rate_limits(self):
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                }
+            },
+            "gemini": {
+                "api_key": "real-api-key",
+                "rate_limits": {
+                    "models/some-model": {
+                        "requests_per_minute": 10,
+                        "tokens_per_minute": 1000000
+                    }
+                }
+            }
+        }
+        self.assertTrue(self.validator.validate(config))
+
+    def test_invalid_rate_limits(self):
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                }
+            },
+            "gemini": {
+                "api_key": "real-api-key",
+                "rate_limits": {
+                    "models/some-model": {
+                        "requests_per_minute": 0
+                    }
+                }
+            }
+        }
+        self.assertFalse(self.validator.validate(config))
+        # A budget must be a mapping.
+        config["gemini"]["rate_limits"]["models/some-model"] = 10
+        self.assertFalse(self.validator.validate(config))
+
+    def test_api_keys(self):
+        config = {
+            "global": {
+                "input_output_spec": {
+                    "type": "single_directory"
+                }
+            },
+            "gemini": {
+                "api_keys": [
+                    {"name": "a", "api_key": "real-api-key-a", "requests_per_minute": 10},
+                    {"name": "b", "api_key": "real-api-key-b"}
+                ],
+                "client_pool": {
+                    "eject_after_consecutive_errors": 3,
+                    "ejection_in_seconds": 60
+                }
+            }
+        }
+        self.assertTrue(self.validator.validate(config))
+        config["gemini"]["api_keys"][1]["api_key"] = "YOUR GEMINI API KEY"
+        self.assertFalse(self.validator.validate(config))
+        config["gemini"]["api_keys"][1] = {"name": "b", "api_key": "real-api-key-b", "requests_per_minute": -1}
+        self.assertFalse(self.validator.validate(config))
+        config["gemini"]["api_keys"] = "real-api-key"
+        self.assertFalse(self.validator.validate(config))
+
 if __name__ == "__main__":
     unittest.main()
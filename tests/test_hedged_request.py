@@ -0,0 +1,69 @@
+"""
+Tests of request hedging and the total timeout.
+"""
+
+import threading
+import time
+import unittest
+from src.image_generator.hedged_request import HedgePolicy, call_with_deadline_and_hedge
+
+class TestHedgePolicy(unittest.TestCase):
+    def test_hedge_delay_and_budget(self):
+        hedge_policy = HedgePolicy(percentile=90, max_hedge_ratio=0.1, min_samples=10)
+        for i in range(9):
+            hedge_policy.record_latency(float(i + 1))
+        self.assertIsNone(hedge_policy.get_hedge_delay_in_seconds())
+        hedge_policy.record_latency(10.0)
+        self.assertEqual(hedge_policy.get_hedge_delay_in_seconds(), 9.0)
+        for _ in range(19):
+            hedge_policy.record_request()
+        self.assertTrue(hedge_policy.try_spend())
+        self.assertFalse(hedge_policy.try_spend())
+        hedge_policy.record_request()
+        self.assertTrue(hedge_policy.try_spend())
+        hedge_policy.refund()
+        self.assertEqual(hedge_policy.count_hedges, 1)
+
+class TestCallWithDeadlineAndHedge(unittest.TestCase):
+    def test_hedge_wins_over_a_slow_request(self):
+        release_event = threading.Event()
+
+        def slow():
+            release_event.wait(5)
+            return "slow"
+
+        try:
+            start = time.monotonic()
+            self.assertEqual(call_with_deadline_and_hedge(slow, None, 0.05, lambda: lambda: "hedge"), ("hedge", True))
+            self.assertLess(time.monotonic() - start, 1.0)
+            # Without a hedge, the request is waited for.
+            self.assertEqual(call_with_deadline_and_hedge(lambda: "fast", None, 0.05, lambda: None), ("fast", False))
+        finally:
+            release_event.set()
+
+    def test_the_other_request_is_waited_for_after_a_failure(self):
+        def fail_later():
+            time.sleep(0.1)
+            raise RuntimeError("boom")
+
+        def hedge():
+            time.sleep(0.2)
+            return "hedge"
+
+        self.assertEqual(call_with_deadline_and_hedge(fail_later, None, 0.05, lambda: hedge), ("hedge", True))
+        with self.assertRaises(RuntimeError):
+            call_with_deadline_and_hedge(fail_later, None, 0.05, lambda: fail_later)
+
+    def test_total_timeout(self):
+        release_event = threading.Event()
+        try:
+            start = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                call_with_deadline_and_hedge(lambda: release_event.wait(5), 0.1)
+            self.assertLess(time.monotonic() - start, 1.0)
+        finally:
+            release_event.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
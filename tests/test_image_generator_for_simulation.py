@@ -0,0 +1,157 @@
+"""
+Tests of the simulated backend.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from PIL import Image
+from src.image_generator.call_metrics import CallMetricsRecorder
+from src.image_generator.hedged_request import HedgePolicy
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.main import GlobalConfigValidator
+from src.image_generator.retry_policy import RetryPolicy
+
+class TestImageGeneratorForSimulation(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_file_path_list = []
+        for i in range(20):
+            input_file_path = os.path.join(self.temp_dir.name, f"input_{i}.png")
+            Image.new("RGB", (16, 16), (i, 0, 0)).save(input_file_path)
+            self.input_file_path_list.append(input_file_path)
+        self.generate_content_config = ImageGeneratorGenerateContentConfig()
+        self.generate_content_config.set_prompt("Make it blue.")
+        self.simulation_config = {
+            "seed": 7,
+            "latency": {"distribution": "lognormal", "median_in_seconds": 0.01, "sigma": 0.5},
+            "time_scale": 0,
+            "error_rate": 0.1,
+            "throttle_rate": 0.3,
+            "number_of_candidates": 2,
+            "image_size": [8, 8],
+            "rate_limits": {"models/simulated-image-model": {"requests_per_minute": 1000000}}
+        }
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _run(self, output_dir_name: str, flag_stream: bool = False) -> ImageGeneratorForSimulation:
+        output_dir = os.path.join(self.temp_dir.name, output_dir_name)
+        os.makedirs(output_dir)
+        spec = InputOutputFilePathSpec()
+        for (i, input_file_path) in enumerate(self.input_file_path_list):
+            spec.add_item_with_lists([input_file_path], [os.path.join(output_dir, f"output_{i}.png")])
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_max_in_flight(4)
+        image_generator.set_stream(flag_stream)
+        image_generator.set_retry_policy(RetryPolicy(max_attempts=20, base_delay_in_seconds=0, max_delay_in_seconds=0))
+        self.assertTrue(image_generator.do_generation(self.simulation_config, self.generate_content_config, spec))
+        return image_generator
+
+    def test_all_items_succeed_after_simulated_failures(self):
+        image_generator = self._run("output")
+        models = image_generator.client.models
+        self.assertGreater(models.count_throttles, 0)
+        self.assertGreater(models.count_errors, 0)
+        self.assertEqual(models.count_calls, 20 + models.count_throttles + models.count_errors)
+        for i in range(20):
+            for candidate_index in range(2):
+                suffix = "" if candidate_index == 0 else f".candidate.{candidate_index}"
+                self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, "output", f"output_{i}{suffix}.png")))
+
+    def test_requests_overlap_up_to_max_in_flight(self):
+        self.simulation_config.update({"time_scale": 1.0, "error_rate": 0, "throttle_rate": 0})
+        models = self._run("output").client.models
+        self.assertGreater(models.max_count_in_flight, 1)
+        self.assertLessEqual(models.max_count_in_flight, 4)
+        self.assertEqual(models.count_in_flight, 0)
+
+    def test_deterministic_from_seed(self):
+        first = self._run("first").client.models
+        second = self._run("second").client.models
+        self.assertEqual((first.count_calls, first.count_errors, first.count_throttles), (second.count_calls, second.count_errors, second.count_throttles))
+        with Image.open(os.path.join(self.temp_dir.name, "first", "output_3.png")) as a, Image.open(os.path.join(self.temp_dir.name, "second", "output_3.png")) as b:
+            self.assertEqual(a.tobytes(), b.tobytes())
+
+    def test_streaming_writes_the_same_images(self):
+        self._run("blocking")
+        self._run("streaming", flag_stream=True)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.temp_dir.name, "blocking"))), sorted(os.listdir(os.path.join(self.temp_dir.name, "streaming"))))
+        for file_name in ["output_3.png", "output_3.candidate.1.png"]:
+            with Image.open(os.path.join(self.temp_dir.name, "blocking", file_name)) as a, Image.open(os.path.join(self.temp_dir.name, "streaming", file_name)) as b:
+                self.assertEqual(a.tobytes(), b.tobytes())
+
+    def test_streaming_lowers_time_to_first_image(self):
+        spec = InputOutputFilePathSpec()
+        spec.add_item_with_lists([self.input_file_path_list[0]], [os.path.join(self.temp_dir.name, "output.png")])
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_stream(True)
+        call_metrics_recorder = CallMetricsRecorder()
+        image_generator.set_call_metrics_recorder(call_metrics_recorder)
+        simulation_config = {"latency": {"distribution": "constant", "median_in_seconds": 0.2}, "number_of_candidates": 4, "image_size": [8, 8]}
+        self.assertTrue(image_generator.do_generation(simulation_config, self.generate_content_config, spec))
+        [time_to_first_image_in_seconds] = call_metrics_recorder.value_list_by_field["time_to_first_image_in_seconds"]
+        [latency_in_seconds] = call_metrics_recorder.value_list_by_field["latency_in_seconds"]
+        self.assertLess(time_to_first_image_in_seconds, latency_in_seconds / 2)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, "output.candidate.3.png")))
+
+    def _build_spec(self, output_dir_name: str) -> InputOutputFilePathSpec:
+        output_dir = os.path.join(self.temp_dir.name, output_dir_name)
+        os.makedirs(output_dir)
+        spec = InputOutputFilePathSpec()
+        for (i, input_file_path) in enumerate(self.input_file_path_list):
+            spec.add_item_with_lists([input_file_path], [os.path.join(output_dir, f"output_{i}.png")])
+        return spec
+
+    def test_request_timeout_is_retried(self):
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_max_in_flight(4)
+        image_generator.set_timeouts(0.03, None)
+        image_generator.set_retry_policy(RetryPolicy(max_attempts=20, base_delay_in_seconds=0, max_delay_in_seconds=0))
+        simulation_config = {"seed": 7, "latency": {"distribution": "lognormal", "median_in_seconds": 0.01, "sigma": 1.0}, "image_size": [8, 8]}
+        self.assertTrue(image_generator.do_generation(simulation_config, self.generate_content_config, self._build_spec("output")))
+        self.assertGreater(image_generator.client.models.count_timeouts, 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.temp_dir.name, "output"))), 20)
+
+    def test_stalled_stream_times_out_at_the_total_timeout(self):
+        spec = InputOutputFilePathSpec()
+        output_file_path = os.path.join(self.temp_dir.name, "output.png")
+        spec.add_item_with_lists([self.input_file_path_list[0]], [output_file_path])
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_stream(True)
+        image_generator.set_timeouts(None, 0.1)
+        # The first chunk arrives after 0.5 seconds.
+        simulation_config = {"latency": {"distribution": "constant", "median_in_seconds": 0.5}, "image_size": [8, 8]}
+        start = time.perf_counter()
+        image_generator.do_generation(simulation_config, self.generate_content_config, spec)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        # The chunk which arrives after the timeout is dropped.
+        time.sleep(0.6)
+        self.assertFalse(os.path.exists(output_file_path))
+
+    def test_slow_requests_are_hedged(self):
+        image_generator = ImageGeneratorForSimulation()
+        hedge_policy = HedgePolicy(percentile=50, max_hedge_ratio=1.0, min_samples=5)
+        image_generator.set_hedge_policy(hedge_policy)
+        image_generator.set_timeouts(None, 10.0)
+        simulation_config = {"seed": 7, "latency": {"distribution": "lognormal", "median_in_seconds": 0.01, "sigma": 1.0}, "image_size": [8, 8]}
+        self.assertTrue(image_generator.do_generation(simulation_config, self.generate_content_config, self._build_spec("output")))
+        self.assertEqual(hedge_policy.count_requests, 20)
+        self.assertGreater(hedge_policy.count_hedges, 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.temp_dir.name, "output"))), 20)
+
+    def test_validate_simulation_config(self):
+        validator = GlobalConfigValidator()
+        config = {"global": {"input_output_spec": {"type": "single_directory"}, "backend": "simulation"}, "simulation": self.simulation_config}
+        self.assertTrue(validator.validate(config))
+        config["simulation"] = {**self.simulation_config, "error_rate": 0.8}
+        self.assertFalse(validator.validate(config))
+        config["global"]["backend"] = "unknown"
+        self.assertFalse(validator.validate(config))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests of the deduplication of input images and work items.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from PIL import Image
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_deduplicator import InputDeduplicator, compute_difference_hash
+from src.image_generator.input_output_file_path_spec import LazyInputOutputFilePathSpec
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories, InputOutputFilePathSpecBuilderForSingleDirectory
+
+class TestInputDeduplicator(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, 'source')
+        self.reference_dir = os.path.join(self.temp_dir.name, 'reference')
+        self.output_dir = os.path.join(self.temp_dir.name, 'output')
+        for dir_path in [self.source_dir, self.reference_dir, self.output_dir]:
+            os.makedirs(dir_path)
+        mandelbrot = Image.effect_mandelbrot((256, 256), (-2.0, -1.5, 1.0, 1.5), 100).convert('RGB')
+        mandelbrot.save(os.path.join(self.source_dir, 'a.png'))
+        shutil.copyfile(os.path.join(self.source_dir, 'a.png'), os.path.join(self.source_dir, 'a_copy.png'))
+        mandelbrot.save(os.path.join(self.source_dir, 'a_resaved.jpg'), quality=70)
+        mandelbrot.transpose(Image.Transpose.ROTATE_90).save(os.path.join(self.source_dir, 'b.png'))
+        Image.new('RGB', (8, 8), (255, 0, 0)).save(os.path.join(self.reference_dir, 'r0.png'))
+        shutil.copyfile(os.path.join(self.reference_dir, 'r0.png'), os.path.join(self.reference_dir, 'r0_copy.png'))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_identical_items_are_collapsed(self):
+        input_deduplicator = InputDeduplicator()
+        builder = InputOutputFilePathSpecBuilderForPairOfDirectories()
+        builder.set_input_deduplicator(input_deduplicator)
+        spec = builder.build_lazy(self.source_dir, self.reference_dir, self.output_dir, 'run')
+        # 4 sources x 2 references, of which a.png and a_copy.png, and r0.png and r0_copy.png, are byte-identical.
+        self.assertEqual(spec.get_number_of_items(), 3)
+        self.assertEqual(input_deduplicator.get_count_saved_calls(), 5)
+        self.assertEqual(sum(len(item.output_file_path_list) for item in spec.iter_items()), 16)
+        self.assertEqual(input_deduplicator.count_duplicate_files, 2)
+
+    def test_deduplicated_lazy_spec_stays_lazy(self):
+        builder = InputOutputFilePathSpecBuilderForPairOfDirectories()
+        builder.set_input_deduplicator(InputDeduplicator())
+        lazy_spec = builder.build_lazy(self.source_dir, self.reference_dir, self.output_dir, 'run')
+        self.assertIsInstance(lazy_spec, LazyInputOutputFilePathSpec)
+        builder.set_input_deduplicator(InputDeduplicator())
+        spec = builder.build(self.source_dir, self.reference_dir, self.output_dir, 'run')
+        self.assertEqual(
+            [(item.input_file_path_list, item.output_file_path_list) for item in lazy_spec.iter_items()],
+            [(item.input_file_path_list, item.output_file_path_list) for item in spec.iter_items()]
+        )
+        self.assertEqual(lazy_spec.get_number_of_items(), 3)
+
+    def test_near_duplicates_with_perceptual_hash(self):
+        self.assertNotEqual(compute_difference_hash(os.path.join(self.source_dir, 'a.png')), compute_difference_hash(os.path.join(self.source_dir, 'b.png')))
+        builder = InputOutputFilePathSpecBuilderForSingleDirectory()
+        builder.set_input_deduplicator(InputDeduplicator(flag_perceptual=True))
+        spec = builder.build(self.source_dir, self.output_dir, 'run')
+        self.assertEqual([os.path.basename(item.input_file_path_list[0]) for item in spec.iter_items()], ['a.png', 'b.png'])
+
+    def test_difference_hash_without_deprecation_warning(self):
+        # Brighter on the left, so that every pixel is brighter than its right neighbor.
+        gradient_file_path = os.path.join(self.temp_dir.name, 'gradient.png')
+        Image.linear_gradient('L').rotate(-90).save(gradient_file_path)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            self.assertEqual(compute_difference_hash(gradient_file_path), (1 << 64) - 1)
+
+    def test_results_are_fanned_out_to_every_output_path(self):
+        builder = InputOutputFilePathSpecBuilderForSingleDirectory()
+        builder.set_input_deduplicator(InputDeduplicator())
+        spec = builder.build(self.source_dir, self.output_dir, 'run')
+        self.assertEqual(spec.get_number_of_items(), 3)
+        generate_content_config = ImageGeneratorGenerateContentConfig()
+        generate_content_config.set_prompt("Make it blue.")
+        image_generator = ImageGeneratorForSimulation()
+        self.assertTrue(image_generator.do_generation({"seed": 1, "time_scale": 0, "image_size": [8, 8]}, generate_content_config, spec))
+        self.assertEqual(image_generator.client.models.count_calls, 3)
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['a-run.png', 'a_copy-run.png', 'a_resaved-run.png', 'b-run.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Tests of the input file discovery and the persistent input file index.
+"""
+
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.input_file_index import InputFileIndex, InputFileIndexEnum, list_input_image_files, sniff_image_format
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories, InputOutputFilePathSpecBuilderForSingleDirectory
+
+class TestInputFileIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, 'source')
+        self.reference_dir = os.path.join(self.temp_dir.name, 'reference')
+        os.makedirs(os.path.join(self.source_dir, 'sub'))
+        os.makedirs(self.reference_dir)
+        Image.new('RGB', (16, 8)).save(os.path.join(self.source_dir, 'a.png'))
+        Image.new('RGB', (8, 8)).save(os.path.join(self.source_dir, 'B.JPG'), format='JPEG')
+        Image.new('RGB', (8, 8)).save(os.path.join(self.source_dir, 'sub', 'c.webp'), format='WEBP')
+        with open(os.path.join(self.source_dir, 'fake.png'), mode='wb') as f:
+            f.write(b'not an image')
+        with open(os.path.join(self.source_dir, '.partial.png'), mode='wb') as f:
+            f.write(b'')
+        Image.new('RGB', (8, 8)).save(os.path.join(self.reference_dir, 'r0.png'))
+        Image.new('RGB', (8, 8)).save(os.path.join(self.reference_dir, 'r1.png'))
+        self.index_file_path = os.path.join(self.temp_dir.name, 'index', 'input_file_index.sqlite3')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_list_input_image_files(self):
+        self.assertEqual(list_input_image_files(self.source_dir), ['B.JPG', 'a.png', 'fake.png'])
+        self.assertEqual(list_input_image_files(self.source_dir, recursive=True), ['B.JPG', 'a.png', 'fake.png', os.path.join('sub', 'c.webp')])
+
+    def test_sniff_image_format(self):
+        with open(os.path.join(self.source_dir, 'B.JPG'), mode='rb') as f:
+            self.assertEqual(sniff_image_format(f.read(16)), InputFileIndexEnum.const_format_jpeg)
+        self.assertIsNone(sniff_image_format(b'not an image'))
+
+    def test_scan_skips_non_images_and_records_dimensions(self):
+        input_file_index = InputFileIndex(self.index_file_path)
+        (file_name_list, changed_file_name_set) = input_file_index.scan(self.source_dir, recursive=True)
+        self.assertEqual(file_name_list, ['B.JPG', 'a.png', os.path.join('sub', 'c.webp')])
+        self.assertEqual(changed_file_name_set, set(file_name_list))
+        entry = input_file_index.get_entry(os.path.join(self.source_dir, 'a.png'))
+        self.assertEqual((entry.width, entry.height, entry.image_format), (16, 8, InputFileIndexEnum.const_format_png))
+        input_file_index.close()
+
+    def test_only_new_or_modified_since_save(self):
+        input_file_index = InputFileIndex(self.index_file_path)
+        input_file_index.scan(self.source_dir)
+        input_file_index.save()
+        input_file_index.close()
+
+        input_file_index = InputFileIndex(self.index_file_path)
+        (file_name_list, changed_file_name_set) = input_file_index.scan(self.source_dir)
+        self.assertEqual(changed_file_name_set, set())
+        self.assertEqual(input_file_index.count_hashed, 0)
+        self.assertEqual(file_name_list, ['B.JPG', 'a.png'])
+
+        Image.new('RGB', (32, 32)).save(os.path.join(self.source_dir, 'a.png'))
+        Image.new('RGB', (8, 8)).save(os.path.join(self.source_dir, 'new.png'))
+        (_, changed_file_name_set) = input_file_index.scan(self.source_dir)
+        self.assertEqual(changed_file_name_set, {'a.png', 'new.png'})
+        self.assertEqual(input_file_index.get_entry(os.path.join(self.source_dir, 'a.png')).width, 32)
+        input_file_index.close()
+
+    def test_builders_ask_for_new_or_modified_files(self):
+        input_file_index = InputFileIndex(self.index_file_path)
+        builder = InputOutputFilePathSpecBuilderForPairOfDirectories()
+        builder.set_input_file_index(input_file_index, flag_only_new_or_modified=True)
+        self.assertEqual(builder.build_lazy(self.source_dir, self.reference_dir, 'out', 'run').get_number_of_items(), 4)
+        input_file_index.save()
+
+        Image.new('RGB', (8, 8)).save(os.path.join(self.reference_dir, 'r2.png'))
+        eager = builder.build(self.source_dir, self.reference_dir, 'out', 'run')
+        lazy = builder.build_lazy(self.source_dir, self.reference_dir, 'out', 'run')
+        self.assertEqual(lazy.get_number_of_items(), 2)
+        self.assertEqual(list(lazy.iter_items()), list(eager.iter_items()))
+        self.assertTrue(all(item.input_file_path_list[1].endswith('r2.png') for item in eager.iter_items()))
+
+        builder = InputOutputFilePathSpecBuilderForSingleDirectory()
+        builder.set_input_file_index(input_file_index, flag_only_new_or_modified=True)
+        self.assertEqual(builder.build(self.source_dir, 'out', 'run').get_number_of_items(), 0)
+        input_file_index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Unit tests for the InputImageCache class.
+"""
+
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.input_image_cache import InputImageCache
+
+class TestInputImageCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.count_loads = 0
+        self.file_path_list = []
+        for i in range(3):
+            file_path = os.path.join(self.temp_dir.name, f"image_{i}.png")
+            Image.new("RGB", (10, 10), (i, 0, 0)).save(file_path)
+            self.file_path_list.append(file_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _loader(self, file_path):
+        self.count_loads += 1
+        with Image.open(file_path) as image:
+            return image.copy()
+
+    def test_hit_and_miss(self):
+        cache = InputImageCache(max_bytes=10000)
+        first = cache.get_or_load(self.file_path_list[0], self._loader)
+        second = cache.get_or_load(self.file_path_list[0], self._loader)
+        self.assertIs(first, second)
+        self.assertEqual(self.count_loads, 1)
+        self.assertEqual((cache.count_hits, cache.count_misses), (1, 1))
+        self.assertEqual(cache.current_bytes, 300)
+
+    def test_evicts_least_recently_used_by_size(self):
+        # Each image is 10 * 10 * 3 = 300 bytes.
+        cache = InputImageCache(max_bytes=600)
+        cache.get_or_load(self.file_path_list[0], self._loader)
+        cache.get_or_load(self.file_path_list[1], self._loader)
+        cache.get_or_load(self.file_path_list[0], self._loader)
+        cache.get_or_load(self.file_path_list[2], self._loader)
+        self.assertEqual(cache.count_evictions, 1)
+        self.assertLessEqual(cache.current_bytes, 600)
+        cache.get_or_load(self.file_path_list[0], self._loader)
+        self.assertEqual(self.count_loads, 3)
+        cache.get_or_load(self.file_path_list[1], self._loader)
+        self.assertEqual(self.count_loads, 4)
+
+    def test_modified_file_is_loaded_again(self):
+        cache = InputImageCache(max_bytes=10000)
+        cache.get_or_load(self.file_path_list[0], self._loader)
+        Image.new("RGB", (20, 20)).save(self.file_path_list[0])
+        image = cache.get_or_load(self.file_path_list[0], self._loader)
+        self.assertEqual(image.size, (20, 20))
+        self.assertEqual(self.count_loads, 2)
+
+    def test_missing_file_raises(self):
+        cache = InputImageCache(max_bytes=10000)
+        with self.assertRaises(FileNotFoundError):
+            cache.get_or_load(os.path.join(self.temp_dir.name, "missing.png"), self._loader)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Unit tests for the InputImagePreprocessor class.
+"""
+
+from io import BytesIO
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.input_image_preprocessor import InputImagePreprocessor
+
+class TestInputImagePreprocessor(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _save(self, image, file_name, **kwargs):
+        file_path = os.path.join(self.temp_dir.name, file_name)
+        image.save(file_path, **kwargs)
+        return file_path
+
+    def test_caps_longest_edge_and_keeps_aspect_ratio(self):
+        file_path = self._save(Image.new("RGB", (4000, 2000), (10, 20, 30)), "large.png")
+        prepared = InputImagePreprocessor(max_long_edge=1000).prepare(file_path)
+        self.assertEqual(prepared.size, (1000, 500))
+        self.assertEqual(prepared.mime_type, "image/jpeg")
+        self.assertLess(len(prepared.data), prepared.original_size_in_bytes)
+        with Image.open(BytesIO(prepared.data)) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (1000, 500))
+
+    def test_small_image_is_not_upscaled(self):
+        file_path = self._save(Image.new("RGB", (100, 50)), "small.png")
+        prepared = InputImagePreprocessor(max_long_edge=1000).prepare(file_path)
+        self.assertEqual(prepared.size, (100, 50))
+
+    def test_applies_exif_orientation_and_strips_metadata(self):
+        exif = Image.Exif()
+        # 6: Rotate 90 CW to display.
+        exif[0x0112] = 6
+        file_path = self._save(Image.new("RGB", (300, 100)), "rotated.jpg", exif=exif)
+        prepared = InputImagePreprocessor().prepare(file_path)
+        self.assertEqual(prepared.size, (100, 300))
+        with Image.open(BytesIO(prepared.data)) as image:
+            self.assertNotIn(0x0112, image.getexif())
+
+    def test_rgba_to_jpeg_and_webp(self):
+        file_path = self._save(Image.new("RGBA", (64, 64), (255, 0, 0, 128)), "alpha.png")
+        prepared = InputImagePreprocessor().prepare(file_path)
+        self.assertEqual(prepared.mime_type, "image/jpeg")
+        prepared = InputImagePreprocessor(output_format="webp", quality=80).prepare(file_path)
+        self.assertEqual(prepared.mime_type, "image/webp")
+        with Image.open(BytesIO(prepared.data)) as image:
+            self.assertEqual(image.format, "WEBP")
+
+    def test_record_request_accumulates_saved_bytes(self):
+        file_path = self._save(Image.new("RGB", (2000, 2000)), "large.png")
+        preprocessor = InputImagePreprocessor(max_long_edge=500)
+        prepared = preprocessor.prepare(file_path)
+        preprocessor.record_request([prepared, prepared])
+        self.assertEqual(preprocessor.count_requests, 1)
+        self.assertEqual(preprocessor.count_uploaded_bytes, 2 * len(prepared.data))
+        self.assertEqual(preprocessor.count_original_bytes, 2 * prepared.original_size_in_bytes)
+
+    def test_each_input_is_prepared_once(self):
+        file_path = self._save(Image.new("RGB", (100, 100), (1, 2, 3)), "input.png")
+        preprocessor = InputImagePreprocessor()
+        first = preprocessor.prepare(file_path)
+        self.assertIs(preprocessor.prepare(file_path), first)
+        self.assertEqual((preprocessor.count_prepared, preprocessor.count_memo_hits), (1, 1))
+        # A modified file is prepared again.
+        self._save(Image.new("RGB", (50, 100), (1, 2, 3)), "input.png")
+        os.utime(file_path, ns=(0, 0))
+        self.assertEqual(preprocessor.prepare(file_path).size, (50, 100))
+        # Without the memo, every call prepares.
+        preprocessor = InputImagePreprocessor(max_memo_bytes=0)
+        preprocessor.prepare(file_path)
+        preprocessor.prepare(file_path)
+        self.assertEqual((preprocessor.count_prepared, preprocessor.count_memo_hits), (2, 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,8 +2,11 @@
 Unit tests for the InputOutputFilePathSpec class.
 """
 
+import os
+import tempfile
 import unittest
-from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec
+from src.image_generator.input_output_file_path_spec import InputOutputFilePathSpec, InputOutputFilePathSpecItem
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories, InputOutputFilePathSpecBuilderForSingleDirectory
 
 class TestInputOutputFilePathSpec(unittest.TestCase):
     def setUp(self):
@@ -47,3 +50,50 @@ class TestInputOutputFilePathSpec(unittest.TestCase):
             self.spec.show_input_output_file_path_spec()
         except Exception as e:
             self.fail(f"show_input_output_file_path_spec raised an exception: {e}")
+
+    def test_iter_items_yields_compact_items(self):
+        self.spec.add_item_with_lists(['a.png', 'b.png'], ['c.png'])
+        items = list(self.spec.iter_items())
+        self.assertEqual(items, [InputOutputFilePathSpecItem(('a.png', 'b.png'), ('c.png',))])
+        self.assertEqual(items[0]['input_file_path_list'], ['a.png', 'b.png'])
+        self.assertEqual(self.spec.get_number_of_items(), 1)
+        self.assertEqual(len(self.spec), 1)
+
+class TestLazyInputOutputFilePathSpec(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, 'source')
+        self.reference_dir = os.path.join(self.temp_dir.name, 'reference')
+        os.makedirs(self.source_dir)
+        os.makedirs(self.reference_dir)
+        for file_name in ['s0.png', 's1.jpg', 's2.webp', 'notes.txt']:
+            with open(os.path.join(self.source_dir, file_name), mode='wb'):
+                pass
+        for file_name in ['r0.png', 'r1.png']:
+            with open(os.path.join(self.reference_dir, file_name), mode='wb'):
+                pass
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_pair_of_directories_matches_eager_build(self):
+        builder = InputOutputFilePathSpecBuilderForPairOfDirectories()
+        eager = builder.build(self.source_dir, self.reference_dir, 'out', 'run')
+        lazy = builder.build_lazy(self.source_dir, self.reference_dir, 'out', 'run')
+        self.assertEqual(lazy.get_number_of_items(), 6)
+        self.assertEqual(list(lazy.iter_items()), list(eager.iter_items()))
+        # A lazy spec can be iterated more than once.
+        self.assertEqual(len(list(lazy.iter_items())), 6)
+        self.assertEqual(lazy.get_item_list(), eager.get_item_list())
+
+    def test_single_directory_matches_eager_build(self):
+        builder = InputOutputFilePathSpecBuilderForSingleDirectory()
+        eager = builder.build(self.source_dir, 'out', 'run')
+        lazy = builder.build_lazy(self.source_dir, 'out', 'run')
+        self.assertEqual(lazy.get_number_of_items(), 3)
+        self.assertEqual(list(lazy.iter_items()), list(eager.iter_items()))
+
+    def test_adding_items_is_not_supported(self):
+        lazy = InputOutputFilePathSpecBuilderForSingleDirectory().build_lazy(self.source_dir, 'out')
+        with self.assertRaises(TypeError):
+            lazy.add_item_with_lists(['a.png'], ['b.png'])
@@ -0,0 +1,98 @@
+"""
+Tests of the cache of input images uploaded with the Files API.
+"""
+
+import os
+import tempfile
+from typing import Optional
+import unittest
+from PIL import Image
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_image_preprocessor import InputImagePreprocessor
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories
+from src.image_generator.input_upload_cache import InputUploadCache
+from src.image_generator.retry_policy import RetryPolicy
+
+class TestInputUploadCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, 'source')
+        self.reference_dir = os.path.join(self.temp_dir.name, 'reference')
+        self.output_dir = os.path.join(self.temp_dir.name, 'output')
+        for dir_path in [self.source_dir, self.reference_dir, self.output_dir]:
+            os.makedirs(dir_path)
+        for i in range(3):
+            Image.new('RGB', (8, 8), (i + 1, 0, 0)).save(os.path.join(self.source_dir, f's{i}.png'))
+        for i in range(2):
+            Image.new('RGB', (8, 8), (0, i, 0)).save(os.path.join(self.reference_dir, f'r{i}.png'))
+        self.cache_file_path = os.path.join(self.temp_dir.name, 'cache', 'input_upload_cache.sqlite3')
+        self.generate_content_config = ImageGeneratorGenerateContentConfig()
+        self.generate_content_config.set_prompt("Make it blue.")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _run(self, input_upload_cache: InputUploadCache, date_and_time_part: str, input_image_preprocessor: Optional[InputImagePreprocessor] = None) -> ImageGeneratorForSimulation:
+        spec = InputOutputFilePathSpecBuilderForPairOfDirectories().build(self.source_dir, self.reference_dir, self.output_dir, date_and_time_part)
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_max_in_flight(4)
+        image_generator.set_retry_policy(RetryPolicy(max_attempts=2, base_delay_in_seconds=0, max_delay_in_seconds=0))
+        image_generator.set_input_upload_cache(input_upload_cache)
+        image_generator.set_input_image_preprocessor(input_image_preprocessor)
+        self.assertTrue(image_generator.do_generation({"seed": 1, "time_scale": 0, "image_size": [8, 8]}, self.generate_content_config, spec))
+        return image_generator
+
+    def test_each_input_is_uploaded_once(self):
+        input_upload_cache = InputUploadCache(self.cache_file_path)
+        image_generator = self._run(input_upload_cache, 'run')
+        # 3 sources x 2 references make 6 requests with 12 images, of which 5 are distinct.
+        self.assertEqual(image_generator.client.files.count_uploads, 5)
+        self.assertEqual(image_generator.client.models.count_calls, 6)
+        self.assertEqual((input_upload_cache.count_uploads, input_upload_cache.count_hits), (5, 7))
+        input_upload_cache.close()
+
+    def test_only_uploaded_bytes_are_counted_by_the_preprocessor(self):
+        input_upload_cache = InputUploadCache(self.cache_file_path)
+        input_image_preprocessor = InputImagePreprocessor()
+        self._run(input_upload_cache, 'run', input_image_preprocessor)
+        input_file_path_list = [os.path.join(self.source_dir, f's{i}.png') for i in range(3)] + [os.path.join(self.reference_dir, f'r{i}.png') for i in range(2)]
+        # Each distinct prepared image is uploaded once. Close colors may be prepared to the same JPEG.
+        self.assertEqual(input_image_preprocessor.count_uploaded_bytes, sum(len(x) for x in {input_image_preprocessor.prepare(x).data for x in input_file_path_list}))
+        input_upload_cache.close()
+
+    def test_files_missing_on_the_server_are_uploaded_again(self):
+        input_upload_cache = InputUploadCache(self.cache_file_path)
+        self._run(input_upload_cache, 'run1')
+        input_upload_cache.close()
+        count_output_files = len(os.listdir(self.output_dir))
+
+        # A new client does not have the files of the previous one, as if they had expired on the server.
+        input_upload_cache = InputUploadCache(self.cache_file_path)
+        image_generator = self._run(input_upload_cache, 'run2')
+        self.assertGreater(input_upload_cache.count_invalidations, 0)
+        self.assertEqual(len(os.listdir(self.output_dir)), 2 * count_output_files)
+        self.assertEqual(image_generator.client_pool.pooled_client_list[0].count_auth_errors, 0)
+        input_upload_cache.close()
+
+    def test_entries_about_to_expire_are_uploaded_again(self):
+        now = [1000.0]
+        uploaded_list = []
+
+        def upload():
+            uploaded_list.append(now[0])
+            return (f"uri-{len(uploaded_list)}", "image/png", now[0] + 3600)
+
+        input_upload_cache = InputUploadCache(self.cache_file_path, expiry_margin_in_seconds=600, clock=lambda: now[0])
+        self.assertEqual(input_upload_cache.get_or_upload('key', 'hash', 10, upload), ('uri-1', 'image/png', True))
+        now[0] += 2000
+        self.assertEqual(input_upload_cache.get_or_upload('key', 'hash', 10, upload), ('uri-1', 'image/png', False))
+        self.assertEqual(input_upload_cache.get_or_upload('other key', 'hash', 10, upload), ('uri-2', 'image/png', True))
+        now[0] += 1000
+        self.assertEqual(input_upload_cache.get_or_upload('key', 'hash', 10, upload), ('uri-3', 'image/png', True))
+        self.assertEqual(input_upload_cache.saved_inline_bytes, 10)
+        input_upload_cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Tests of the logging of API payloads.
+"""
+
+import unittest
+from google.genai import types
+from loguru import logger
+from src.image_generator.log_payload import log_payload, summarize_payload
+
+class TestLogPayload(unittest.TestCase):
+    def setUp(self):
+        self.data = b'\x89PNG' + bytes(range(256)) * 4096
+        part = types.Part(inline_data=types.Blob(mime_type='image/png', data=self.data))
+        self.response = types.GenerateContentResponse(candidates=[
+            types.Candidate(index=0, content=types.Content(role='model', parts=[types.Part(text='x' * 1000), part]), finish_reason=types.FinishReason.STOP)
+        ])
+
+    def test_summary_has_no_bytes(self):
+        summary = summarize_payload(self.response)
+        self.assertIn(f"data=<{len(self.data)} bytes>", summary)
+        self.assertIn("mime_type='image/png'", summary)
+        self.assertIn("...<1000 chars>", summary)
+        self.assertNotIn('PNG', summary)
+        self.assertNotIn('\\x', summary)
+        self.assertLess(len(summary), 1000)
+
+    def test_summary_is_built_only_if_the_level_is_on(self):
+        message_list = []
+        handler_id = logger.add(message_list.append, level='INFO', format='{message}')
+        count_calls = [0]
+
+        class Payload:
+            def __repr__(self):
+                count_calls[0] += 1
+                return 'payload'
+
+        try:
+            # TRACE is below the level of every sink.
+            log_payload('TRACE', 'Response:', Payload())
+            self.assertEqual((count_calls[0], message_list), (0, []))
+            log_payload('INFO', 'Response:', Payload())
+            self.assertEqual((count_calls[0], [x.strip() for x in message_list]), (1, ["Response: 'payload'"]))
+        finally:
+            logger.remove(handler_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
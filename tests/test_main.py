@@ -0,0 +1,57 @@
+"""
+Tests of the command line interface.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from src.image_generator.main import main, parse_args
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.temp_dir.name, 'global_config.yaml'), mode='w', encoding='utf-8') as f:
+            f.write("global:\n    input_output_spec:\n        type: single_directory\n    backend: simulation\nsimulation:\n    seed: 0\n")
+        with open(os.path.join(self.temp_dir.name, 'generate_content_config.yaml'), mode='w', encoding='utf-8') as f:
+            f.write("default:\n    prompt: Make it blue.\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_parse_args_keeps_options_given_before_run(self):
+        options = parse_args(['--yes', 'run', '--resume', 'x'])
+        self.assertEqual((options.command, options.yes, options.resume), ('run', True, 'x'))
+        options = parse_args(['--no-cache'])
+        self.assertEqual((options.command, options.no_cache), (None, True))
+
+    def test_validate(self):
+        self.assertEqual(main(['--config-dir', self.temp_dir.name, 'validate']), 0)
+        self.assertEqual(main(['--config-dir', os.path.join(self.temp_dir.name, 'missing'), 'validate']), 1)
+
+    def test_plan_with_sweep(self):
+        for (generate_content_config_keys, expected) in [(['default'], 0), (['missing'], 1)]:
+            with open(os.path.join(self.temp_dir.name, 'global_config.yaml'), mode='w', encoding='utf-8') as f:
+                f.write(f"global:\n    input_output_spec:\n        type: single_directory\n    backend: simulation\n    sweep:\n        generate_content_config_keys: {generate_content_config_keys}\n        temperature: [0.2, 0.8]\nsimulation:\n    seed: 0\n")
+            self.assertEqual(main(['--config-dir', self.temp_dir.name, 'plan']), expected)
+
+    def test_validate_and_plan_do_not_import_the_gemini_sdk(self):
+        # In a new interpreter, because other tests import the SDK.
+        code = textwrap.dedent(f"""
+            import sys
+            from src.image_generator.main import main
+            assert main(['--config-dir', {self.temp_dir.name!r}, 'validate']) == 0
+            assert 'PIL' not in sys.modules, 'PIL is imported by validate'
+            assert 'sqlite3' not in sys.modules, 'sqlite3 is imported by validate'
+            assert main(['--config-dir', {self.temp_dir.name!r}, 'plan']) == 0
+            assert 'google.genai' not in sys.modules, 'google.genai is imported'
+        """)
+        project_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        result = subprocess.run([sys.executable, '-c', code], cwd=project_dir, capture_output=True, text=True, check=False)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Unit tests for the OutputImageWriter class.
+"""
+
+from io import BytesIO
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.output_image_writer import OutputImageWriter, OutputImageWriterEnum, clone_file_atomically, gather_write_futures, write_file_atomically
+
+def make_png_bytes(size=(8, 8)):
+    bytesio = BytesIO()
+    Image.new("RGB", size, (1, 2, 3)).save(bytesio, format="PNG")
+    return bytesio.getvalue()
+
+class TestOutputImageWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _path(self, file_name):
+        return os.path.join(self.temp_dir.name, file_name)
+
+    def test_writes_all_paths_once_encoded(self):
+        for max_workers in [0, 2]:
+            writer = OutputImageWriter(max_workers=max_workers)
+            completed = []
+            paths = [self._path(f"a{max_workers}.png"), self._path(f"b{max_workers}.png")]
+            future = writer.submit([(make_png_bytes(), paths)], lambda written, error: completed.append((written, error)))
+            self.assertEqual(future.result(), paths)
+            writer.flush()
+            self.assertEqual(completed, [(paths, None)])
+            for path in paths:
+                with Image.open(path) as image:
+                    self.assertEqual(image.format, "PNG")
+                    self.assertEqual(image.size, (8, 8))
+            self.assertEqual(writer.count_images, 1)
+            self.assertEqual(writer.count_files, 2)
+            self.assertEqual(sum(writer.count_by_fan_out_mode.values()), 1)
+            writer.close()
+        self.assertFalse([x for x in os.listdir(self.temp_dir.name) if x.endswith(".tmp")])
+
+    def test_other_format_is_encoded_separately(self):
+        writer = OutputImageWriter(max_workers=0)
+        paths = [self._path("a.png"), self._path("a.webp")]
+        writer.submit([(make_png_bytes(), paths)]).result()
+        with Image.open(paths[1]) as image:
+            self.assertEqual(image.format, "WEBP")
+
+    def test_image_in_the_output_format_is_passed_through(self):
+        writer = OutputImageWriter(max_workers=0, encoder_options_by_format={"WEBP": {"quality": 50}})
+        image_bytes = make_png_bytes()
+        writer.submit([(image_bytes, [self._path("a.png"), self._path("a.webp")])]).result()
+        with open(self._path("a.png"), mode="rb") as f:
+            self.assertEqual(f.read(), image_bytes)
+        self.assertEqual((writer.count_passthrough, writer.count_converted), (1, 0))
+        bytesio = BytesIO()
+        Image.new("RGB", (8, 8)).save(bytesio, format="JPEG")
+        writer.submit([(bytesio.getvalue(), [self._path("b.avif")])]).result()
+        with Image.open(self._path("b.avif")) as image:
+            self.assertEqual(image.format, "AVIF")
+        self.assertEqual((writer.count_passthrough, writer.count_converted), (1, 1))
+        self.assertEqual(writer.output_bytes, sum(os.path.getsize(self._path(x)) for x in ["a.png", "a.webp", "b.avif"]))
+
+    def test_failure_is_reported(self):
+        writer = OutputImageWriter(max_workers=1)
+        errors = []
+        future = writer.submit([(b"not an image", [self._path("broken.png")])], lambda written, error: errors.append(error))
+        with self.assertRaises(Exception):
+            future.result()
+        writer.flush()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(writer.count_failures, 1)
+        self.assertFalse(os.path.exists(self._path("broken.png")))
+        writer.close()
+
+    def test_gather_write_futures(self):
+        writer = OutputImageWriter(max_workers=2)
+        completed = []
+        future_list = [writer.submit([(make_png_bytes(), [self._path(f"{i}.png")])]) for i in range(3)]
+        gathered_future = gather_write_futures(future_list, lambda written, error: completed.append((written, error)))
+        self.assertEqual(gathered_future.result(), [self._path(f"{i}.png") for i in range(3)])
+        self.assertEqual(completed, [(gathered_future.result(), None)])
+        future_list.append(writer.submit([(b"not an image", [self._path("broken.png")])]))
+        with self.assertRaises(Exception):
+            gather_write_futures(future_list).result()
+        self.assertEqual(gather_write_futures([]).result(), [])
+        writer.close()
+
+    def test_clone_falls_back_to_copy(self):
+        source = self._path("source.png")
+        write_file_atomically(source, b"data")
+        mode = clone_file_atomically(source, self._path("hardlinked.png"), [OutputImageWriterEnum.const_fan_out_hardlink])
+        self.assertEqual(mode, OutputImageWriterEnum.const_fan_out_hardlink)
+        self.assertEqual(os.stat(source).st_ino, os.stat(self._path("hardlinked.png")).st_ino)
+        mode = clone_file_atomically(source, self._path("copied.png"), [])
+        self.assertEqual(mode, OutputImageWriterEnum.const_fan_out_copy)
+        with open(self._path("copied.png"), mode="rb") as f:
+            self.assertEqual(f.read(), b"data")
+
+if __name__ == "__main__":
+    unittest.main()
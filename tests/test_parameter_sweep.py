@@ -0,0 +1,60 @@
+"""
+Tests of the parameter sweep.
+"""
+
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_image_cache import InputImageCache
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForSingleDirectory
+from src.image_generator.parameter_sweep import SweepInputOutputFilePathSpec, build_sweep_variant_list
+
+class TestParameterSweep(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, 'source')
+        self.output_dir = os.path.join(self.temp_dir.name, 'output')
+        os.makedirs(self.source_dir)
+        os.makedirs(self.output_dir)
+        for i in range(2):
+            Image.new('RGB', (8, 8), (i, 0, 0)).save(os.path.join(self.source_dir, f's{i}.png'))
+        self.generate_content_config = {
+            'edit': {'prompt': 'Make it blue.', 'temperature': 0.5},
+            'transfer': {'prompt': 'Make it red.', 'top_p': 0.9}
+        }
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_build_sweep_variant_list(self):
+        sweep_variant_list = build_sweep_variant_list(self.generate_content_config, {'generate_content_config_keys': ['edit', 'transfer'], 'temperature': [0.2, 0.8]}, 'edit')
+        self.assertEqual([(x.index, x.generate_content_config_key, x.image_generator_generate_content_config.get_temperature()) for x in sweep_variant_list], [
+            (0, 'edit', 0.2), (1, 'edit', 0.8), (2, 'transfer', 0.2), (3, 'transfer', 0.8)
+        ])
+        # A parameter which is not swept keeps the value of its key.
+        self.assertEqual(sweep_variant_list[2].image_generator_generate_content_config.get_top_p(), 0.9)
+        self.assertEqual(len(build_sweep_variant_list(self.generate_content_config, {'top_p': [0.5]}, 'edit')), 1)
+        self.assertIsNone(build_sweep_variant_list(self.generate_content_config, {'generate_content_config_keys': ['missing']}, 'edit'))
+
+    def test_sweep_runs_every_variant_as_one_job(self):
+        spec = InputOutputFilePathSpecBuilderForSingleDirectory().build(self.source_dir, self.output_dir, 'run')
+        sweep_variant_list = build_sweep_variant_list(self.generate_content_config, {'generate_content_config_keys': ['edit', 'transfer'], 'candidate_count': 2}, 'edit')
+        sweep_spec = SweepInputOutputFilePathSpec(spec, sweep_variant_list)
+        self.assertEqual(sweep_spec.get_number_of_items(), 4)
+        image_generator = ImageGeneratorForSimulation()
+        input_image_cache = InputImageCache(1024 * 1024)
+        image_generator.set_input_image_cache(input_image_cache)
+        self.assertTrue(image_generator.do_generation({"seed": 1, "time_scale": 0, "image_size": [8, 8]}, ImageGeneratorGenerateContentConfig(), sweep_spec))
+        self.assertEqual(image_generator.client.models.count_calls, 4)
+        # Each input is decoded once and shared by its variants.
+        self.assertEqual((input_image_cache.count_misses, input_image_cache.count_hits), (2, 2))
+        self.assertEqual(sorted(os.listdir(self.output_dir)), sorted([
+            f's{i}-run.variant.{j}{suffix}.png' for i in range(2) for j in range(2) for suffix in ['', '.candidate.1']
+        ]))
+
+
+if __name__ == '__main__':
+    unittest.main()
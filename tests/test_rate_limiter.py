@@ -0,0 +1,77 @@
+"""
+Unit tests for the AdaptiveRateLimiter class.
+"""
+
+import threading
+import unittest
+from src.image_generator.rate_limiter import AdaptiveRateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _get_time_to_wait(self, rate_limiter, estimated_tokens=0):
+        return rate_limiter._get_time_to_wait(self.clock(), estimated_tokens)
+
+    def test_unlimited_never_waits(self):
+        rate_limiter = AdaptiveRateLimiter(clock=self.clock)
+        for _ in range(100):
+            self.assertTrue(rate_limiter.acquire(1000))
+
+    def test_requests_per_minute_budget(self):
+        rate_limiter = AdaptiveRateLimiter(requests_per_minute=6, clock=self.clock)
+        for _ in range(6):
+            self.assertTrue(rate_limiter.acquire())
+        self.assertAlmostEqual(self._get_time_to_wait(rate_limiter), 10.0)
+        self.clock.now += 10.0
+        self.assertEqual(self._get_time_to_wait(rate_limiter), 0.0)
+
+    def test_tokens_per_minute_budget_is_corrected_by_usage(self):
+        rate_limiter = AdaptiveRateLimiter(tokens_per_minute=6000, clock=self.clock)
+        self.assertTrue(rate_limiter.acquire(1000))
+        rate_limiter.on_success(estimated_tokens=1000, actual_tokens=6000)
+        self.assertAlmostEqual(self._get_time_to_wait(rate_limiter, 1000), 10.0)
+
+    def test_throttling_backs_off_and_success_recovers(self):
+        rate_limiter = AdaptiveRateLimiter(requests_per_minute=60, clock=self.clock)
+        rate_limiter.on_throttled()
+        self.assertAlmostEqual(rate_limiter.get_rate_factor(), 0.5)
+        rate_limiter.on_throttled()
+        self.assertAlmostEqual(rate_limiter.get_rate_factor(), 0.25)
+        rate_limiter.on_success()
+        self.assertAlmostEqual(rate_limiter.get_rate_factor(), 0.30)
+        for _ in range(100):
+            rate_limiter.on_success()
+        self.assertAlmostEqual(rate_limiter.get_rate_factor(), 1.0)
+
+    def test_retry_after_blocks_requests(self):
+        rate_limiter = AdaptiveRateLimiter(requests_per_minute=600, clock=self.clock)
+        rate_limiter.on_throttled(retry_after_in_seconds=30)
+        self.assertAlmostEqual(self._get_time_to_wait(rate_limiter), 30.0)
+
+    def test_throttling_without_budget_uses_measured_rate(self):
+        rate_limiter = AdaptiveRateLimiter(clock=self.clock)
+        for _ in range(12):
+            rate_limiter.acquire()
+            self.clock.now += 1.0
+        rate_limiter.on_throttled()
+        self.assertIsNotNone(rate_limiter.request_bucket)
+        self.assertEqual(rate_limiter.request_bucket.capacity, 12)
+        self.assertGreater(self._get_time_to_wait(rate_limiter), 0.0)
+
+    def test_acquire_returns_false_when_cancelled(self):
+        rate_limiter = AdaptiveRateLimiter(requests_per_minute=1, clock=self.clock)
+        self.assertTrue(rate_limiter.acquire())
+        cancel_event = threading.Event()
+        cancel_event.set()
+        self.assertFalse(rate_limiter.acquire(cancel_event=cancel_event))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Unit tests for the ResultCache class.
+"""
+
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForSingleDirectory
+from src.image_generator.result_cache import ResultCache, compute_result_cache_key
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_key_depends_on_every_part(self):
+        base = compute_result_cache_key("model", "prompt", "{}", ["a", "b"])
+        self.assertEqual(base, compute_result_cache_key("model", "prompt", "{}", ["a", "b"]))
+        self.assertNotEqual(base, compute_result_cache_key("model2", "prompt", "{}", ["a", "b"]))
+        self.assertNotEqual(base, compute_result_cache_key("model", "prompt2", "{}", ["a", "b"]))
+        self.assertNotEqual(base, compute_result_cache_key("model", "prompt", "{\"temperature\":0.5}", ["a", "b"]))
+        self.assertNotEqual(base, compute_result_cache_key("model", "prompt", "{}", ["b", "a"]))
+
+    def test_put_and_get(self):
+        cache = ResultCache(self.cache_dir, max_bytes=1000)
+        self.assertIsNone(cache.get("key"))
+        cache.put("key", [b"0" * 10, b"1" * 10])
+        blob_path_list = cache.get("key")
+        self.assertEqual(len(blob_path_list), 2)
+        with open(blob_path_list[1], mode="rb") as f:
+            self.assertEqual(f.read(), b"1" * 10)
+        self.assertEqual((cache.count_hits, cache.count_misses), (1, 1))
+        cache.close()
+
+    def test_persists_across_instances(self):
+        cache = ResultCache(self.cache_dir, max_bytes=1000)
+        cache.put("key", [b"data"])
+        cache.close()
+        cache = ResultCache(self.cache_dir, max_bytes=1000)
+        self.assertIsNotNone(cache.get("key"))
+        cache.close()
+
+    def test_evicts_least_recently_used(self):
+        cache = ResultCache(self.cache_dir, max_bytes=250)
+        cache.put("a", [b"a" * 100])
+        cache.put("b", [b"b" * 100])
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", [b"c" * 100])
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertLessEqual(cache.get_total_bytes(), 250)
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, "blobs"))), 2)
+        cache.close()
+    def test_hit_is_written_in_the_output_format_of_the_run(self):
+        source_dir = os.path.join(self.temp_dir.name, "source")
+        os.makedirs(source_dir)
+        Image.new("RGB", (8, 8), (255, 0, 0)).save(os.path.join(source_dir, "s0.png"))
+        generate_content_config = ImageGeneratorGenerateContentConfig()
+        generate_content_config.set_prompt("Make it blue.")
+        cache = ResultCache(self.cache_dir, max_bytes=1024 * 1024)
+        for (output_extension, expected_format) in [(".webp", "WEBP"), (".png", "PNG")]:
+            builder = InputOutputFilePathSpecBuilderForSingleDirectory()
+            builder.set_output_extension(output_extension)
+            spec = builder.build(source_dir, os.path.join(self.temp_dir.name, "output"), "run" + output_extension)
+            image_generator = ImageGeneratorForSimulation()
+            image_generator.set_result_cache(cache)
+            self.assertTrue(image_generator.do_generation({"seed": 1, "time_scale": 0, "image_size": [8, 8]}, generate_content_config, spec))
+            image_generator.output_image_writer.close()
+            for item in spec.iter_items():
+                with Image.open(item.output_file_path_list[0]) as image:
+                    self.assertEqual(image.format, expected_format)
+        # The second run is served by the cache and converts the cached image to PNG.
+        self.assertEqual((cache.count_hits, cache.count_misses), (1, 1))
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Unit tests for the RetryPolicy class and error classification.
+"""
+
+import random
+import unittest
+from google.genai.errors import ClientError, ServerError
+import httpx
+from src.image_generator.batch_dispatcher import BatchDispatcher
+from src.image_generator.gemini_api_error import get_retry_after_in_seconds, is_retryable_error
+from src.image_generator.generation_result import GenerationResult
+from src.image_generator.retry_policy import RetryPolicy
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_fatal_error_is_not_retried(self):
+        policy = RetryPolicy()
+        self.assertFalse(policy.should_retry(GenerationResult(False, retryable=False)))
+        self.assertFalse(policy.should_retry(GenerationResult(True)))
+
+    def test_max_attempts(self):
+        policy = RetryPolicy(max_attempts=3)
+        result = GenerationResult(False, retryable=True)
+        result.attempt_count = 2
+        self.assertTrue(policy.should_retry(result))
+        result.attempt_count = 3
+        self.assertFalse(policy.should_retry(result))
+
+    def test_retry_budget(self):
+        policy = RetryPolicy(retry_budget=2)
+        for expected in [True, True, False]:
+            self.assertEqual(policy.should_retry(GenerationResult(False, retryable=True)), expected)
+        self.assertEqual(policy.get_count_retries(), 2)
+
+    def test_delay_is_capped_and_honors_retry_after(self):
+        policy = RetryPolicy(base_delay_in_seconds=1, max_delay_in_seconds=8, random_generator=random.Random(0))
+        result = GenerationResult(False, retryable=True)
+        for attempt_count in range(1, 10):
+            result.attempt_count = attempt_count
+            delay = policy.get_delay_in_seconds(result)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(8, 2 ** (attempt_count - 1)))
+        result.retry_after_in_seconds = 30
+        self.assertEqual(policy.get_delay_in_seconds(result), 30)
+
+    def test_dispatcher_requeues_and_keeps_attempt_count(self):
+        attempts = {}
+        def func(x):
+            attempts[x] = attempts.get(x, 0) + 1
+            if x == 0 and attempts[x] < 3:
+                return GenerationResult(False, retryable=True, error="transient")
+            if x == 1:
+                return GenerationResult(False, retryable=False, error="fatal")
+            return GenerationResult(True)
+        dispatcher = BatchDispatcher(max_in_flight=2)
+        policy = RetryPolicy(base_delay_in_seconds=0.001, max_delay_in_seconds=0.01)
+        progress = dispatcher.run(range(4), func, 4, policy)
+        self.assertEqual(attempts, {0: 3, 1: 1, 2: 1, 3: 1})
+        self.assertEqual(progress.count, 4)
+        self.assertEqual(progress.count_success, 3)
+        self.assertEqual(progress.count_failure, 1)
+        self.assertEqual(progress.count_retries, 2)
+
+class TestErrorClassification(unittest.TestCase):
+    def test_classification(self):
+        self.assertTrue(is_retryable_error(ServerError(503, {"error": {"status": "UNAVAILABLE"}})))
+        self.assertTrue(is_retryable_error(ClientError(429, {"error": {"status": "RESOURCE_EXHAUSTED"}})))
+        self.assertTrue(is_retryable_error(httpx.ReadTimeout("timeout")))
+        self.assertFalse(is_retryable_error(ClientError(400, {"error": {"status": "INVALID_ARGUMENT"}})))
+        self.assertFalse(is_retryable_error(ClientError(403, {"error": {"status": "PERMISSION_DENIED"}})))
+        self.assertFalse(is_retryable_error(ValueError("bad")))
+
+    def test_retry_after_from_retry_info(self):
+        e = ClientError(429, {"error": {"status": "RESOURCE_EXHAUSTED", "details": [
+            {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "23s"}
+        ]}})
+        self.assertEqual(get_retry_after_in_seconds(e), 23.0)
+        self.assertIsNone(get_retry_after_in_seconds(ClientError(429, {"error": {}})))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Unit tests for the RunJournal class.
+"""
+
+import os
+import tempfile
+import unittest
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories
+from src.image_generator.run_journal import RunJournal, RunJournalEnum
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_record_and_load(self):
+        journal = RunJournal(self.temp_dir.name, "run-1")
+        self.assertFalse(journal.exists())
+        journal.open({"total": 3})
+        journal.record_in_flight("a")
+        journal.record_done("a", ["a.png"], 1)
+        journal.record_in_flight("b")
+        journal.record_failed("b", "Gemini server error", 2)
+        journal.record_in_flight("c")
+        journal.close()
+
+        loaded = RunJournal(self.temp_dir.name, "run-1")
+        header = loaded.load()
+        self.assertEqual(header["run_id"], "run-1")
+        self.assertEqual(header["total"], 3)
+        self.assertTrue(loaded.is_done("a"))
+        self.assertEqual(loaded.get_state("b"), RunJournalEnum.const_state_failed)
+        self.assertEqual(loaded.get_state("c"), RunJournalEnum.const_state_in_flight)
+        self.assertEqual(loaded.get_state("d"), RunJournalEnum.const_state_pending)
+
+    def test_truncated_last_line_is_ignored(self):
+        journal = RunJournal(self.temp_dir.name, "run-2")
+        journal.open({})
+        journal.record_done("a", ["a.png"], 1)
+        journal.close()
+        with open(journal.journal_path, encoding="utf-8", mode="a") as f:
+            f.write('{"item": "b", "sta')
+        loaded = RunJournal(self.temp_dir.name, "run-2")
+        self.assertIsNotNone(loaded.load())
+        self.assertTrue(loaded.is_done("a"))
+        self.assertFalse(loaded.is_done("b"))
+
+    def test_missing_journal(self):
+        self.assertIsNone(RunJournal(self.temp_dir.name, "missing").load())
+
+    def test_output_file_names_are_deterministic_per_run(self):
+        source_dir = os.path.join(self.temp_dir.name, "source")
+        reference_dir = os.path.join(self.temp_dir.name, "reference")
+        os.makedirs(source_dir)
+        os.makedirs(reference_dir)
+        for file_path in [os.path.join(source_dir, "s.png"), os.path.join(reference_dir, "r.jpg")]:
+            with open(file_path, mode="wb"):
+                pass
+        builder = InputOutputFilePathSpecBuilderForPairOfDirectories()
+        first = builder.build(source_dir, reference_dir, "out", "20250101-000000")
+        second = builder.build(source_dir, reference_dir, "out", "20250101-000000")
+        self.assertEqual(first.get_item_list(), second.get_item_list())
+        self.assertEqual(first.get_item_list()[0]['output_file_path_list'], [
+            os.path.join("out", "r-transferred-to-s-20250101-000000.png"),
+            os.path.join("out", "s-transferred-from-r-20250101-000000.png")
+        ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Tests of the run planner.
+"""
+
+import os
+import tempfile
+import unittest
+from PIL import Image
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_image_preprocessor import InputImagePreprocessor
+from src.image_generator.input_output_file_path_spec_builder import InputOutputFilePathSpecBuilderForPairOfDirectories
+from src.image_generator.rate_limiter import estimate_number_of_tokens
+from src.image_generator.result_cache import ResultCache
+from src.image_generator.run_planner import RunPlanner
+from src.image_generator.simulation_enum import SimulationEnum
+
+class TestRunPlanner(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, 'source')
+        self.reference_dir = os.path.join(self.temp_dir.name, 'reference')
+        self.output_dir = os.path.join(self.temp_dir.name, 'output')
+        for dir_path in [self.source_dir, self.reference_dir, self.output_dir]:
+            os.makedirs(dir_path)
+        for i in range(3):
+            Image.new('RGB', (2000, 1000), (i + 1, 0, 0)).save(os.path.join(self.source_dir, f's{i}.png'))
+        for i in range(2):
+            Image.new('RGB', (300, 200), (0, i, 0)).save(os.path.join(self.reference_dir, f'r{i}.png'))
+        self.generate_content_config = ImageGeneratorGenerateContentConfig()
+        self.generate_content_config.set_prompt("Make it blue.")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _build_spec(self, date_and_time_part: str):
+        return InputOutputFilePathSpecBuilderForPairOfDirectories().build(self.source_dir, self.reference_dir, self.output_dir, date_and_time_part)
+
+    def test_plan(self):
+        run_planner = RunPlanner(SimulationEnum.const_model_name, 10.0, max_in_flight=2)
+        run_planner.set_input_image_preprocessor(InputImagePreprocessor(max_long_edge=1000))
+        run_plan = run_planner.plan(self._build_spec('run'), self.generate_content_config)
+        self.assertEqual((run_plan.number_of_items, run_plan.number_of_calls, run_plan.number_of_cache_hits, run_plan.number_of_input_files), (6, 6, 0, 5))
+        # The sources are planned at their size after preprocessing, 1000 x 500.
+        self.assertEqual(run_plan.input_tokens, 6 * estimate_number_of_tokens("Make it blue.", [(1000, 500), (300, 200)], 0))
+        self.assertEqual(run_plan.total_tokens, run_plan.input_tokens + 6 * 1290)
+        self.assertEqual(run_plan.wall_time_in_seconds, 30.0)
+        # Each input counts once per call, or once per distinct file with an upload cache.
+        bytes_per_call = run_plan.upload_bytes // 6
+        run_planner = RunPlanner(SimulationEnum.const_model_name, 10.0, max_in_flight=2, requests_per_minute=3)
+        run_planner.set_input_image_preprocessor(InputImagePreprocessor(max_long_edge=1000))
+        run_planner.set_upload_once(True)
+        run_plan = run_planner.plan(self._build_spec('run'), self.generate_content_config)
+        self.assertLess(run_plan.upload_bytes, 3 * bytes_per_call)
+        # 3 calls go through at once and the other 3 at 3 per minute.
+        self.assertEqual(run_plan.wall_time_in_seconds, 60.0)
+
+    def test_results_of_a_previous_run_are_expected_cache_hits(self):
+        result_cache = ResultCache(os.path.join(self.temp_dir.name, 'cache'), 1024 * 1024 * 1024)
+        image_generator = ImageGeneratorForSimulation()
+        image_generator.set_input_image_preprocessor(InputImagePreprocessor())
+        image_generator.set_result_cache(result_cache)
+        self.assertTrue(image_generator.do_generation({"seed": 1, "time_scale": 0, "image_size": [8, 8]}, self.generate_content_config, self._build_spec('run1')))
+        image_generator.output_image_writer.close()
+        # Each of the 5 input files is hashed once for the source keys of the 6 requests.
+        self.assertEqual(len(image_generator.file_digest_by_stat), 5)
+
+        run_planner = RunPlanner(SimulationEnum.const_model_name, 10.0)
+        run_planner.set_input_image_preprocessor(InputImagePreprocessor())
+        run_planner.set_result_cache(result_cache)
+        run_plan = run_planner.plan(self._build_spec('run2'), self.generate_content_config)
+        self.assertEqual((run_plan.number_of_cache_hits, run_plan.number_of_calls, run_plan.wall_time_in_seconds), (6, 0, 0.0))
+        # Another preprocessing or prompt makes other requests.
+        run_planner = RunPlanner(SimulationEnum.const_model_name, 10.0)
+        run_planner.set_input_image_preprocessor(InputImagePreprocessor(max_long_edge=512))
+        run_planner.set_result_cache(result_cache)
+        self.assertEqual(run_planner.plan(self._build_spec('run2'), self.generate_content_config).number_of_cache_hits, 0)
+        result_cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Tests of the source directory watcher and the watch-folder daemon.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from PIL import Image
+from src.image_generator.image_generator_for_simulation import ImageGeneratorForSimulation
+from src.image_generator.image_generator_generate_content_config import ImageGeneratorGenerateContentConfig
+from src.image_generator.input_file_index import is_input_image_file_name
+from src.image_generator.source_directory_watcher import SourceDirectoryWatcher
+from src.image_generator.watch_folder_daemon import WatchFolderDaemon
+
+class TestSourceDirectoryWatcher(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, "source")
+        os.makedirs(self.source_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _check_new_file_is_reported(self, use_inotify: bool):
+        with open(os.path.join(self.source_dir, "existing.png"), "wb") as f:
+            f.write(b"existing")
+        watcher = SourceDirectoryWatcher([self.source_dir], is_input_image_file_name, poll_interval_in_seconds=0.05, stable_for_in_seconds=0.1, use_inotify=use_inotify, include_existing=False)
+        watcher.start()
+        try:
+            self.assertEqual(watcher.wait_for_new_files(0.3), [])
+            with open(os.path.join(self.source_dir, "new.png"), "wb") as f:
+                f.write(b"new")
+            with open(os.path.join(self.source_dir, "notes.txt"), "wb") as f:
+                f.write(b"ignored")
+            self.assertEqual(watcher.wait_for_new_files(5.0), [(self.source_dir, "new.png")])
+            # Each file is reported once.
+            self.assertEqual(watcher.wait_for_new_files(0.3), [])
+        finally:
+            watcher.close()
+
+    def test_polling(self):
+        self._check_new_file_is_reported(use_inotify=False)
+
+    def test_inotify(self):
+        self._check_new_file_is_reported(use_inotify=True)
+
+    def test_growing_file_is_not_reported_until_stable(self):
+        watcher = SourceDirectoryWatcher([self.source_dir], is_input_image_file_name, poll_interval_in_seconds=0.05, stable_for_in_seconds=0.5, use_inotify=False)
+        watcher.start()
+        file_path = os.path.join(self.source_dir, "copying.png")
+        with open(file_path, "wb") as f:
+            for _ in range(6):
+                f.write(b"x" * 1024)
+                f.flush()
+                self.assertEqual(watcher.wait_for_new_files(0.1), [])
+        self.assertEqual(watcher.wait_for_new_files(5.0), [(self.source_dir, "copying.png")])
+
+
+class TestWatchFolderDaemon(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, "source")
+        self.reference_dir = os.path.join(self.temp_dir.name, "reference")
+        self.output_dir = os.path.join(self.temp_dir.name, "output")
+        for dir_path in [self.source_dir, self.reference_dir, self.output_dir]:
+            os.makedirs(dir_path)
+        self.generate_content_config = ImageGeneratorGenerateContentConfig()
+        self.generate_content_config.set_prompt("Make it blue.")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_new_pairs_only(self):
+        daemon = WatchFolderDaemon(None, self.generate_content_config, None, self.source_dir, self.output_dir, "run", self.reference_dir)
+        spec = daemon.build_input_output_file_path_spec([(self.source_dir, "a.png"), (self.reference_dir, "x.png")])
+        self.assertEqual(spec.get_number_of_items(), 1)
+        spec = daemon.build_input_output_file_path_spec([(self.source_dir, "b.png")])
+        self.assertEqual([list(item.input_file_path_list) for item in spec.iter_items()], [[os.path.join(self.source_dir, "b.png"), os.path.join(self.reference_dir, "x.png")]])
+        spec = daemon.build_input_output_file_path_spec([(self.reference_dir, "y.png")])
+        self.assertEqual(sorted(item.input_file_path_list[0] for item in spec.iter_items()), [os.path.join(self.source_dir, "a.png"), os.path.join(self.source_dir, "b.png")])
+
+    def test_generate_for_files_as_they_arrive(self):
+        image_generator = ImageGeneratorForSimulation()
+        self.assertTrue(image_generator.initialize({"seed": 1, "time_scale": 0, "image_size": [8, 8]}))
+        watcher = SourceDirectoryWatcher([self.source_dir], is_input_image_file_name, poll_interval_in_seconds=0.05, stable_for_in_seconds=0.1, use_inotify=False)
+        daemon = WatchFolderDaemon(image_generator, self.generate_content_config, watcher, self.source_dir, self.output_dir, "run")
+        Image.new("RGB", (16, 16)).save(os.path.join(self.source_dir, "first.png"))
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            self._wait_for_file(os.path.join(self.output_dir, "first-run.png"))
+            Image.new("RGB", (16, 16)).save(os.path.join(self.source_dir, "second.png"))
+            self._wait_for_file(os.path.join(self.output_dir, "second-run.png"))
+        finally:
+            daemon.stop()
+            thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(daemon.count_items, 2)
+
+    def test_cancel_between_batches_cancels_the_next_batch(self):
+        image_generator = ImageGeneratorForSimulation()
+        self.assertTrue(image_generator.initialize({"seed": 1, "time_scale": 0, "image_size": [8, 8]}))
+        Image.new("RGB", (16, 16)).save(os.path.join(self.source_dir, "first.png"))
+        daemon = WatchFolderDaemon(image_generator, self.generate_content_config, None, self.source_dir, self.output_dir, "run")
+        spec = daemon.build_input_output_file_path_spec([(self.source_dir, "first.png")])
+        image_generator.cancel()
+        image_generator.generate_one_batch_of_images(spec, self.generate_content_config)
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "first-run.png")))
+        # The cancel is used up by the batch which it cancelled.
+        image_generator.generate_one_batch_of_images(spec, self.generate_content_config)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "first-run.png")))
+
+    def _wait_for_file(self, file_path: str):
+        deadline = time.monotonic() + 10
+        while not os.path.exists(file_path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(os.path.exists(file_path), file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()